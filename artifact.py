@@ -0,0 +1,250 @@
+"""
+单文件模型工件（.lstm）
+
+一个文件包含权重、标准化参数、模型配置与校验和，替代
+best_lstm_model.pth + scaler_features.pkl + scaler_target.pkl 三个文件。
+
+文件布局：
+    8 字节魔数 b'LSTMART1'
+    8 字节小端整数：头部 JSON 长度
+    头部 JSON：格式版本、模型配置、元数据、各数组的 dtype / 形状 / 偏移、数据段 sha256
+    数据段：各数组的原始字节，按 64 字节对齐
+
+- 加载时不经过 pickle，也不导入 sklearn：头部是 JSON，数组直接从内存映射的数据段构造
+- 权重以写时复制方式映射，多个进程共享同一份文件页
+- 数据段带 sha256，传输损坏或被篡改的文件在加载时即被拒绝
+- 元数据 sources 记录生成时同目录三文件的 sha256；三文件之后被替换（如重新训练只更新了 .pth），
+  stale_sources() 能发现工件已过期，注册表据此改用三文件而不是静默加载旧权重
+
+用法：
+    python artifact.py                      # 把 product 目录的三个文件转换为 ./product/model.lstm
+    python artifact.py --check              # 转换后校验预测一致性并对比冷启动耗时
+"""
+import argparse
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+import torch
+
+from model_definition import Net
+
+MAGIC = b'LSTMART1'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+ARTIFACT_SUFFIX = '.lstm'
+ARTIFACT_PATH = './product/model.lstm'
+SCALER_KEYS = ('scaler.feature_mean', 'scaler.feature_scale', 'scaler.target_mean', 'scaler.target_scale')
+# 与工件等价的旧三文件格式
+SOURCE_FILES = ('best_lstm_model.pth', 'scaler_features.pkl', 'scaler_target.pkl')
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_digests(directory):
+    """目录中已存在的三文件的 sha256"""
+    return {name: file_sha256(os.path.join(directory, name)) for name in SOURCE_FILES
+            if os.path.exists(os.path.join(directory, name))}
+
+
+def stale_sources(path):
+    """
+    与工件同目录、但内容与工件生成时不同（或生成时未记录）的三文件
+
+    返回空列表表示工件与同目录的三文件一致，或目录中没有三文件
+    """
+    recorded = read_header(path)[0]["metadata"].get("sources", {})
+    current = source_digests(os.path.dirname(path) or '.')
+    return [name for name, digest in current.items() if recorded.get(name) != digest]
+
+
+class ArrayScaler:
+    """只保存 mean_ / scale_ 的标准化器，接口与推理中用到的 StandardScaler 部分一致"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = np.asarray(mean, dtype=np.float64)
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+
+    @staticmethod
+    def _copy(x):
+        # 与 StandardScaler 一致：float32 输入保持 float32，其余转换为 float64
+        x = np.asarray(x)
+        return np.array(x, dtype=x.dtype if x.dtype in (np.float32, np.float64) else np.float64)
+
+    def transform(self, x):
+        x = self._copy(x)
+        x -= self.mean_
+        x /= self.scale_
+        return x
+
+    def inverse_transform(self, x):
+        x = self._copy(x)
+        x *= self.scale_
+        x += self.mean_
+        return x
+
+
+def save_model_artifact(path, state_dict, scaler_features, scaler_target, config, metadata=None):
+    """写入单文件工件；先写临时文件再原子替换，服务进程不会读到半写入的文件"""
+    arrays = {name: tensor.detach().cpu().contiguous().numpy() for name, tensor in state_dict.items()}
+    for key, value in zip(SCALER_KEYS, (scaler_features.mean_, scaler_features.scale_,
+                                        scaler_target.mean_, scaler_target.scale_)):
+        arrays[key] = np.ascontiguousarray(value, dtype=np.float64)
+
+    entries, offset, digest = {}, 0, hashlib.sha256()
+    for name, array in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        entries[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+    data = bytearray(offset)
+    for name, array in arrays.items():
+        start = entries[name]["offset"]
+        data[start:start + array.nbytes] = array.tobytes()
+    digest.update(data)
+
+    header = json.dumps({
+        "format_version": FORMAT_VERSION,
+        "config": config,
+        "metadata": metadata or {},
+        "arrays": entries,
+        "data_bytes": len(data),
+        "sha256": digest.hexdigest(),
+    }, ensure_ascii=False).encode('utf-8')
+    # 头部补齐到对齐边界，数据段起点对齐
+    header += b' ' * (-(len(MAGIC) + 8 + len(header)) % ALIGNMENT)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_header(path):
+    """读取工件头部，返回 (头部字典, 数据段起始偏移)"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"不是模型工件文件: {path}")
+        (length,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length).decode('utf-8'))
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"不支持的工件格式版本: {header.get('format_version')}")
+    return header, len(MAGIC) + 8 + length
+
+
+def load_model_artifact(path, device='cpu', verify=True, mmap=True):
+    """
+    加载工件；mmap=True 时以内存映射方式加载，否则把数据段读入进程私有内存
+
+    Returns:
+        (Net, ArrayScaler 特征, ArrayScaler 目标, 模型配置, 元数据)
+    Raises:
+        ValueError: 文件格式错误或校验和不一致
+    """
+    header, data_offset = read_header(path)
+    if mmap:
+        # 写时复制映射：张量可写（torch 要求），但修改不会写回文件，未修改的页在进程间共享
+        data = np.memmap(path, dtype=np.uint8, mode='c', offset=data_offset, shape=(header["data_bytes"],))
+    else:
+        data = np.fromfile(path, dtype=np.uint8, count=header["data_bytes"], offset=data_offset)
+    if verify and hashlib.sha256(data).hexdigest() != header["sha256"]:
+        raise ValueError(f"工件校验和不一致，文件可能已损坏: {path}")
+
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        start = entry["offset"]
+        arrays[name] = data[start:start + count * dtype.itemsize].view(dtype).reshape(entry["shape"])
+
+    config = header["config"]
+    model = Net(input_size=config["input_size"], hidden_size=config["hidden_size"],
+                num_layers=config["num_layers"], dropout=config["dropout"])
+    state_dict = {name: torch.from_numpy(array) for name, array in arrays.items() if name not in SCALER_KEYS}
+    model.load_state_dict(state_dict, assign=True)
+    model.to(device)
+    model.eval()
+
+    feature_mean, feature_scale, target_mean, target_scale = (np.array(arrays[key]) for key in SCALER_KEYS)
+    return (model, ArrayScaler(feature_mean, feature_scale), ArrayScaler(target_mean, target_scale),
+            config, header["metadata"])
+
+
+def convert_product(output=ARTIFACT_PATH, product_dir='./product', config=None):
+    """把旧的三文件格式转换为单文件工件（转换时需要 sklearn / joblib）"""
+    import joblib
+    from model_registry import DEFAULT_MODEL_CONFIG
+
+    config = {**DEFAULT_MODEL_CONFIG, **(config or {})}
+    state_dict = torch.load(os.path.join(product_dir, 'best_lstm_model.pth'), map_location='cpu', weights_only=True)
+    scaler_features = joblib.load(os.path.join(product_dir, 'scaler_features.pkl'))
+    scaler_target = joblib.load(os.path.join(product_dir, 'scaler_target.pkl'))
+    return save_model_artifact(output, state_dict, scaler_features, scaler_target, config,
+                               {"converted_from": "best_lstm_model.pth + scaler_*.pkl",
+                                "sources": source_digests(product_dir)})
+
+
+def cold_start_ms(code, repeat=3):
+    """在新的子进程中执行 code 并返回其打印的耗时（毫秒）的中位数"""
+    import subprocess
+    import sys
+
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-W", "ignore", "-c", code],
+                                capture_output=True, text=True, check=True).stdout.split()
+        samples.append(float(output[-1]))
+    return float(np.median(samples))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成单文件模型工件")
+    parser.add_argument('--output', default=ARTIFACT_PATH)
+    parser.add_argument('--product-dir', default='./product')
+    parser.add_argument('--check', action='store_true', help='校验预测一致性并对比冷启动耗时')
+    args = parser.parse_args()
+
+    convert_product(args.output, args.product_dir)
+    print(f"已写入 {args.output}（{os.path.getsize(args.output)} 字节）")
+
+    if args.check:
+        import sys
+        from data_utils import load_observations, make_windows
+        from inference import predict_array
+        from model_registry import load_model
+        import joblib
+
+        _, features = load_observations()
+        windows, _ = make_windows(features)
+        expected = predict_array(load_model(os.path.join(args.product_dir, 'best_lstm_model.pth')),
+                                 joblib.load(os.path.join(args.product_dir, 'scaler_features.pkl')),
+                                 joblib.load(os.path.join(args.product_dir, 'scaler_target.pkl')), windows)
+        model, scaler_features, scaler_target, _, _ = load_model_artifact(args.output)
+        actual = predict_array(model, scaler_features, scaler_target, windows)
+        max_error = float(np.max(np.abs(actual - expected)))
+        print(f"一致性校验: {len(windows)} 个窗口, 最大误差 {max_error:.2e} 米")
+
+        legacy = cold_start_ms(
+            "import time; t0 = time.perf_counter(); import joblib, torch; from model_registry import load_model;"
+            f"load_model('{args.product_dir}/best_lstm_model.pth');"
+            f"joblib.load('{args.product_dir}/scaler_features.pkl'); joblib.load('{args.product_dir}/scaler_target.pkl');"
+            "print((time.perf_counter() - t0) * 1000)"
+        )
+        single = cold_start_ms(
+            "import time; t0 = time.perf_counter(); from artifact import load_model_artifact;"
+            f"load_model_artifact('{args.output}'); print((time.perf_counter() - t0) * 1000)"
+        )
+        print(f"冷启动（导入 + 加载）: 三文件 {legacy:.0f}ms，单文件 {single:.0f}ms")
+        # 水位约 100 米时 float32 的最小间隔约 7.6e-6 米，容差取 1e-4
+        sys.exit(0 if max_error <= 1e-4 else 1)
@@ -0,0 +1,168 @@
+"""
+回测：对历史 CSV 或站点存储中每一个滑动 3 天窗口做预测并统计误差
+
+- 分块流式读取 CSV（或站点存储的内存映射切片），块与块之间保留最后 3 天，内存占用与文件长度无关
+- 每块用跨步视图一次构造全部窗口，按 batch 送入模型
+- 按时段（年 / 月 / 日）统计 MAE、RMSE 与最大误差
+
+用法：
+    python backtest.py                                   # 回测自带数据集，按月统计
+    python backtest.py --csv archive.csv --period year --engine onnx --output backtest.json
+    python backtest.py --station 阳朔                     # 回测站点存储中的序列
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from data_utils import DATASET_PATH, iter_observation_chunks, make_windows
+from inference import WINDOW_DAYS
+from timeseries_store import parse_timestamps
+
+
+class PeriodMetrics:
+    """按时段累积误差统计，只保存各时段的累加量"""
+
+    def __init__(self):
+        self.count = {}
+        self.sum_abs = {}
+        self.sum_sq = {}
+        self.peak = {}  # 时段 -> (最大绝对误差, 对应目标日期)
+
+    def update(self, periods, errors, dates):
+        abs_errors = np.abs(errors)
+        unique, inverse = np.unique(periods, return_inverse=True)
+        counts = np.bincount(inverse)
+        sum_abs = np.bincount(inverse, weights=abs_errors)
+        sum_sq = np.bincount(inverse, weights=errors ** 2)
+        peak = np.full(len(unique), -1.0)
+        np.maximum.at(peak, inverse, abs_errors)
+
+        for k, period in enumerate(unique.tolist()):
+            self.count[period] = self.count.get(period, 0) + int(counts[k])
+            self.sum_abs[period] = self.sum_abs.get(period, 0.0) + float(sum_abs[k])
+            self.sum_sq[period] = self.sum_sq.get(period, 0.0) + float(sum_sq[k])
+            if peak[k] > self.peak.get(period, (-1.0, None))[0]:
+                index = np.flatnonzero((inverse == k) & (abs_errors == peak[k]))[0]
+                self.peak[period] = (float(peak[k]), str(dates[index]))
+
+    def summary(self):
+        rows = []
+        for period in sorted(self.count):
+            n = self.count[period]
+            rows.append({
+                "period": period,
+                "count": n,
+                "mae": self.sum_abs[period] / n,
+                "rmse": (self.sum_sq[period] / n) ** 0.5,
+                "peak_error": self.peak[period][0],
+                "peak_date": self.peak[period][1],
+            })
+        total = sum(self.count.values())
+        overall = {
+            "count": total,
+            "mae": sum(self.sum_abs.values()) / total if total else float("nan"),
+            "rmse": (sum(self.sum_sq.values()) / total) ** 0.5 if total else float("nan"),
+            "peak_error": max((p[0] for p in self.peak.values()), default=float("nan")),
+        }
+        return rows, overall
+
+
+def period_ids(dates, period):
+    """日期转时段编号：字符串先用 parse_timestamps 批量解析，再与 datetime64 数组一样向量化计算"""
+    if not (isinstance(dates, np.ndarray) and np.issubdtype(dates.dtype, np.datetime64)):
+        timestamps, valid = parse_timestamps(dates)
+        if not valid.all():
+            raise ValueError(f"无法解析的日期: {np.asarray(dates)[~valid][0]}")
+        dates = timestamps.astype('datetime64[s]')
+    days = dates.astype('datetime64[D]')
+    years = days.astype('datetime64[Y]').astype(np.int64) + 1970
+    if period == 'year':
+        return years
+    months = days.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    if period == 'month':
+        return years * 100 + months
+    day_of_month = (days - days.astype('datetime64[M]')).astype(np.int64) + 1
+    return years * 10000 + months * 100 + day_of_month
+
+
+def backtest_chunks(predict_fn, chunks, period='month', batch_size=4096):
+    """
+    对按时间顺序分块的观测做流式回测
+
+    Args:
+        predict_fn: 接收 (N, 3, 5) 原始特征、返回长度 N 水位数组的函数
+        chunks: 产出 (日期, 特征 (n, 5)) 的迭代器；日期为字符串列表或 datetime64 数组
+        period: 统计时段，year / month / day
+
+    Returns:
+        (各时段统计列表, 总体统计)
+    """
+    metrics = PeriodMetrics()
+    carry_dates, carry_features = None, None
+    for dates, features in chunks:
+        dates = np.asarray(dates)
+        if carry_features is not None:
+            features = np.concatenate([carry_features, features])
+            dates = np.concatenate([carry_dates, dates])
+        if len(features) > WINDOW_DAYS:
+            windows, targets = make_windows(features)
+            predictions = np.empty(len(windows))
+            for start in range(0, len(windows), batch_size):
+                batch = np.ascontiguousarray(windows[start:start + batch_size])
+                predictions[start:start + batch_size] = predict_fn(batch)
+            target_dates = dates[WINDOW_DAYS:]
+            metrics.update(period_ids(target_dates, period), predictions - targets, target_dates)
+        # 保留最后 3 天，与下一块拼接出跨块的窗口
+        carry_dates, carry_features = dates[-WINDOW_DAYS:], features[-WINDOW_DAYS:]
+    return metrics.summary()
+
+
+def backtest(predict_fn, path=DATASET_PATH, period='month', chunk_rows=100_000, batch_size=4096):
+    """流式回测 CSV 档案，参数与返回值同 backtest_chunks"""
+    return backtest_chunks(predict_fn, iter_observation_chunks(path, chunk_rows), period, batch_size)
+
+
+def store_chunks(series, chunk_rows=100_000):
+    """把站点存储中的序列转换为 backtest_chunks 所需的分块（特征为零拷贝切片）"""
+    for timestamps, features in series.iter_chunks(chunk_rows):
+        yield timestamps.astype('datetime64[s]'), features
+
+
+if __name__ == "__main__":
+    from model_registry import create_default_registry
+    from engines import ENGINES
+
+    parser = argparse.ArgumentParser(description="在历史数据上回测水位预测模型")
+    parser.add_argument('--csv', default=DATASET_PATH, help='观测数据 CSV')
+    parser.add_argument('--station', default=None, help='改为回测站点存储中该站点的序列')
+    parser.add_argument('--store', default=None, help='站点存储目录，默认 timeseries_store.DEFAULT_STORE_DIR')
+    parser.add_argument('--period', default='month', choices=['year', 'month', 'day'])
+    parser.add_argument('--engine', default='eager', choices=list(ENGINES))
+    parser.add_argument('--chunk-rows', type=int, default=100_000, help='每次读入的行数')
+    parser.add_argument('--batch-size', type=int, default=4096, help='每次前向的窗口数')
+    parser.add_argument('--output', default=None, help='结果 JSON 路径')
+    args = parser.parse_args()
+
+    version = create_default_registry(engine_name=args.engine).get()
+    start = time.perf_counter()
+    if args.station:
+        from timeseries_store import TimeSeriesStore, DEFAULT_STORE_DIR
+        series = TimeSeriesStore(args.store or DEFAULT_STORE_DIR).series(args.station)
+        rows, overall = backtest_chunks(version.predict, store_chunks(series, args.chunk_rows),
+                                        args.period, args.batch_size)
+    else:
+        rows, overall = backtest(version.predict, args.csv, args.period, args.chunk_rows, args.batch_size)
+    elapsed = time.perf_counter() - start
+
+    print(f"{'时段':<10}{'样本数':>8}{'MAE(米)':>10}{'RMSE(米)':>10}{'最大误差(米)':>14}  最大误差日期")
+    for r in rows:
+        print(f"{r['period']:<10}{r['count']:>8}{r['mae']:>10.4f}{r['rmse']:>10.4f}{r['peak_error']:>14.4f}  {r['peak_date']}")
+    print(f"{'总计':<10}{overall['count']:>8}{overall['mae']:>10.4f}{overall['rmse']:>10.4f}{overall['peak_error']:>14.4f}")
+    print(f"耗时 {elapsed:.3f} 秒，{overall['count'] / elapsed:.0f} 窗口/秒")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"periods": rows, "overall": overall, "engine": args.engine,
+                       "seconds": elapsed}, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,92 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    动态微批调度器
+
+    并发到达的单条预测请求先进入队列，由后台线程合并成一批，
+    调用一次 batch_fn 完成预测后再把结果分发回各个调用方。
+    当一批达到 max_batch_size 或等待超过 max_wait_ms 时立即执行。
+
+    batch_fn 接收窗口列表，返回 (predictions, errors)，与 inference.predict_windows 一致。
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=2.0):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, window):
+        """提交一个窗口，返回 Future，结果为预测值；窗口非法时 Future 抛出 ValueError"""
+        if self._stopped.is_set():
+            raise RuntimeError("微批调度器已停止")
+        future = Future()
+        self._queue.put((window, future))
+        return future
+
+    def predict(self, window, timeout=None):
+        """同步提交并等待结果"""
+        return self.submit(window).result(timeout=timeout)
+
+    def stop(self):
+        self._stopped.set()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        # 阻塞等待第一条请求，随后在等待窗口内尽量凑满一批
+        item = self._queue.get()
+        if item is None:
+            return []
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            # 调用方已取消的请求不再参与计算
+            batch = [(w, f) for w, f in batch if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                predictions, errors = self.batch_fn([w for w, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for i, (_, future) in enumerate(batch):
+                if i in errors:
+                    future.set_exception(ValueError(errors[i]))
+                else:
+                    future.set_result(float(predictions[i]))
+        # 停止后仍在队列中的请求直接失败，避免调用方无限等待
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("微批调度器已停止"))
@@ -0,0 +1,234 @@
+"""
+推理性能基准测试
+
+离线使用仓库自带的数据集与模型，测量：
+- 单次调用延迟（eval.predict 与 /predict 处理函数）的 p50 / p95 / p99
+- 不同 batch 大小下的吞吐量
+- 各阶段耗时：校验、标准化、构建张量、前向、反标准化
+- 导入与启动耗时（子进程中测量）
+- 峰值 RSS
+
+结果写入 JSON，便于在不同提交之间对比。
+
+用法：
+    python benchmark.py                                  # 结果写入 benchmark_results.json
+    python benchmark.py --output new.json --compare old.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+# 基准测试关闭预测缓存与微批，测量的是真实推理路径
+os.environ["PREDICT_CACHE_SIZE"] = "0"
+os.environ["PREDICT_MICRO_BATCH"] = "0"
+
+import numpy as np
+import torch
+
+from data_utils import load_observations, make_windows
+from inference import run_windows, validate_window, WINDOW_DAYS, NUM_FEATURES
+
+DEFAULT_BATCH_SIZES = (1, 8, 32, 128, 512, 2048)
+
+
+def percentiles(samples_ms):
+    samples = np.asarray(samples_ms)
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(samples.mean()),
+        "samples": int(samples.size),
+    }
+
+
+def time_calls(fn, args_list, warmup=20):
+    """逐个调用 fn，返回每次调用的耗时（毫秒）"""
+    for args in args_list[:warmup]:
+        fn(*args)
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def bench_single_call(windows, iterations):
+    import eval as eval_module
+    import main
+
+    inputs = [(windows[i % len(windows)].tolist(),) for i in range(iterations)]
+    results = {"eval.predict": percentiles(time_calls(eval_module.predict, inputs))}
+
+    requests = [(main.PredictionRequest(features=features),) for (features,) in inputs]
+    results["main.predict"] = percentiles(time_calls(main.predict, requests))
+    return results
+
+
+def bench_throughput(windows, batch_sizes, min_seconds):
+    """不同 batch 大小下的吞吐量（窗口/秒），使用服务端的当前模型版本"""
+    import main
+
+    results = []
+    for batch_size in batch_sizes:
+        index = np.arange(batch_size) % len(windows)
+        batch = windows[index].tolist()
+        run_windows(main.active_predict, batch)
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            run_windows(main.active_predict, batch)
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_seconds:
+                break
+        results.append({
+            "batch_size": batch_size,
+            "latency_ms": elapsed / calls * 1000,
+            "windows_per_sec": batch_size * calls / elapsed,
+        })
+    return results
+
+
+def bench_stages(windows, iterations, batch_size=1):
+    """拆分 eager 推理路径，分别统计各阶段耗时"""
+    import main
+
+    version = main.registry.get()
+    model, scaler_features, scaler_target = version.model, version.scaler_features, version.scaler_target
+    stages = {name: [] for name in ("validation", "scaling", "tensor_build", "forward", "inverse_transform")}
+
+    for i in range(iterations):
+        index = (np.arange(batch_size) + i) % len(windows)
+        batch = windows[index].tolist()
+
+        t0 = time.perf_counter()
+        for window in batch:
+            validate_window(window)
+        features_array = np.array(batch, dtype=np.float64)
+        t1 = time.perf_counter()
+        features_scaled = scaler_features.transform(features_array.reshape(-1, NUM_FEATURES))
+        t2 = time.perf_counter()
+        input_tensor = torch.tensor(
+            features_scaled.reshape(-1, WINDOW_DAYS, NUM_FEATURES), dtype=torch.float32
+        ).to(version.device)
+        t3 = time.perf_counter()
+        with torch.no_grad():
+            prediction_scaled = model(input_tensor)
+        t4 = time.perf_counter()
+        scaler_target.inverse_transform(prediction_scaled.cpu().numpy().reshape(-1, 1))
+        t5 = time.perf_counter()
+
+        for name, cost in zip(stages, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)):
+            stages[name].append(cost * 1000)
+
+    return {"batch_size": batch_size, **{name: percentiles(samples) for name, samples in stages.items()}}
+
+
+def bench_startup(repeat=3):
+    """在子进程中测量导入 main 与首次加载模型（含预热）的耗时"""
+    code = (
+        "import time; t0 = time.perf_counter(); import main; t1 = time.perf_counter();"
+        "main.registry.get(); t2 = time.perf_counter();"
+        "print((t1 - t0) * 1000, (t2 - t1) * 1000)"
+    )
+    imports, loads = [], []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", code],
+            capture_output=True, text=True, check=True, env=os.environ.copy(),
+        ).stdout.split()
+        imports.append(float(output[-2]))
+        loads.append(float(output[-1]))
+    return {"import_ms": float(np.median(imports)), "model_load_ms": float(np.median(loads))}
+
+
+def peak_rss_mb():
+    # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """打印与基线结果的对比（正数表示变慢 / 变大）"""
+    def row(label, new, old):
+        change = (new - old) / old * 100 if old else float("nan")
+        print(f"  {label:<40}{old:>12.3f}{new:>12.3f}{change:>+9.1f}%")
+
+    print(f"\n与基线 {baseline.get('commit')} 对比：")
+    print(f"  {'指标':<40}{'基线':>12}{'当前':>12}{'变化':>10}")
+    for name, stats in current["single_call"].items():
+        if name in baseline.get("single_call", {}):
+            for key in ("p50_ms", "p99_ms"):
+                row(f"{name} {key}", stats[key], baseline["single_call"][name][key])
+    old_throughput = {r["batch_size"]: r for r in baseline.get("throughput", [])}
+    for r in current["throughput"]:
+        if r["batch_size"] in old_throughput:
+            row(f"batch={r['batch_size']} latency_ms", r["latency_ms"],
+                old_throughput[r["batch_size"]]["latency_ms"])
+    for key in ("import_ms", "model_load_ms"):
+        if key in baseline.get("startup", {}) and key in current.get("startup", {}):
+            row(f"startup {key}", current["startup"][key], baseline["startup"][key])
+    row("peak_rss_mb", current["peak_rss_mb"], baseline.get("peak_rss_mb", 0))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="推理性能基准测试")
+    parser.add_argument('--output', default='benchmark_results.json', help='结果 JSON 路径')
+    parser.add_argument('--compare', default=None, help='用于对比的基线结果 JSON')
+    parser.add_argument('--iterations', type=int, default=1000, help='单次调用与分阶段测试的次数')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(DEFAULT_BATCH_SIZES))
+    parser.add_argument('--min-seconds', type=float, default=1.0, help='每个 batch 大小至少测量的秒数')
+    parser.add_argument('--skip-startup', action='store_true', help='跳过子进程启动耗时测量')
+    args = parser.parse_args()
+
+    _, features = load_observations()
+    windows, _ = make_windows(features)
+    windows = np.ascontiguousarray(windows)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "engine": os.getenv("PREDICT_ENGINE", "eager"),
+    }
+    if not args.skip_startup:
+        results["startup"] = bench_startup()
+    results["single_call"] = bench_single_call(windows, args.iterations)
+    results["stages"] = bench_stages(windows, args.iterations)
+    results["throughput"] = bench_throughput(windows, args.batch_sizes, args.min_seconds)
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    for name, stats in results["single_call"].items():
+        print(f"{name:<14} p50 {stats['p50_ms']:.3f}ms  p95 {stats['p95_ms']:.3f}ms  p99 {stats['p99_ms']:.3f}ms")
+    for name in ("validation", "scaling", "tensor_build", "forward", "inverse_transform"):
+        print(f"  阶段 {name:<18} p50 {results['stages'][name]['p50_ms']:.4f}ms")
+    for r in results["throughput"]:
+        print(f"batch={r['batch_size']:<6} {r['latency_ms']:.3f}ms/批  {r['windows_per_sec']:.0f} 窗口/秒")
+    if "startup" in results:
+        print(f"导入 {results['startup']['import_ms']:.0f}ms  加载模型 {results['startup']['model_load_ms']:.0f}ms")
+    print(f"峰值 RSS {results['peak_rss_mb']:.1f} MB")
+    print(f"结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
@@ -0,0 +1,301 @@
+"""
+按日增量聚合原始读数，服务端直接组装模型输入窗口
+
+模型每天的 5 个特征：
+    本站 11 点水位、本站 11 点流量、本站日均流量、两个上游站日均流量
+原始读数（任意时刻的水位 / 流量）到达时只更新所在日期的累加量：
+    流量和、流量读数数、最接近 11:00 的水位与流量及其与 11:00 的距离
+每个测站一个按日期编号（自 1970-01-01 起的天数）直接寻址的内存映射表，
+组装 "站点 X 在日期 D 的窗口" 只需读取 D 前 3 天的 3 行，不重新扫描读数。
+
+读数按 (测站, 时间) 去重：每个测站另存一份有序的已计入读数时间表，重复提交同一批读数不会重复累加
+（同一时间的读数以先到的为准）。多个 worker 共享同一目录，更新在测站目录的跨进程锁内完成。
+
+没有原始读数的站点回退到站点存储（timeseries_store）中已按日整理好的观测行。
+"""
+import os
+import threading
+
+import numpy as np
+
+from inference import WINDOW_DAYS, NUM_FEATURES
+from timeseries_store import parse_timestamps, interprocess_lock
+
+DEFAULT_DAILY_DIR = './data/daily'
+SECONDS_PER_DAY = 86400
+REFERENCE_MINUTE = 11 * 60  # 特征取 11:00 的读数
+MIN_CAPACITY_DAYS = 1024
+
+# 预测站点 -> 组装窗口所用的测站：(本站, 上游站 1, 上游站 2)
+STATION_INPUTS = {
+    "阳朔": ("阳朔", "桂林", "潮田"),
+}
+
+# 每日聚合表的列
+FLOW_SUM, FLOW_COUNT, LEVEL_AT_REF, LEVEL_DISTANCE, FLOW_AT_REF, FLOW_DISTANCE = range(6)
+DAILY_COLUMNS = 6
+ROW_BYTES = 8 * DAILY_COLUMNS
+
+
+def day_index(date):
+    """'2024/4/5'、'2024-04-05' 等日期转换为自 1970-01-01 起的天数"""
+    timestamps, valid = parse_timestamps([date])
+    if not valid[0]:
+        raise ValueError(f"无法解析的日期: {date}")
+    return int(timestamps[0] // SECONDS_PER_DAY)
+
+
+class GaugeDaily:
+    """单个测站的每日聚合表，行号即日期编号"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._path = os.path.join(directory, 'daily.f8')
+        self._seen_path = os.path.join(directory, 'seen.i8')
+        self._lock_path = os.path.join(directory, 'add.lock')
+        with self._lock, interprocess_lock(self._lock_path):
+            self._open(MIN_CAPACITY_DAYS)
+
+    @staticmethod
+    def _file_rows(path, row_bytes):
+        return os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+
+    def _open(self, capacity):
+        """按文件当前大小映射（其他进程可能已经扩容），不足 capacity 行时扩容；调用方持有跨进程锁"""
+        rows = self._file_rows(self._path, ROW_BYTES)
+        if rows < capacity:
+            with open(self._path, 'ab') as f:
+                f.truncate(capacity * ROW_BYTES)
+        self._capacity = max(rows, capacity)
+        self._table = np.memmap(self._path, dtype=np.float64, mode='r+', shape=(self._capacity, DAILY_COLUMNS))
+        if rows < capacity:
+            # 新扩出的行：距离为无穷大表示当天还没有 11 点附近的读数
+            self._table[rows:, [LEVEL_DISTANCE, FLOW_DISTANCE]] = np.inf
+            self._table.flush()
+
+    def _seen(self):
+        """已计入的读数时间（有序）"""
+        count = self._file_rows(self._seen_path, 8)
+        if not count:
+            return np.empty(0, dtype=np.int64)
+        return np.memmap(self._seen_path, dtype=np.int64, mode='r', shape=(count,))
+
+    def _unseen(self, timestamps):
+        """未计入过的读数掩码，批内重复的时间只保留第一条；调用方持有跨进程锁"""
+        _, first = np.unique(timestamps, return_index=True)
+        fresh = np.zeros(len(timestamps), dtype=bool)
+        fresh[first] = True
+        seen = self._seen()
+        if len(seen):
+            position = np.minimum(np.searchsorted(seen, timestamps), len(seen) - 1)
+            fresh &= seen[position] != timestamps
+        return fresh
+
+    def _mark_seen(self, timestamps):
+        """把新读数的时间并入有序时间表；读数大多按时间到达，通常只在末尾追加"""
+        timestamps = np.sort(timestamps)
+        seen = self._seen()
+        start = int(np.searchsorted(seen, timestamps[0]))
+        tail = np.concatenate([seen[start:], timestamps])
+        tail.sort()
+        del seen
+        with open(self._seen_path, 'ab'):
+            pass
+        with open(self._seen_path, 'r+b') as f:
+            f.seek(start * 8)
+            f.write(tail.tobytes())
+
+    def add(self, timestamps, levels, flows):
+        """
+        批量加入读数，levels / flows 中的 NaN 表示该读数没有对应的量
+
+        已经计入过的时间（包括批内重复）跳过，重复提交同一批读数不改变聚合结果
+
+        Returns:
+            加入的读数条数（不含跳过的重复读数）
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64).reshape(-1)
+        levels = np.asarray(levels, dtype=np.float64).reshape(-1)
+        flows = np.asarray(flows, dtype=np.float64).reshape(-1)
+        if not len(timestamps) == len(levels) == len(flows):
+            raise ValueError("时间、水位与流量的长度不一致")
+        if len(timestamps) == 0:
+            return 0
+        if np.any(timestamps < 0):
+            raise ValueError("不支持 1970 年以前的读数")
+
+        with self._lock, interprocess_lock(self._lock_path):
+            fresh = self._unseen(timestamps)
+            timestamps, levels, flows = timestamps[fresh], levels[fresh], flows[fresh]
+            if len(timestamps) == 0:
+                return 0
+            days = timestamps // SECONDS_PER_DAY
+            distance = np.abs(timestamps % SECONDS_PER_DAY // 60 - REFERENCE_MINUTE).astype(np.float64)
+            needed = int(days.max()) + 1
+            if needed > self._capacity:
+                self._table.flush()
+                self._open(max(needed, self._capacity * 2))
+            table = self._table
+
+            has_flow = np.isfinite(flows)
+            np.add.at(table[:, FLOW_SUM], days[has_flow], flows[has_flow])
+            np.add.at(table[:, FLOW_COUNT], days[has_flow], 1)
+            for values, value_column, distance_column in ((levels, LEVEL_AT_REF, LEVEL_DISTANCE),
+                                                          (flows, FLOW_AT_REF, FLOW_DISTANCE)):
+                self._update_nearest(table, days, distance, values, value_column, distance_column)
+            table.flush()
+            self._mark_seen(timestamps)
+        return len(timestamps)
+
+    @staticmethod
+    def _update_nearest(table, days, distance, values, value_column, distance_column):
+        """每天保留离 11:00 最近的读数：批内先取各天最近的一条，再与已有值比较"""
+        finite = np.isfinite(values)
+        if not finite.any():
+            return
+        days, distance, values = days[finite], distance[finite], values[finite]
+        order = np.lexsort((distance, days))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = days[order][1:] != days[order][:-1]
+        best = order[first]
+        closer = distance[best] <= table[days[best], distance_column]
+        table[days[best][closer], value_column] = values[best][closer]
+        table[days[best][closer], distance_column] = distance[best][closer]
+
+    def rows(self, first_day, count):
+        """日期编号 [first_day, first_day + count) 的聚合行（拷贝）"""
+        with self._lock:
+            if first_day + count > self._capacity and self._file_rows(self._path, ROW_BYTES) > self._capacity:
+                # 其他进程扩容过文件
+                with interprocess_lock(self._lock_path):
+                    self._open(0)
+            if first_day < 0 or first_day + count > self._capacity:
+                result = np.zeros((count, DAILY_COLUMNS))
+                result[:, [LEVEL_DISTANCE, FLOW_DISTANCE]] = np.inf
+                available = slice(max(first_day, 0), min(first_day + count, self._capacity))
+                if available.start < available.stop:
+                    result[available.start - first_day:available.stop - first_day] = self._table[available]
+                return result
+            return np.array(self._table[first_day:first_day + count])
+
+
+class DailyFeatureStore:
+    """按测站组织的每日聚合，以及从中组装预测窗口"""
+
+    def __init__(self, root=DEFAULT_DAILY_DIR, series_store=None, station_inputs=None):
+        self.root = root
+        self.series_store = series_store
+        self.station_inputs = station_inputs or STATION_INPUTS
+        self._gauges = {}
+        self._lock = threading.Lock()
+        self._listing = (None, frozenset())  # (根目录修改时间, 测站名集合)
+        os.makedirs(root, exist_ok=True)
+
+    def gauge(self, name):
+        if not name or name in ('.', '..') or any(c in name for c in '/\\\0'):
+            raise ValueError(f"非法的测站名称: {name!r}")
+        with self._lock:
+            gauge = self._gauges.get(name)
+            if gauge is None:
+                gauge = GaugeDaily(os.path.join(self.root, name))
+                self._gauges[name] = gauge
+            return gauge
+
+    def _known_gauges(self):
+        """已有目录的测站；按根目录修改时间缓存，只在新增测站目录后重新列目录"""
+        stamp = os.stat(self.root).st_mtime_ns
+        with self._lock:
+            if self._listing[0] != stamp:
+                names = frozenset(name for name in os.listdir(self.root)
+                                  if os.path.isdir(os.path.join(self.root, name)))
+                self._listing = (stamp, names)
+            return self._listing[1]
+
+    def gauges(self):
+        return sorted(self._known_gauges())
+
+    def add_readings(self, gauge, times, levels=None, flows=None):
+        """
+        加入一个测站的一批原始读数
+
+        Args:
+            times: 读数时间字符串列表（格式同 timeseries_store.parse_timestamp）
+            levels / flows: 与 times 等长的数值列表，缺失的量可用 None
+
+        Returns:
+            (接受条数, 无法解析时间的条数)
+        """
+        timestamps, valid = parse_timestamps(times)
+        count = len(timestamps)
+        levels = np.full(count, np.nan) if levels is None else np.array(levels, dtype=np.float64)
+        flows = np.full(count, np.nan) if flows is None else np.array(flows, dtype=np.float64)
+        if not len(levels) == len(flows) == count:
+            raise ValueError("时间、水位与流量的长度不一致")
+        valid &= np.isfinite(levels) | np.isfinite(flows)
+        accepted = self.gauge(gauge).add(timestamps[valid], levels[valid], flows[valid])
+        return accepted, count - accepted
+
+    def _rows(self, name, first_day):
+        """读取测站 3 天的聚合行；没有任何读数的测站不创建文件，视为全部缺失"""
+        if name not in self._gauges and name not in self._known_gauges():
+            rows = np.zeros((WINDOW_DAYS, DAILY_COLUMNS))
+            rows[:, [LEVEL_DISTANCE, FLOW_DISTANCE]] = np.inf
+            return rows
+        return self.gauge(name).rows(first_day, WINDOW_DAYS)
+
+    def _window_from_readings(self, station, day):
+        own, *upstream = self.station_inputs[station]
+        first_day = day - WINDOW_DAYS
+        own_rows = self._rows(own, first_day)
+        up_rows = [self._rows(name, first_day) for name in upstream]
+
+        # 本站需要当天的流量均值与 11 点附近的水位、流量；上游站只需要流量均值
+        own_complete = ((own_rows[:, FLOW_COUNT] > 0) & np.isfinite(own_rows[:, LEVEL_DISTANCE])
+                        & np.isfinite(own_rows[:, FLOW_DISTANCE]))
+        checks = [(own, own_complete)]
+        checks += [(name, rows[:, FLOW_COUNT] > 0) for name, rows in zip(upstream, up_rows)]
+        missing = [f"{name} {np.datetime64(int(first_day + k), 'D')}"
+                   for name, complete in checks for k in np.flatnonzero(~complete)]
+        if missing:
+            return None, missing
+
+        window = np.empty((WINDOW_DAYS, NUM_FEATURES))
+        window[:, 0] = own_rows[:, LEVEL_AT_REF]
+        window[:, 1] = own_rows[:, FLOW_AT_REF]
+        window[:, 2] = own_rows[:, FLOW_SUM] / own_rows[:, FLOW_COUNT]
+        for k, rows in enumerate(up_rows):
+            window[:, 3 + k] = rows[:, FLOW_SUM] / rows[:, FLOW_COUNT]
+        return window, []
+
+    def _window_from_series(self, station, day):
+        if self.series_store is None or not self.series_store.has_station(station):
+            return None
+        series = self.series_store.series(station)
+        timestamps, features = series.range((day - WINDOW_DAYS) * SECONDS_PER_DAY, day * SECONDS_PER_DAY)
+        if len(features) != WINDOW_DAYS or len(np.unique(timestamps // SECONDS_PER_DAY)) != WINDOW_DAYS:
+            return None
+        return np.array(features)
+
+    def assemble_window(self, station, date):
+        """
+        组装站点 station 预测日期 date 所需的窗口（date 前 3 天）
+
+        Returns:
+            (窗口 (3, 5), 数据来源 "readings" / "store")
+        Raises:
+            KeyError: 没有足够的数据
+        """
+        day = day_index(date)
+        missing = []
+        if station in self.station_inputs:
+            window, missing = self._window_from_readings(station, day)
+            if window is not None:
+                return window, "readings"
+        window = self._window_from_series(station, day)
+        if window is not None:
+            return window, "store"
+        if missing:
+            raise KeyError(f"缺少读数: {', '.join(missing)}")
+        raise KeyError(f"站点 {station} 没有 {date} 之前连续 {WINDOW_DAYS} 天的观测")
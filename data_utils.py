@@ -0,0 +1,78 @@
+import csv
+from itertools import islice
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from inference import WINDOW_DAYS, NUM_FEATURES
+
+DATASET_PATH = './dataset/yangshuo_4_7_11_water_level.csv'
+
+# CSV 中的特征列顺序，与模型输入一致
+FEATURE_COLUMNS = [
+    'yangshuo_shuiwei',           # 阳朔11点的水位
+    'yangshuo_traffic',           # 阳朔11点的流量
+    'yangshuo_traffic_per_day',   # 阳朔日均流量
+    'guilin_traffic_per_day',     # 桂林日均流量
+    'chaotian_traffic_per_day',   # 潮田日均流量
+]
+# 预测目标：下一天阳朔11点的水位
+TARGET_INDEX = 0
+
+
+def load_observations(path=DATASET_PATH):
+    """读取观测 CSV，返回 (日期列表, 特征数组 (T, 5))"""
+    chunks = list(iter_observation_chunks(path))
+    if not chunks:
+        return [], np.empty((0, NUM_FEATURES))
+    return (np.concatenate([dates for dates, _ in chunks]).tolist(),
+            np.concatenate([features for _, features in chunks]))
+
+
+def make_windows(features, window=WINDOW_DAYS):
+    """
+    构造全部滑动窗口及其目标值（零拷贝视图）
+
+    Returns:
+        (windows, targets)：windows 形状 (T-window, window, 5)，
+        第 i 个窗口为第 i ~ i+window-1 天，targets[i] 为第 i+window 天的水位
+    """
+    views = sliding_window_view(features, (window, features.shape[1]))[:, 0]
+    return views[:-1], features[window:, TARGET_INDEX]
+
+
+def iter_observation_chunks(path=DATASET_PATH, chunk_rows=100_000):
+    """
+    分块读取观测 CSV，每次产出 (日期字符串数组, 特征数组 (<=chunk_rows, 5))
+    用于处理无法一次装入内存的长序列档案；表头决定列的位置（顺序不限），
+    每块用 np.loadtxt 整块解析，不逐行构造字典、逐个转换 float
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        columns = [c.strip() for c in next(csv.reader([f.readline()]), [])]
+        missing = [c for c in ['date'] + FEATURE_COLUMNS if c not in columns]
+        if missing:
+            raise ValueError(f"CSV 表头缺少列: {', '.join(missing)}")
+        date_column = columns.index('date')
+        feature_columns = [columns.index(c) for c in FEATURE_COLUMNS]
+        options = dict(delimiter=',', quotechar='"', comments=None)
+        while True:
+            lines = list(islice(f, chunk_rows))
+            if not lines:
+                return
+            lines = [line for line in lines if not line.isspace()]
+            if not lines:
+                continue
+            # 日期按字符串、特征直接按 float64 各解析一遍，比整表先读成字符串再转换快
+            dates = np.loadtxt(lines, dtype=str, usecols=[date_column], ndmin=1, **options)
+            features = np.loadtxt(lines, dtype=np.float64, usecols=feature_columns, ndmin=2, **options)
+            yield np.char.strip(dates), features
+
+
+def parse_period(date, period='month'):
+    """将 '2024/4/1 11:00' 形式的日期转换为整数时段编号，如月份 202404"""
+    year, month, day = date.split(' ')[0].replace('-', '/').split('/')
+    if period == 'year':
+        return int(year)
+    if period == 'month':
+        return int(year) * 100 + int(month)
+    return int(year) * 10000 + int(month) * 100 + int(day)
@@ -0,0 +1,195 @@
+"""
+可选择的推理引擎
+
+所有引擎都实现 predict(features_array)：输入原始特征 (N, 3, 5)，返回长度 N 的水位数组（米）。
+- eager:       PyTorch 即时执行 + sklearn 标准化器（原有路径）
+- torchscript: 折叠标准化器后的 TorchScript 模型
+- quantized:   对 nn.LSTM / nn.Linear 做动态 int8 量化
+- onnx:        导出为 ONNX 并用 ONNX Runtime 执行（需安装 onnxruntime）
+
+服务端通过环境变量 PREDICT_ENGINE 选择引擎，默认 eager。
+
+用法：
+    python engines.py                       # 在数据集上校验全部引擎的精度并测速
+    python engines.py --engines eager onnx  # 只比较指定引擎
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+import torch
+from torch import nn
+
+from model_definition import ScaledNet
+from inference import predict_array
+
+ONNX_MODEL_PATH = './product/lstm_scaled.onnx'
+
+
+def _scaled_net(model, scaler_features, scaler_target):
+    scaled_model = ScaledNet(model, scaler_features.mean_, scaler_features.scale_,
+                             scaler_target.mean_, scaler_target.scale_)
+    scaled_model.eval()
+    return scaled_model
+
+
+class EagerEngine:
+    """PyTorch 即时执行，标准化与反标准化使用 sklearn"""
+    name = 'eager'
+
+    def __init__(self, model, scaler_features, scaler_target, device='cpu'):
+        self.model = model
+        self.scaler_features = scaler_features
+        self.scaler_target = scaler_target
+        self.device = device
+
+    def predict(self, features_array):
+        return predict_array(self.model, self.scaler_features, self.scaler_target,
+                             features_array, self.device)
+
+
+class TorchScriptEngine:
+    """折叠标准化器后编译为 TorchScript"""
+    name = 'torchscript'
+
+    def __init__(self, model, scaler_features, scaler_target, device='cpu'):
+        self.device = device
+        scaled_model = _scaled_net(model, scaler_features, scaler_target).to(device)
+        self.module = torch.jit.freeze(torch.jit.script(scaled_model))
+
+    def predict(self, features_array):
+        input_tensor = torch.as_tensor(features_array, dtype=torch.float32).to(self.device)
+        with torch.no_grad():
+            return self.module(input_tensor).cpu().numpy().reshape(-1)
+
+
+class QuantizedEngine:
+    """对 LSTM 与全连接层做动态 int8 量化，仅支持 CPU"""
+    name = 'quantized'
+
+    def __init__(self, model, scaler_features, scaler_target, device='cpu'):
+        scaled_model = _scaled_net(model, scaler_features, scaler_target).cpu()
+        self.module = torch.ao.quantization.quantize_dynamic(
+            scaled_model, {nn.LSTM, nn.Linear}, dtype=torch.qint8
+        )
+
+    def predict(self, features_array):
+        input_tensor = torch.as_tensor(features_array, dtype=torch.float32)
+        with torch.no_grad():
+            return self.module(input_tensor).numpy().reshape(-1)
+
+
+class OnnxEngine:
+    """导出 ONNX 模型并用 ONNX Runtime 执行，仅支持 CPU"""
+    name = 'onnx'
+
+    def __init__(self, model, scaler_features, scaler_target, device='cpu', onnx_path=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("使用 onnx 引擎需要安装 onnxruntime: pip install onnxruntime")
+
+        # 每个实例都从当前权重重新导出（默认在内存中），模型版本切换后不会读到旧文件
+        if onnx_path is None:
+            buffer = io.BytesIO()
+            export_onnx(model, scaler_features, scaler_target, buffer)
+            source = buffer.getvalue()
+        else:
+            source = export_onnx(model, scaler_features, scaler_target, onnx_path)
+        self.session = ort.InferenceSession(source, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, features_array):
+        input_array = np.ascontiguousarray(features_array, dtype=np.float32)
+        return self.session.run(None, {self.input_name: input_array})[0].reshape(-1)
+
+
+ENGINES = {
+    EagerEngine.name: EagerEngine,
+    TorchScriptEngine.name: TorchScriptEngine,
+    QuantizedEngine.name: QuantizedEngine,
+    OnnxEngine.name: OnnxEngine,
+}
+
+
+def export_onnx(model, scaler_features, scaler_target, onnx_path=ONNX_MODEL_PATH):
+    """将折叠标准化器的模型导出为 ONNX，batch 维度可变；onnx_path 可以是文件路径或二进制文件对象"""
+    scaled_model = _scaled_net(model, scaler_features, scaler_target).cpu()
+    example = torch.zeros(1, 3, 5)
+    torch.onnx.export(
+        scaled_model, (example,), onnx_path,
+        input_names=['features'], output_names=['water_level'],
+        dynamic_axes={'features': {0: 'batch'}, 'water_level': {0: 'batch'}},
+        dynamo=False,
+    )
+    return onnx_path
+
+
+def create_engine(name, model, scaler_features, scaler_target, device='cpu'):
+    """按名称创建推理引擎"""
+    if name not in ENGINES:
+        raise ValueError(f"未知的推理引擎: {name}，可选: {', '.join(ENGINES)}")
+    return ENGINES[name](model, scaler_features, scaler_target, device)
+
+
+def check_engines(names, model, scaler_features, scaler_target, tolerance=0.05, repeat=50):
+    """
+    在数据集全部滑动窗口上比较各引擎与 eager 引擎的输出，并测量批量推理耗时
+
+    Returns:
+        结果列表，每项包含 engine / max_error / mae / latency_ms / within_tolerance
+    """
+    from data_utils import load_observations, make_windows
+
+    _, features = load_observations()
+    windows, targets = make_windows(features)
+    windows = np.ascontiguousarray(windows)
+    reference = EagerEngine(model, scaler_features, scaler_target).predict(windows)
+
+    results = []
+    for name in names:
+        try:
+            engine = create_engine(name, model, scaler_features, scaler_target)
+        except Exception as e:
+            results.append({"engine": name, "error": str(e)})
+            continue
+        predictions = engine.predict(windows)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            engine.predict(windows)
+        latency = (time.perf_counter() - start) / repeat * 1000
+        max_error = float(np.max(np.abs(predictions - reference)))
+        results.append({
+            "engine": name,
+            "max_error": max_error,
+            "mae": float(np.mean(np.abs(predictions - targets))),
+            "latency_ms": latency,
+            "within_tolerance": max_error <= tolerance,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    from export_model import build_scaled_model
+
+    parser = argparse.ArgumentParser(description="比较各推理引擎的精度与速度")
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument('--tolerance', type=float, default=0.05, help='相对 eager 的最大允许误差（米）')
+    args = parser.parse_args()
+
+    _, model, scaler_features, scaler_target = build_scaled_model()
+    results = check_engines(args.engines, model, scaler_features, scaler_target, args.tolerance)
+
+    print(f"{'引擎':<12}{'最大偏差(米)':>14}{'MAE(米)':>10}{'耗时(ms)':>10}  达标")
+    for r in results:
+        if "error" in r:
+            print(f"{r['engine']:<12}  不可用: {r['error']}")
+            continue
+        print(f"{r['engine']:<12}{r['max_error']:>14.2e}{r['mae']:>10.4f}{r['latency_ms']:>10.3f}  "
+              f"{'是' if r['within_tolerance'] else '否'}")
+
+    passed = [r for r in results if r.get("within_tolerance")]
+    if passed:
+        best = min(passed, key=lambda r: r["latency_ms"])
+        print(f"推荐引擎: {best['engine']}（设置 PREDICT_ENGINE={best['engine']}）")
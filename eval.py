@@ -1,29 +1,15 @@
 import torch
 import numpy as np
-import joblib
-from model_definition import Net # 从model_definition中导入Net
+from model_registry import create_default_registry
+from inference import predict_windows
 
-input_size = 5
-hidden_size = 32
-num_layers = 2
-dropout_rate = 0.3
-
-model = Net(input_size=input_size, hidden_size=hidden_size, num_layers=num_layers, dropout=dropout_rate)
-
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-
-# 加载模型
-state_dict = torch.load('./product/best_lstm_model.pth', map_location=device)
-model.load_state_dict(state_dict)
-
-# 加载数据标准化器
-scaler_features = joblib.load('./product/scaler_features.pkl')
-scaler_target = joblib.load('./product/scaler_target.pkl')
-
-# 开启测试模式
-model.eval()
+# 模型注册表：首次预测时才加载权重与标准化器（模型配置见 model_registry.DEFAULT_MODEL_CONFIG）
+registry = create_default_registry()
 
 def predict(features_input):
+    version = registry.get()
+    model, scaler_features, scaler_target = version.model, version.scaler_features, version.scaler_target
+
     # 将输入转换为numpy数组并重塑
     features_array = np.array(features_input).reshape(-1, 5)
 
@@ -45,6 +31,15 @@ def predict(features_input):
     return prediction.item()
 
 
+def predict_batch(features_list):
+    """
+    批量预测：features_list 为 N 个 3×5 的特征窗口
+    返回 (predictions, errors)，predictions 中非法窗口处为 NaN，errors 为 {下标: 错误信息}
+    """
+    version = registry.get()
+    return predict_windows(version.model, version.scaler_features, version.scaler_target, features_list)
+
+
 # 示例使用
 if __name__ == "__main__":
     # 输入数据（需要过去3天的五个特征值）
@@ -0,0 +1,71 @@
+"""
+导出折叠了标准化器的推理模型
+
+把 scaler_features / scaler_target 的参数烘焙进 ScaledNet，
+保存为一个 TorchScript 文件：输入原始特征，直接输出水位（米）。
+
+用法：
+    python export_model.py                 # 导出到 ./product/lstm_scaled.pt
+    python export_model.py --check         # 导出并与现有推理路径做一致性校验
+"""
+import argparse
+import sys
+
+import joblib
+import numpy as np
+import torch
+
+from model_definition import ScaledNet
+from model_registry import load_model
+from inference import predict_array
+from data_utils import load_observations, make_windows
+
+SCRIPTED_MODEL_PATH = './product/lstm_scaled.pt'
+
+
+def build_scaled_model(model_path='./product/best_lstm_model.pth',
+                       features_path='./product/scaler_features.pkl',
+                       target_path='./product/scaler_target.pkl'):
+    """加载权重与标准化器，返回 (ScaledNet, 原始 Net, scaler_features, scaler_target)"""
+    model = load_model(model_path)
+    scaler_features = joblib.load(features_path)
+    scaler_target = joblib.load(target_path)
+    scaled_model = ScaledNet(model, scaler_features.mean_, scaler_features.scale_,
+                             scaler_target.mean_, scaler_target.scale_)
+    scaled_model.eval()
+    return scaled_model, model, scaler_features, scaler_target
+
+
+def export(output_path=SCRIPTED_MODEL_PATH):
+    scaled_model, model, scaler_features, scaler_target = build_scaled_model()
+    scripted = torch.jit.script(scaled_model)
+    scripted.save(output_path)
+    print(f"已导出: {output_path}")
+    return model, scaler_features, scaler_target
+
+
+def check_parity(scripted_path, model, scaler_features, scaler_target, tolerance=1e-3):
+    """在数据集的全部滑动窗口上比较导出模型与原推理路径，最大误差不超过容差时返回 True"""
+    _, features = load_observations()
+    windows, _ = make_windows(features)
+
+    expected = predict_array(model, scaler_features, scaler_target, windows)
+    scripted = torch.jit.load(scripted_path)
+    with torch.no_grad():
+        actual = scripted(torch.tensor(windows, dtype=torch.float32)).numpy().reshape(-1)
+
+    max_error = float(np.max(np.abs(actual - expected)))
+    print(f"一致性校验: {len(windows)} 个窗口, 最大误差 {max_error:.2e} 米 (容差 {tolerance:.0e})")
+    return max_error <= tolerance
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出折叠标准化器的 TorchScript 模型")
+    parser.add_argument('--output', default=SCRIPTED_MODEL_PATH, help='导出文件路径')
+    parser.add_argument('--check', action='store_true', help='导出后与原推理路径做一致性校验')
+    parser.add_argument('--tolerance', type=float, default=1e-3, help='允许的最大误差（米）')
+    args = parser.parse_args()
+
+    model, scaler_features, scaler_target = export(args.output)
+    if args.check and not check_parity(args.output, model, scaler_features, scaler_target, args.tolerance):
+        sys.exit(1)
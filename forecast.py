@@ -0,0 +1,82 @@
+import numpy as np
+
+from inference import validate_window, NUM_FEATURES
+
+MAX_HORIZON = 7
+# 外生流量特征：阳朔11点的流量, 阳朔日均流量，桂林日均流量，潮田日均流量
+NUM_FLOW_FEATURES = NUM_FEATURES - 1
+
+
+def rollout(predict_fn, features_array, horizon, future_flows=None):
+    """
+    自回归多步预测：所有窗口一起前推，每一步只调用一次 predict_fn
+
+    Args:
+        predict_fn: 接收 (N, 3, 5) 原始特征、返回长度 N 水位数组的函数
+        features_array: 初始窗口 (N, 3, 5)
+        horizon: 预测天数
+        future_flows: 未来各天的流量假设 (N, horizon-1, 4)；为 None 时沿用窗口最后一天的流量
+
+    Returns:
+        (N, horizon) 的水位轨迹（米）
+    """
+    window = np.array(features_array, dtype=np.float64)
+    n = window.shape[0]
+    if future_flows is None:
+        future_flows = np.repeat(window[:, -1:, 1:], max(horizon - 1, 0), axis=1)
+    trajectories = np.empty((n, horizon))
+    for step in range(horizon):
+        trajectories[:, step] = predict_fn(window)
+        if step == horizon - 1:
+            break
+        # 用预测水位和假设流量拼出下一天，窗口整体左移一天
+        next_day = np.concatenate([trajectories[:, step:step + 1], future_flows[:, step]], axis=1)
+        window = np.concatenate([window[:, 1:], next_day[:, None, :]], axis=1)
+    return trajectories
+
+
+def forecast_windows(predict_fn, windows, horizon, future_flows=None):
+    """
+    批量多步预测，逐个窗口校验，非法项单独报错不影响其他窗口
+
+    Args:
+        windows: N 个 3×5 的特征窗口
+        future_flows: 与 windows 等长的列表，每项为 None 或至少 horizon-1 天的 4 个流量值
+
+    Returns:
+        (trajectories, errors)：trajectories 为 (N, horizon)，非法项为 NaN；errors 为 {下标: 错误信息}
+    """
+    if not 1 <= horizon <= MAX_HORIZON:
+        raise ValueError(f"预测天数必须在 1~{MAX_HORIZON} 之间")
+    if future_flows is not None and len(future_flows) != len(windows):
+        raise ValueError("future_flows 的数量必须与窗口数量一致")
+
+    trajectories = np.full((len(windows), horizon), np.nan)
+    errors = {}
+    valid_index = []
+    flows = []
+    for i, window in enumerate(windows):
+        error = validate_window(window)
+        item_flows = None if future_flows is None else future_flows[i]
+        if error is None:
+            if item_flows is None:
+                # 未提供假设时沿用最后一天的流量
+                item_flows = [window[-1][1:]] * (horizon - 1)
+            elif len(item_flows) < horizon - 1:
+                error = f"需要提供未来 {horizon - 1} 天的流量假设"
+            elif any(len(day) != NUM_FLOW_FEATURES for day in item_flows[:horizon - 1]):
+                error = "每天的流量假设必须包含4个数值"
+        if error is None:
+            item_flows = np.asarray(item_flows[:horizon - 1], dtype=np.float64).reshape(-1, NUM_FLOW_FEATURES)
+            if not np.all(np.isfinite(item_flows)):
+                error = "流量假设中包含非法数值（NaN 或 Inf）"
+        if error is None:
+            valid_index.append(i)
+            flows.append(item_flows)
+        else:
+            errors[i] = error
+
+    if valid_index:
+        features_array = np.array([windows[i] for i in valid_index], dtype=np.float64)
+        trajectories[valid_index] = rollout(predict_fn, features_array, horizon, np.stack(flows))
+    return trajectories, errors
@@ -0,0 +1,293 @@
+"""
+服务端预警引擎
+- 各站点的预警阈值持久化在 SQLite 表中（站点名为主键），默认阈值单独保存
+- 启动时整表载入内存数组：站点名 -> 槽位，阈值 / 涨幅阈值 / 启用标记各为一个 numpy 数组
+- 每个周期用一次向量化比较评估所有站点的水位与涨幅，不逐站循环
+- 修改阈值时先写数据库，再原地更新数组，评估看到的始终是已持久化的设置
+- 已配置、已启用的站点数随保存增量维护，统计查询不扫描数组
+
+未保存过设置的站点按默认阈值评估，默认不启用（与看板一致），可用 ALERT_DEFAULT_ENABLED=1 改为启用
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 1.4  # 默认水位阈值（米）
+DEFAULT_RATE_THRESHOLD = 0.1  # 默认涨幅阈值（米/小时）
+DEFAULT_ENABLED = os.getenv("ALERT_DEFAULT_ENABLED", "0") == "1"
+MIN_CAPACITY = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alert_thresholds (
+    station_name TEXT PRIMARY KEY,
+    threshold REAL NOT NULL,
+    rate_threshold REAL NOT NULL,
+    enabled INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS alert_defaults (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    threshold REAL NOT NULL,
+    rate_threshold REAL NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+def check_thresholds(threshold: float, rate_threshold: float):
+    """校验阈值，不合法时抛出 ValueError"""
+    if not np.isfinite(threshold) or not np.isfinite(rate_threshold):
+        raise ValueError("阈值必须是有限数值")
+    if threshold <= 0 or rate_threshold < 0:
+        raise ValueError("水位阈值必须大于0，涨幅阈值不能为负")
+
+
+class ThresholdStore:
+    """预警阈值的 SQLite 持久化"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def load(self):
+        """
+        读取全部设置
+
+        Returns:
+            (站点设置列表 [(站点名, 阈值, 涨幅阈值, 是否启用)], (默认阈值, 默认涨幅阈值))
+        """
+        rows = self._conn.execute(
+            "SELECT station_name, threshold, rate_threshold, enabled FROM alert_thresholds"
+        ).fetchall()
+        defaults = self._conn.execute(
+            "SELECT threshold, rate_threshold FROM alert_defaults WHERE id = 1"
+        ).fetchone()
+        return [(name, t, r, bool(e)) for name, t, r, e in rows], defaults or (DEFAULT_THRESHOLD, DEFAULT_RATE_THRESHOLD)
+
+    def upsert(self, rows: List[tuple]):
+        """写入或更新若干站点的设置（同一事务）"""
+        now = datetime.now().isoformat()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO alert_thresholds (station_name, threshold, rate_threshold, enabled, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(station_name) DO UPDATE SET "
+                "threshold = excluded.threshold, rate_threshold = excluded.rate_threshold, "
+                "enabled = excluded.enabled, updated_at = excluded.updated_at",
+                [(name, float(t), float(r), int(e), now) for name, t, r, e in rows],
+            )
+
+    def set_defaults(self, threshold: float, rate_threshold: float):
+        """保存默认阈值，并应用到所有已保存的站点（保留各站点的启用状态）"""
+        now = datetime.now().isoformat()
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO alert_defaults (id, threshold, rate_threshold, updated_at) VALUES (1, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET threshold = excluded.threshold, "
+                "rate_threshold = excluded.rate_threshold, updated_at = excluded.updated_at",
+                (threshold, rate_threshold, now),
+            )
+            self._conn.execute(
+                "UPDATE alert_thresholds SET threshold = ?, rate_threshold = ?, updated_at = ?",
+                (threshold, rate_threshold, now),
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+class AlertEngine:
+    """
+    按槽位组织的预警阈值数组与向量化评估
+
+    槽位在站点第一次出现（保存设置或参与评估）时分配，之后不变；
+    调用方可以缓存 slots() 的结果，每个周期直接用槽位数组评估
+    """
+
+    def __init__(self, store: ThresholdStore):
+        self.store = store
+        self._lock = threading.Lock()
+        self.names: List[str] = []
+        self._index: Dict[str, int] = {}
+        self.configured_count = 0
+        self.enabled_count = 0
+        self._allocate(MIN_CAPACITY)
+        rows, (self.default_threshold, self.default_rate_threshold) = store.load()
+        for name, threshold, rate_threshold, enabled in rows:
+            self._set(self._slot(name), threshold, rate_threshold, enabled)
+
+    def _allocate(self, capacity: int):
+        count = len(self.names)
+        old = getattr(self, "threshold", None)
+        threshold = np.zeros(capacity)
+        rate_threshold = np.zeros(capacity)
+        enabled = np.zeros(capacity, dtype=bool)
+        configured = np.zeros(capacity, dtype=bool)
+        if old is not None:
+            threshold[:count] = self.threshold[:count]
+            rate_threshold[:count] = self.rate_threshold[:count]
+            enabled[:count] = self.enabled[:count]
+            configured[:count] = self.configured[:count]
+        self.threshold, self.rate_threshold = threshold, rate_threshold
+        self.enabled, self.configured = enabled, configured
+
+    def _slot(self, name: str) -> int:
+        """站点名 -> 槽位；新站点按默认阈值分配槽位，不写数据库"""
+        slot = self._index.get(name)
+        if slot is None:
+            slot = len(self.names)
+            if slot == len(self.threshold):
+                self._allocate(2 * slot)
+            self.names.append(name)
+            self._index[name] = slot
+            self.threshold[slot] = self.default_threshold
+            self.rate_threshold[slot] = self.default_rate_threshold
+            self.enabled[slot] = DEFAULT_ENABLED
+            self.enabled_count += DEFAULT_ENABLED
+        return slot
+
+    def _set(self, slot: int, threshold: float, rate_threshold: float, enabled: bool):
+        self.enabled_count += int(enabled) - int(self.enabled[slot])
+        self.configured_count += not self.configured[slot]
+        self.threshold[slot] = threshold
+        self.rate_threshold[slot] = rate_threshold
+        self.enabled[slot] = enabled
+        self.configured[slot] = True
+
+    def __len__(self):
+        return len(self.names)
+
+    def slots(self, names: Iterable[str]) -> np.ndarray:
+        """站点名列表 -> 槽位数组（未知站点分配新槽位）"""
+        with self._lock:
+            return np.fromiter((self._slot(name) for name in names), dtype=np.int64)
+
+    def save(self, settings: List[dict]) -> int:
+        """
+        保存若干站点的设置
+
+        Args:
+            settings: 每项包含 station_name、threshold、rate_threshold、enabled
+
+        Returns:
+            保存的站点数
+        """
+        rows = [(s["station_name"], float(s["threshold"]), float(s["rate_threshold"]), bool(s["enabled"]))
+                for s in settings]
+        for name, threshold, rate_threshold, _ in rows:
+            if not name:
+                raise ValueError("站点名称不能为空")
+            check_thresholds(threshold, rate_threshold)
+        with self._lock:
+            self.store.upsert(rows)
+            for name, threshold, rate_threshold, enabled in rows:
+                self._set(self._slot(name), threshold, rate_threshold, enabled)
+        return len(rows)
+
+    def set_defaults(self, threshold: float, rate_threshold: float):
+        """设置默认阈值，并应用到所有站点"""
+        check_thresholds(threshold, rate_threshold)
+        with self._lock:
+            self.store.set_defaults(threshold, rate_threshold)
+            self.default_threshold, self.default_rate_threshold = threshold, rate_threshold
+            self.threshold[:len(self.names)] = threshold
+            self.rate_threshold[:len(self.names)] = rate_threshold
+
+    def settings(self, name: str) -> dict:
+        """单个站点当前生效的设置"""
+        with self._lock:
+            slot = self._index.get(name)
+            if slot is None:
+                return {"station_name": name, "threshold": self.default_threshold,
+                        "rate_threshold": self.default_rate_threshold, "enabled": DEFAULT_ENABLED,
+                        "configured": False}
+            return self._settings(slot)
+
+    def _settings(self, slot: int) -> dict:
+        return {
+            "station_name": self.names[slot],
+            "threshold": float(self.threshold[slot]),
+            "rate_threshold": float(self.rate_threshold[slot]),
+            "enabled": bool(self.enabled[slot]),
+            "configured": bool(self.configured[slot]),
+        }
+
+    def configured_settings(self) -> List[dict]:
+        """所有保存过设置的站点"""
+        with self._lock:
+            return [self._settings(slot) for slot in np.flatnonzero(self.configured[:len(self.names)])]
+
+    def evaluate(self, slots: np.ndarray, levels: np.ndarray, rates: np.ndarray):
+        """
+        一次评估一批站点
+
+        Args:
+            slots: 槽位数组（slots() 的结果）
+            levels: 对应站点的当前水位（米）
+            rates: 对应站点的涨幅（米/小时），NaN 表示未知
+
+        Returns:
+            (水位超限掩码, 涨幅超限掩码)，未启用的站点均为 False
+        """
+        levels = np.asarray(levels, dtype=np.float64)
+        rates = np.asarray(rates, dtype=np.float64)
+        enabled = self.enabled[slots]
+        # NaN 参与比较结果为 False，缺失的读数不会触发预警
+        level_alert = enabled & (levels > self.threshold[slots])
+        rate_alert = enabled & (rates > self.rate_threshold[slots])
+        return level_alert, rate_alert
+
+
+def create_alert_engine(path: str) -> AlertEngine:
+    return AlertEngine(ThresholdStore(path))
+
+
+def benchmark(stations: int, ticks: int, path: Optional[str] = None):
+    """
+    stations 个站点 ticks 个周期，返回每周期耗时（毫秒）的中位数与 p99
+
+    计时的是线上实际走的 StationMonitor.update（涨幅回归 + 带回差的状态转换 + 增量事件），
+    其中的触发判断即 evaluate()
+    """
+    import tempfile
+    from station_monitor import StationMonitor
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_alert_engine(path or os.path.join(tmp, "alerts.db"))
+        names = [f"站点{i}" for i in range(stations)]
+        rng = np.random.default_rng(0)
+        engine.save([{"station_name": name, "threshold": t, "rate_threshold": 0.1, "enabled": True}
+                     for name, t in zip(names, rng.uniform(1.0, 2.0, stations))])
+        monitor = StationMonitor(engine)
+        levels = rng.uniform(0.5, 2.0, stations)
+        timings = []
+        for tick in range(ticks):
+            # 每 30 秒一个周期
+            levels += rng.normal(0, 0.1, stations) / 120
+            times = np.full(stations, 30.0 * tick)
+            start = time.perf_counter()
+            monitor.update(names, levels, times)
+            timings.append((time.perf_counter() - start) * 1000)
+        engine.store.close()
+    return float(np.median(timings)), float(np.percentile(timings, 99))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预警评估（StationMonitor.update）耗时测试")
+    parser.add_argument("--stations", type=int, default=5000)
+    parser.add_argument("--ticks", type=int, default=1000)
+    args = parser.parse_args()
+
+    p50, p99 = benchmark(args.stations, args.ticks)
+    print(f"{args.stations} 个站点，每周期评估耗时 p50 {p50:.3f}ms，p99 {p99:.3f}ms")
@@ -0,0 +1,76 @@
+"""
+预警统计：随状态转换增量维护，查询时不扫描站点
+
+- 按预警状态位（0 正常、1 水位、2 涨幅、3 水位 + 涨幅）计数，
+  每个周期只对状态发生变化的站点做加减，查询 O(1)
+- 严重程度：单一条件超限为 warning，水位与涨幅同时超限为 critical
+- 可选的分时段历史：每 bucket_seconds 一个桶，记录该时段内新增 / 解除的预警数与预警站点数峰值，
+  只保留最近 buckets 个桶，绘制预警负荷曲线时无需重算；没有读数的时段不产生桶
+"""
+
+import os
+from collections import deque
+from typing import List, Optional
+
+import numpy as np
+
+HISTORY_BUCKET_SECONDS = int(os.getenv("ALERT_HISTORY_BUCKET_SECONDS", "60"))
+HISTORY_BUCKETS = int(os.getenv("ALERT_HISTORY_BUCKETS", "1440"))  # 默认保留 24 小时
+
+# 状态位与 station_monitor 一致：1 水位，2 涨幅
+STATE_COUNT = 4
+
+
+class AlertStatistics:
+    """处于预警中的站点计数与分时段历史"""
+
+    def __init__(self, bucket_seconds: int = HISTORY_BUCKET_SECONDS, buckets: int = HISTORY_BUCKETS):
+        self.bucket_seconds = bucket_seconds
+        self.state_counts = np.zeros(STATE_COUNT, dtype=np.int64)
+        self.history = deque(maxlen=buckets)
+
+    def record(self, previous: np.ndarray, current: np.ndarray, now: float):
+        """
+        记录一批站点的状态转换（只需传入状态发生变化的站点）
+
+        Args:
+            previous: 转换前的状态位
+            current: 转换后的状态位
+            now: 当前时间（Unix 秒）
+        """
+        self.state_counts -= np.bincount(previous, minlength=STATE_COUNT)
+        self.state_counts += np.bincount(current, minlength=STATE_COUNT)
+        raised = int(np.count_nonzero((previous == 0) & (current != 0)))
+        cleared = int(np.count_nonzero((previous != 0) & (current == 0)))
+
+        start = int(now // self.bucket_seconds * self.bucket_seconds)
+        if not self.history or self.history[-1]["start"] != start:
+            self.history.append({"start": start, "raised": 0, "cleared": 0, "peak_active": 0, "active": 0})
+        bucket = self.history[-1]
+        bucket["raised"] += raised
+        bucket["cleared"] += cleared
+        bucket["active"] = self.active
+        bucket["peak_active"] = max(bucket["peak_active"], bucket["active"])
+
+    @property
+    def active(self) -> int:
+        return int(self.state_counts[1:].sum())
+
+    def summary(self) -> dict:
+        counts = self.state_counts
+        return {
+            "active_alerts": self.active,
+            "by_severity": {
+                "warning": int(counts[1] + counts[2]),
+                "critical": int(counts[3]),
+            },
+            "by_type": {
+                "water_level": int(counts[1] + counts[3]),
+                "rise_rate": int(counts[2] + counts[3]),
+            },
+        }
+
+    def recent(self, buckets: Optional[int] = None) -> List[dict]:
+        """最近 buckets 个时段（按时间先后），为空时返回全部保留的时段"""
+        history = list(self.history)
+        return history[-buckets:] if buckets else history
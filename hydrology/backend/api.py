@@ -6,13 +6,18 @@
 3. 数据检索等其他接口
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+import asyncio
+import json
 import os
 from dotenv import load_dotenv
 from datetime import datetime
 from briefing_generator import generate_briefing_markdown, generate_briefing_with_ai, SAMPLE_BRIEFING_DATA
+from alert_engine import create_alert_engine
+from station_monitor import StationMonitor, SEND_TIMEOUT
 
 load_dotenv()
 
@@ -21,6 +26,9 @@ DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
 DASHSCOPE_BASE_URL = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
 DASHSCOPE_MODEL = os.getenv("DASHSCOPE_MODEL", "qwen-plus")
 
+# 预警阈值数据库（SQLite）
+ALERT_DB_PATH = os.getenv("ALERT_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alerts.db"))
+
 # 简报关键词回复
 KEYWORD_REPLIES = {
     "rain": "当前无持续暴雨，但请关注短时强降雨预报。",
@@ -68,9 +76,39 @@ class AlertThreshold(BaseModel):
     rate_threshold: float
 
 
+class StationReading(BaseModel):
+    """单个站点的一次读数（涨幅由服务端根据历次读数计算）"""
+    station_name: str
+    level: float  # 水位（米）
+    timestamp: Optional[float] = None  # 读数时间（Unix 秒），不传时使用服务端接收时间
+
+
+class StationReadingsRequest(BaseModel):
+    """一个周期内各站点的读数"""
+    readings: List[StationReading]
+
+
+class AlertReading(BaseModel):
+    """批量预警检查中的单个站点读数（涨幅由服务端根据历次读数计算）"""
+    station_name: str
+    current_level: float
+    timestamp: Optional[float] = None  # 读数时间（Unix 秒），不传时使用服务端接收时间
+
+
+class AlertCheckBatchRequest(BaseModel):
+    """批量预警检查请求"""
+    readings: List[AlertReading]
+    since: Optional[int] = None  # 上次响应中的 seq；不传时返回所有处于预警中的站点
+
+
 # ==================== FastAPI 应用初始化 ====================
 app = FastAPI(title="Hydrology Unified API", description="统一的水文数据API接口")
 
+# 预警引擎：阈值表持久化在 ALERT_DB_PATH，启动时载入内存数组
+alert_engine = create_alert_engine(ALERT_DB_PATH)
+# 站点水位与预警状态，向 WebSocket / SSE 客户端推送增量
+station_monitor = StationMonitor(alert_engine)
+
 
 # ==================== 核心函数 ====================
 
@@ -392,6 +430,12 @@ async def get_local_briefing(query: Query):
 
 # ==================== 预警管理 API ====================
 
+def reading_times(readings) -> List[float]:
+    """读数时间列表，未带时间的读数使用当前时间"""
+    now = datetime.now().timestamp()
+    return [now if r.timestamp is None else r.timestamp for r in readings]
+
+
 @app.post("/api/alerts/save")
 async def save_alert_settings(settings: AlertSettings):
     """
@@ -404,6 +448,9 @@ async def save_alert_settings(settings: AlertSettings):
         保存结果
     """
     try:
+        alert_engine.save([settings.dict()])
+        # 新设置立即作用于当前预警状态（统计与推送通道同步更新）
+        station_monitor.refresh([settings.station_name])
         return {
             "status": "success",
             "message": f"已保存 {settings.station_name} 的预警设置",
@@ -416,7 +463,7 @@ async def save_alert_settings(settings: AlertSettings):
 @app.post("/api/alerts/batch")
 async def batch_save_alert_settings(request: AlertSettingsRequest):
     """
-    批量保存预警设置
+    批量保存预警设置（同一事务写入）
     
     Args:
         request: 包含多个预警设置的请求
@@ -425,9 +472,8 @@ async def batch_save_alert_settings(request: AlertSettingsRequest):
         批量保存结果
     """
     try:
-        saved_count = 0
-        for station_name, settings in request.settings.items():
-            saved_count += 1
+        saved_count = alert_engine.save([settings.dict() for settings in request.settings.values()])
+        station_monitor.refresh([settings.station_name for settings in request.settings.values()])
         
         return {
             "status": "success",
@@ -441,7 +487,7 @@ async def batch_save_alert_settings(request: AlertSettingsRequest):
 @app.post("/api/alerts/set-default")
 async def set_default_thresholds(thresholds: AlertThreshold):
     """
-    设置所有站点的默认阈值
+    设置所有站点的默认阈值（同时应用到已保存设置的站点，启用状态不变）
     
     Args:
         thresholds: 默认阈值对象（threshold 和 rate_threshold）
@@ -450,8 +496,8 @@ async def set_default_thresholds(thresholds: AlertThreshold):
         设置结果
     """
     try:
-        if thresholds.threshold <= 0 or thresholds.rate_threshold < 0:
-            raise ValueError("阈值必须大于0")
+        alert_engine.set_defaults(thresholds.threshold, thresholds.rate_threshold)
+        station_monitor.refresh()
         
         return {
             "status": "success",
@@ -474,8 +520,8 @@ async def get_default_thresholds():
         默认阈值对象
     """
     return {
-        "threshold": 1.4,  # 默认水位阈值（米）
-        "rate_threshold": 0.1,  # 默认涨幅阈值（米/小时）
+        "threshold": alert_engine.default_threshold,  # 默认水位阈值（米）
+        "rate_threshold": alert_engine.default_rate_threshold,  # 默认涨幅阈值（米/小时）
         "recommended": {
             "low_risk_threshold": 1.1,
             "high_risk_threshold": 1.8,
@@ -484,66 +530,218 @@ async def get_default_thresholds():
     }
 
 
+@app.get("/api/alerts/settings")
+async def get_alert_settings(station_name: Optional[str] = None):
+    """
+    获取预警设置
+    
+    Args:
+        station_name: 站点名称；不传时返回所有保存过设置的站点
+    
+    Returns:
+        单个站点当前生效的设置，或全部已保存的设置
+    """
+    if station_name is not None:
+        return alert_engine.settings(station_name)
+    return {
+        "settings": alert_engine.configured_settings(),
+        "defaults": {
+            "threshold": alert_engine.default_threshold,
+            "rate_threshold": alert_engine.default_rate_threshold
+        }
+    }
+
+
 @app.get("/api/alerts/statistics")
-async def get_alert_statistics():
+async def get_alert_statistics(history: bool = False, buckets: Optional[int] = None):
     """
-    获取预警统计信息
+    获取预警统计信息（计数随设置保存与预警转换增量维护）
+    
+    Args:
+        history: 是否返回分时段历史
+        buckets: 返回最近的时段数，不传时返回全部保留的时段
     
     Returns:
         统计信息对象
     """
-    return {
-        "total_stations": 33,
-        "configured_alerts": 0,  # 从前端获取
-        "active_alerts": 0,  # 从监测数据获取
+    stats = {
+        "total_stations": len(alert_engine),
+        "configured_alerts": alert_engine.configured_count,
+        "enabled_alerts": alert_engine.enabled_count,
+        **station_monitor.stats.summary(),
+        "seq": station_monitor.seq,
         "timestamp": datetime.now().isoformat(),
         "description": "预警统计信息（实时数据）"
     }
+    if history:
+        stats["history_bucket_seconds"] = station_monitor.stats.bucket_seconds
+        stats["history"] = station_monitor.stats.recent(buckets)
+    return stats
 
 
-@app.post("/api/alerts/check")
+@app.post("/api/alerts/check", deprecated=True)
 async def check_alert_conditions(station_data: Dict[str, Any]):
     """
-    检查是否满足预警条件
+    检查单个站点的预警条件（已弃用，请使用 /api/alerts/check/batch 或 /api/stations/levels）
+    
+    读数与批量接口一样进入站点监测：涨幅由服务端按历次读数计算，预警带回差与冷却时间，
+    请求中的 rise_rate 不再使用
     
     Args:
-        station_data: 包含 station_name、current_level、rate 等的对象
+        station_data: 包含 station_name、current_level，可选 timestamp（Unix 秒）的对象
     
     Returns:
         检查结果
     """
     try:
         station_name = station_data.get("station_name")
-        current_level = station_data.get("current_level", 0)
-        rise_rate = station_data.get("rise_rate", 0)
-        
-        # 这里可以添加更复杂的预警逻辑
-        alerts = []
+        if not station_name:
+            raise ValueError("缺少 station_name")
+        current_level = float(station_data.get("current_level", 0))
+        timestamp = station_data.get("timestamp")
+        timestamp = datetime.now().timestamp() if timestamp is None else float(timestamp)
         
-        if current_level > 1.4:
-            alerts.append({
-                "type": "water_level",
-                "level": "warning",
-                "message": f"{station_name} 水位超限：{current_level:.2f}m"
-            })
-        
-        if rise_rate > 0.1:
-            alerts.append({
-                "type": "rise_rate",
-                "level": "warning",
-                "message": f"{station_name} 涨幅过快：{rise_rate:.3f}m/h"
-            })
+        station_monitor.update([station_name], [current_level], [timestamp])
+        status = station_monitor.station_status(station_name)
         
         return {
             "station": station_name,
-            "status": "alert" if alerts else "normal",
-            "alerts": alerts,
+            "status": status["status"],
+            "alerts": status["alerts"],
+            "rise_rate": status["rise_rate"],
+            "deprecated": True,
+            "timestamp": datetime.now().isoformat()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"检查失败: {str(e)}")
+
+
+@app.post("/api/alerts/check/batch")
+async def check_alert_conditions_batch(request: AlertCheckBatchRequest):
+    """
+    批量检查预警条件：一次评估所有读数，只返回预警状态在 since 之后发生变化的站点
+    
+    读数同时进入推送通道，WebSocket / SSE 客户端收到相同的状态变化
+    
+    Args:
+        request: 各站点读数与上次响应中的序号
+    
+    Returns:
+        当前序号（下次请求作为 since）与状态变化的站点；reset 为 true 时 changed 为全量，
+        客户端应先清空本地状态
+    """
+    try:
+        readings = request.readings
+        station_monitor.update(
+            [r.station_name for r in readings],
+            [r.current_level for r in readings],
+            reading_times(readings),
+        )
+        seq, changed, reset = station_monitor.states_since(request.since)
+        return {
+            "seq": seq,
+            "reset": reset,
+            "changed": changed,
+            "count": len(changed),
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"检查失败: {str(e)}")
 
 
+# ==================== 站点推送 API ====================
+
+@app.post("/api/stations/levels")
+async def update_station_levels(request: StationReadingsRequest):
+    """
+    上报一个周期内各站点的读数，评估预警并向所有已连接的客户端推送增量
+    
+    Args:
+        request: 各站点的水位与涨幅
+    
+    Returns:
+        当前序号与本次推送的变化数
+    """
+    try:
+        readings = request.readings
+        event = station_monitor.update(
+            [r.station_name for r in readings],
+            [r.level for r in readings],
+            reading_times(readings),
+        )
+        return {
+            "status": "success",
+            "seq": station_monitor.seq,
+            "level_changes": len(event["levels"]) if event else 0,
+            "alert_changes": len(event["alerts"]) if event else 0
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"上报失败: {str(e)}")
+
+
+@app.get("/api/stations/snapshot")
+async def get_station_snapshot():
+    """
+    获取所有站点的当前水位与预警状态
+    
+    Returns:
+        快照（seq 可作为之后订阅推送的起点）
+    """
+    return station_monitor.snapshot()
+
+
+@app.websocket("/ws/stations")
+async def station_websocket(websocket: WebSocket, since: Optional[int] = None):
+    """
+    站点推送通道（WebSocket）
+    
+    Args:
+        since: 最后收到的序号，断线重连时用于续传；不传时先收到一次快照
+    """
+    await websocket.accept()
+    try:
+        async for message in station_monitor.messages(since):
+            # 心跳用于及时发现已断开的连接
+            payload = {"type": "heartbeat", "seq": station_monitor.seq} if message is None else message
+            await asyncio.wait_for(websocket.send_json(payload), SEND_TIMEOUT)
+    except (WebSocketDisconnect, asyncio.TimeoutError):
+        pass
+    finally:
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass
+
+
+@app.get("/api/stations/stream")
+async def station_event_stream(request: Request, since: Optional[int] = None):
+    """
+    站点推送通道（Server-Sent Events），EventSource 重连时自动带上 Last-Event-ID 续传
+    
+    Args:
+        since: 最后收到的序号；未传时使用 Last-Event-ID 请求头
+    
+    Returns:
+        text/event-stream 响应
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    async def events():
+        async for message in station_monitor.messages(since):
+            if await request.is_disconnected():
+                break
+            if message is None:
+                yield ": heartbeat\n\n"
+                continue
+            data = json.dumps(message, ensure_ascii=False)
+            yield f"id: {message['seq']}\nevent: {message['type']}\ndata: {data}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 # ==================== 中间件配置 ====================
 
 # CORS 中间件配置（允许跨域请求用于本地开发）
@@ -11,7 +11,12 @@ try:
     from api import app as api_app
     # 使用导入的 API 应用作为主应用
     app = api_app
-except ImportError:
+except ImportError as e:
+    # 只有 api 模块本身不存在时才退回基础应用；
+    # 依赖缺失（如预警引擎需要的 numpy）直接报错，避免静默丢失所有业务路由
+    if e.name != "api":
+        raise
+    print(f"[启动] 统一 API 模块未找到，仅提供 /health: {e}")
     # 如果导入失败，创建基础应用
     app = FastAPI(title="Hydrology Main Server")
     
@@ -0,0 +1,133 @@
+"""
+服务端涨幅估计：每个站点最近 window 条读数的滚动线性回归
+
+- 每个站点保存最近 window 条读数（环形缓冲）以及回归所需的累加量
+  Σt、Σy、Σt²、Σty；新读数到达时减去被挤出的读数、加上新读数，每条读数 O(1)
+- 一个周期的所有站点在数组上一次完成更新，不逐站循环
+- 时间以站点自身的起点为原点，避免时间戳平方损失精度；
+  距起点超过 REBASE_SECONDS 时从缓冲区重算累加量（每站每天一次，摊销 O(1)）
+- 时间不晚于上一条的读数忽略；与上一条间隔超过 max_gap 时清空窗口重新开始
+"""
+
+import os
+
+import numpy as np
+
+RATE_WINDOW = int(os.getenv("RISE_RATE_WINDOW", "30"))  # 参与回归的读数条数
+MIN_POINTS = 3  # 少于该条数时涨幅未知（NaN）
+MAX_GAP_SECONDS = 3600.0
+REBASE_SECONDS = 86400.0
+MIN_TIME_VARIANCE = 1e-6  # 窗口内读数时间的方差（秒²）低于该值时斜率未知
+SECONDS_PER_HOUR = 3600.0
+
+
+class RollingSlope:
+    """按槽位组织的滚动回归斜率（米/小时）"""
+
+    def __init__(self, window: int = RATE_WINDOW, max_gap: float = MAX_GAP_SECONDS, capacity: int = 64):
+        if window < MIN_POINTS:
+            raise ValueError(f"回归窗口至少需要 {MIN_POINTS} 条读数")
+        self.window = window
+        self.max_gap = max_gap
+        self._capacity = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        count = self._capacity
+        arrays = {
+            "times": np.zeros((capacity, self.window)),  # 相对 origin 的时间（秒）
+            "values": np.zeros((capacity, self.window)),
+            "head": np.zeros(capacity, dtype=np.int64),  # 下一条读数写入的位置
+            "count": np.zeros(capacity, dtype=np.int64),
+            "origin": np.zeros(capacity),
+            "last_time": np.full(capacity, -np.inf),
+            "sum_t": np.zeros(capacity),
+            "sum_y": np.zeros(capacity),
+            "sum_tt": np.zeros(capacity),
+            "sum_ty": np.zeros(capacity),
+        }
+        for name, array in arrays.items():
+            if count:
+                array[:count] = getattr(self, name)[:count]
+            setattr(self, name, array)
+        self._capacity = capacity
+
+    def update(self, slots: np.ndarray, times: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        加入一批读数（slots 中不得有重复）
+
+        Args:
+            slots: 站点槽位
+            times: 读数时间（Unix 秒）
+            values: 水位（米）
+
+        Returns:
+            各站点更新后的涨幅（米/小时），读数不足时为 NaN
+        """
+        fresh = self.accepts(slots, times, values)
+        s, t, y = slots[fresh], times[fresh], values[fresh]
+
+        restart = t - self.last_time[s] > self.max_gap
+        self._restart(s[restart], t[restart])
+        rebase = t - self.origin[s] > REBASE_SECONDS
+        self._rebase(s[rebase], t[rebase])
+
+        x = t - self.origin[s]
+        head = self.head[s]
+        # 窗口已满时先减去即将被覆盖的最旧读数
+        full = self.count[s] == self.window
+        old_x = np.where(full, self.times[s, head], 0.0)
+        old_y = np.where(full, self.values[s, head], 0.0)
+        self.sum_t[s] += x - old_x
+        self.sum_y[s] += y - old_y
+        self.sum_tt[s] += x * x - old_x * old_x
+        self.sum_ty[s] += x * y - old_x * old_y
+
+        self.times[s, head] = x
+        self.values[s, head] = y
+        self.head[s] = (head + 1) % self.window
+        self.count[s] = np.minimum(self.count[s] + 1, self.window)
+        self.last_time[s] = t
+        return self.rate(slots)
+
+    def accepts(self, slots: np.ndarray, times: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """会被 update() 采用的读数：水位有限且时间晚于该站点的上一条"""
+        if len(slots) and slots.max() >= self._capacity:
+            self._allocate(max(int(slots.max()) + 1, 2 * self._capacity))
+        return (times > self.last_time[slots]) & np.isfinite(values)
+
+    def _restart(self, slots: np.ndarray, times: np.ndarray):
+        for name in ("head", "count", "sum_t", "sum_y", "sum_tt", "sum_ty"):
+            getattr(self, name)[slots] = 0
+        self.origin[slots] = times
+
+    def _rebase(self, slots: np.ndarray, times: np.ndarray):
+        """把原点移到当前读数时间，并从缓冲区重算累加量"""
+        if not len(slots):
+            return
+        shift = times - self.origin[slots]
+        self.times[slots] -= shift[:, None]
+        self.origin[slots] += shift
+        # 有效位置：head 之前的 count 个
+        age = (self.head[slots][:, None] - 1 - np.arange(self.window)[None, :]) % self.window
+        valid = age < self.count[slots][:, None]
+        x = np.where(valid, self.times[slots], 0.0)
+        y = np.where(valid, self.values[slots], 0.0)
+        self.sum_t[slots] = x.sum(axis=1)
+        self.sum_y[slots] = y.sum(axis=1)
+        self.sum_tt[slots] = (x * x).sum(axis=1)
+        self.sum_ty[slots] = (x * y).sum(axis=1)
+
+    def rate(self, slots: np.ndarray) -> np.ndarray:
+        """各站点当前窗口的回归斜率（米/小时）"""
+        n = self.count[slots].astype(np.float64)
+        sum_t, sum_y = self.sum_t[slots], self.sum_y[slots]
+        # denominator = n² × 时间方差，按读数时间的离散程度判断，与时间离原点的远近无关；
+        # 第二项是 n·Σt² - (Σt)² 的舍入误差上界，只在时间几乎重合时起作用
+        denominator = n * self.sum_tt[slots] - sum_t * sum_t
+        numerator = n * self.sum_ty[slots] - sum_t * sum_y
+        tolerance = n * n * MIN_TIME_VARIANCE + 16 * np.finfo(np.float64).eps * n * self.sum_tt[slots]
+        ok = (n >= MIN_POINTS) & (denominator > tolerance)
+        slope = np.full(len(slots), np.nan)
+        slope[ok] = numerator[ok] / denominator[ok]
+        return slope * SECONDS_PER_HOUR
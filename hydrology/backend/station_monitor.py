@@ -0,0 +1,336 @@
+"""
+站点水位监测与推送通道
+- 每个周期接收一批站点读数，涨幅由服务端按各站点最近读数的滚动回归计算（rise_rate.py）
+- 预警状态机（每个条件独立，所有站点一次向量化计算）：
+  超过阈值立即进入预警；水位回落到 阈值 - LEVEL_HYSTERESIS 以下、
+  涨幅回落到 涨幅阈值 × (1 - RATE_HYSTERESIS_RATIO) 以下，且进入预警已满 ALERT_COOLDOWN_SECONDS 才解除；
+  停用的站点立即解除。预警持续期间不重复产生事件，客户端只收到真正的状态转换
+- 水位变化超过 level_epsilon 的站点与预警状态变化的站点合成一条增量事件，
+  事件带递增序号，保存在定长的事件日志中
+- 推送（WebSocket / SSE）按客户端游标从日志读取：
+  客户端发送慢时，积压的多条事件合并为一条再发送（各站点只保留最新水位与最新状态），
+  每个客户端不排队、不缓存，服务端内存只与日志长度有关
+- 断线重连时带上最后收到的序号即可续传；序号已被日志淘汰时改发一次全量快照
+- 阈值或启用状态修改后由 refresh() 按当前水位与涨幅重新评估，统计与推送立即反映新设置
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import List, Optional
+
+import numpy as np
+
+from alert_engine import AlertEngine
+from alert_stats import AlertStatistics
+from rise_rate import RollingSlope
+
+LOG_SIZE = int(os.getenv("STREAM_LOG_SIZE", "1000"))  # 可续传的事件数
+LEVEL_EPSILON = 0.001  # 水位变化小于该值（米）时不推送
+HEARTBEAT_SECONDS = 15.0
+SEND_TIMEOUT = 10.0  # 单条消息发送超过该时间视为客户端失联
+LEVEL_HYSTERESIS = float(os.getenv("ALERT_LEVEL_HYSTERESIS", "0.05"))  # 米
+RATE_HYSTERESIS_RATIO = float(os.getenv("ALERT_RATE_HYSTERESIS_RATIO", "0.2"))
+ALERT_COOLDOWN_SECONDS = float(os.getenv("ALERT_COOLDOWN_SECONDS", "60"))  # 进入预警后至少保持的时间
+
+# 预警状态位
+ALERT_LEVEL = 1
+ALERT_RATE = 2
+
+
+def describe_alerts(name: str, state: int, level: float, rise_rate: float,
+                    threshold: float, rate_threshold: float) -> List[dict]:
+    """预警状态位 -> 预警列表（格式同 /api/alerts/check）"""
+    alerts = []
+    if state & ALERT_LEVEL:
+        alerts.append({
+            "type": "water_level",
+            "level": "warning",
+            "message": f"{name} 水位超限：{level:.2f}m，阈值：{threshold}m"
+        })
+    if state & ALERT_RATE:
+        alerts.append({
+            "type": "rise_rate",
+            "level": "warning",
+            "message": f"{name} 涨幅过快：{rise_rate:.3f}m/h，阈值：{rate_threshold}m/h"
+        })
+    return alerts
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class StationMonitor:
+    """按预警引擎槽位组织的站点当前水位、预警状态与增量事件日志"""
+
+    def __init__(self, engine: AlertEngine, log_size: int = LOG_SIZE, level_epsilon: float = LEVEL_EPSILON):
+        self.engine = engine
+        self.level_epsilon = level_epsilon
+        self.seq = 0
+        self._log = deque(maxlen=log_size)
+        self._lock = threading.Lock()
+        self._waiters = set()
+        self._capacity = 0
+        self._allocate(len(engine.threshold))
+        self.slope = RollingSlope()
+        self.stats = AlertStatistics()
+
+    def _allocate(self, capacity: int):
+        count = self._capacity
+        arrays = {
+            "level": np.full(capacity, np.nan),
+            "rise_rate": np.full(capacity, np.nan),
+            "sent_level": np.full(capacity, np.nan),  # 最近一次推送的水位
+            "state": np.zeros(capacity, dtype=np.int8),
+            "state_seq": np.zeros(capacity, dtype=np.int64),  # 预警状态最近一次变化时的序号
+            "level_since": np.zeros(capacity),  # 水位预警的进入时间
+            "rate_since": np.zeros(capacity),  # 涨幅预警的进入时间
+        }
+        for name, array in arrays.items():
+            if count:
+                array[:count] = getattr(self, name)[:count]
+            setattr(self, name, array)
+        self._capacity = capacity
+
+    def update(self, names: List[str], levels, timestamps=None) -> Optional[dict]:
+        """
+        处理一个周期的读数
+
+        Args:
+            names: 站点名称列表（同一站点出现多次时只取最后一条；
+                时间不晚于该站点上一条读数或水位非有限的读数忽略）
+            levels: 对应的水位（米）
+            timestamps: 读数时间（Unix 秒），为空时使用当前时间
+
+        Returns:
+            生成的增量事件；没有需要推送的变化时返回 None
+        """
+        slots = self.engine.slots(names)
+        levels = np.asarray(levels, dtype=np.float64)
+        now = time.time()
+        times = np.full(len(slots), now) if timestamps is None else np.asarray(timestamps, dtype=np.float64)
+        # 去重：保留每个站点的最后一条
+        _, last = np.unique(slots[::-1], return_index=True)
+        keep = np.sort(len(slots) - 1 - last)
+        slots, levels, times = slots[keep], levels[keep], times[keep]
+        with self._lock:
+            if len(self.engine) > self._capacity:
+                self._allocate(len(self.engine.threshold))
+            # 乱序、重复或非有限的读数与涨幅回归一样忽略，不改写水位、不参与状态转换
+            fresh = self.slope.accepts(slots, times, levels)
+            slots, levels, times = slots[fresh], levels[fresh], times[fresh]
+            rise_rates = self.slope.update(slots, times, levels)
+            state = self._next_state(slots, levels, rise_rates, times)
+            self.level[slots] = levels
+            self.rise_rate[slots] = rise_rates
+            # 从未推送过的站点（sent_level 为 NaN）比较结果为 False，也视为有变化
+            moved = slots[~(np.abs(levels - self.sent_level[slots]) < self.level_epsilon)]
+            self.sent_level[moved] = self.level[moved]
+            event = self._commit(slots, state, moved, now)
+        if event is not None:
+            self._notify()
+        return event
+
+    def refresh(self, names: Optional[List[str]] = None) -> Optional[dict]:
+        """
+        阈值或启用状态修改后，按各站点当前的水位与涨幅重新评估预警状态
+
+        状态转换规则与读数到达时相同（停用立即解除，其余按回差与冷却时间），
+        统计与推送立即反映新设置，不必等下一条读数
+
+        Args:
+            names: 设置发生变化的站点；为空时重新评估所有站点（如修改默认阈值）
+
+        Returns:
+            生成的增量事件；没有状态变化时返回 None
+        """
+        slots = None if names is None else self.engine.slots(names)
+        now = time.time()
+        with self._lock:
+            if len(self.engine) > self._capacity:
+                self._allocate(len(self.engine.threshold))
+            if slots is None:
+                slots = np.arange(len(self.engine))
+            # 还没有读数的站点保持正常
+            slots = np.unique(slots[np.isfinite(self.level[slots])])
+            state = self._next_state(slots, self.level[slots], self.rise_rate[slots], np.full(len(slots), now))
+            event = self._commit(slots, state, slots[:0], now)
+        if event is not None:
+            self._notify()
+        return event
+
+    def _commit(self, slots, state, moved, now) -> Optional[dict]:
+        """写入新的预警状态、记录统计，并把状态变化与水位变化合成增量事件；调用方持有锁"""
+        transition = state != self.state[slots]
+        changed = slots[transition]
+        if len(changed):
+            self.stats.record(self.state[changed], state[transition], now)
+        self.state[slots] = state
+        if not len(changed) and not len(moved):
+            return None
+
+        self.seq += 1
+        self.state_seq[changed] = self.seq
+        event = {
+            "type": "delta",
+            "seq": self.seq,
+            "time": time.time(),
+            "levels": self._levels(moved),
+            "alerts": self._alerts(changed),
+        }
+        self._log.append(event)
+        return event
+
+    def _next_state(self, slots, levels, rise_rates, times):
+        """带回差与冷却时间的预警状态转换；触发条件即预警引擎的 evaluate()，这里只加上解除规则"""
+        engine = self.engine
+        enabled = engine.enabled[slots]
+        threshold, rate_threshold = engine.threshold[slots], engine.rate_threshold[slots]
+        level_above, rate_above = engine.evaluate(slots, levels, rise_rates)
+        previous = self.state[slots]
+        was_level, was_rate = (previous & ALERT_LEVEL) > 0, (previous & ALERT_RATE) > 0
+        # NaN（涨幅读数不足）既不触发也不解除
+        level = self._condition(was_level, level_above, levels < threshold - LEVEL_HYSTERESIS,
+                                times - self.level_since[slots], enabled)
+        rate = self._condition(was_rate, rate_above,
+                               rise_rates < rate_threshold * (1 - RATE_HYSTERESIS_RATIO),
+                               times - self.rate_since[slots], enabled)
+        for raised, since in ((level & ~was_level, self.level_since), (rate & ~was_rate, self.rate_since)):
+            since[slots[raised]] = times[raised]
+        return (level * ALERT_LEVEL | rate * ALERT_RATE).astype(np.int8)
+
+    @staticmethod
+    def _condition(active, above, below_clear, held, enabled):
+        return enabled & np.where(active, ~(below_clear & (held >= ALERT_COOLDOWN_SECONDS)), above)
+
+    def _levels(self, slots) -> dict:
+        names = self.engine.names
+        return {names[slot]: round(float(self.level[slot]), 3) for slot in slots}
+
+    def _alerts(self, slots) -> dict:
+        return {self.engine.names[slot]: self._alert_info(slot) for slot in slots}
+
+    def _alert_info(self, slot: int) -> dict:
+        name, state = self.engine.names[slot], int(self.state[slot])
+        level, rise_rate = float(self.level[slot]), float(self.rise_rate[slot])
+        return {
+            "status": "alert" if state else "normal",
+            "alerts": describe_alerts(name, state, level, rise_rate,
+                                      float(self.engine.threshold[slot]), float(self.engine.rate_threshold[slot])),
+        }
+
+    def station_status(self, name: str) -> dict:
+        """单个站点当前的水位、服务端涨幅与（带回差的）预警状态"""
+        slot = int(self.engine.slots([name])[0])
+        with self._lock:
+            if len(self.engine) > self._capacity:
+                self._allocate(len(self.engine.threshold))
+            level, rise_rate = float(self.level[slot]), float(self.rise_rate[slot])
+            return {
+                "level": level if np.isfinite(level) else None,
+                "rise_rate": rise_rate if np.isfinite(rise_rate) else None,
+                **self._alert_info(slot),
+            }
+
+    def _notify(self):
+        # 唤醒所有等待中的客户端；读数可能来自其他线程，经各自的事件循环回调设置结果
+        with self._lock:
+            waiters, self._waiters = self._waiters, set()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def snapshot(self) -> dict:
+        """全量快照：所有已知站点的水位与处于预警中的站点"""
+        with self._lock:
+            count = len(self.engine)
+            known = np.flatnonzero(np.isfinite(self.level[:count]))
+            return {
+                "type": "snapshot",
+                "seq": self.seq,
+                "time": time.time(),
+                "levels": self._levels(known),
+                "alerts": self._alerts(np.flatnonzero(self.state[:count])),
+            }
+
+    def states_since(self, seq: Optional[int]):
+        """
+        序号 seq 之后预警状态发生过变化的站点及其当前状态
+
+        Returns:
+            (当前序号, {站点名: 状态}, 是否为全量)；seq 为空或大于当前序号（服务已重启）时
+            返回所有处于预警中的站点，调用方应先清空本地状态
+        """
+        with self._lock:
+            count = len(self.engine)
+            reset = seq is None or seq > self.seq
+            if reset:
+                slots = np.flatnonzero(self.state[:count])
+            else:
+                slots = np.flatnonzero(self.state_seq[:count] > seq)
+            return self.seq, self._alerts(slots), reset
+
+    def message_since(self, seq: int) -> Optional[dict]:
+        """
+        序号 seq 之后的全部变化，合并为一条消息
+
+        Returns:
+            增量消息；seq 已被日志淘汰（或为负）时返回快照；没有新事件时返回 None
+        """
+        with self._lock:
+            if 0 <= seq == self.seq:
+                return None
+            oldest = self._log[0]["seq"] if self._log else self.seq + 1
+            if seq < 0 or seq < oldest - 1 or seq > self.seq:
+                events = None
+            else:
+                # 日志中的序号连续，直接按偏移定位
+                events = list(islice(self._log, seq - oldest + 1, None))
+        if events is None:
+            return self.snapshot()
+        if len(events) == 1:
+            return events[0]
+        merged = {"type": "delta", "seq": events[-1]["seq"], "time": events[-1]["time"],
+                  "levels": {}, "alerts": {}}
+        for event in events:
+            merged["levels"].update(event["levels"])
+            merged["alerts"].update(event["alerts"])
+        return merged
+
+    async def wait(self, seq: int, timeout: float) -> bool:
+        """等待序号 seq 之后的新事件，超时返回 False"""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._lock:
+            if self.seq != seq:
+                return True
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    async def messages(self, since: Optional[int] = None, heartbeat: float = HEARTBEAT_SECONDS):
+        """
+        客户端消息流：先发送快照（或从 since 续传），之后发送合并后的增量
+
+        只在消费方取走上一条消息后才读取日志，发送慢的客户端自然得到合并后的更大批次；
+        heartbeat 秒内没有事件时产出 None，调用方据此发送心跳
+        """
+        cursor = -1 if since is None else since
+        while True:
+            message = self.message_since(cursor)
+            if message is None:
+                if not await self.wait(cursor, heartbeat):
+                    yield None
+                continue
+            cursor = message["seq"]
+            yield message
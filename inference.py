@@ -0,0 +1,95 @@
+import numpy as np
+import torch
+
+# 输入窗口的形状：3天 × 5个特征
+# 阳朔11点的水位, 阳朔11点的流量, 阳朔日均流量，桂林日均流量，潮田日均流量
+WINDOW_DAYS = 3
+NUM_FEATURES = 5
+
+
+def validate_window(features):
+    """检查单个窗口的形状与取值，合法时返回 None，否则返回错误信息"""
+    if len(features) != WINDOW_DAYS:
+        return "输入必须包含3天的特征数据"
+    for day_features in features:
+        if len(day_features) != NUM_FEATURES:
+            return "每天的特征必须包含5个数值"
+    if not np.all(np.isfinite(np.asarray(features, dtype=np.float64))):
+        return "特征中包含非法数值（NaN 或 Inf）"
+    return None
+
+
+def predict_array(model, scaler_features, scaler_target, features_array, device='cpu'):
+    """对已校验的原始特征数组 (N, 3, 5) 做一次批量预测，返回长度 N 的水位数组（米）"""
+    # (N, 3, 5) -> (N*3, 5) 一次标准化 -> (N, 3, 5)
+    features_scaled = scaler_features.transform(
+        features_array.reshape(-1, NUM_FEATURES)
+    ).reshape(-1, WINDOW_DAYS, NUM_FEATURES)
+    input_tensor = torch.tensor(features_scaled, dtype=torch.float32).to(device)
+
+    with torch.no_grad():
+        prediction_scaled = model(input_tensor)
+
+    prediction = scaler_target.inverse_transform(
+        prediction_scaled.cpu().numpy().reshape(-1, 1)
+    )
+    return prediction.reshape(-1)
+
+
+def run_windows(predict_fn, windows):
+    """
+    批量预测多个窗口
+
+    所有合法窗口组成一个数组，交给 predict_fn 一次完成预测；
+    非法窗口单独记录错误，不影响其余窗口。
+
+    Args:
+        predict_fn: 接收 (N, 3, 5) 原始特征数组、返回长度 N 水位数组的函数；
+            也可以返回 (N, K) 数组（如不确定性统计量），结果按行对应窗口
+        windows: 窗口列表
+
+    Returns:
+        (predictions, errors)：predictions 为长度 N 的数组（非法窗口处为 NaN），
+        errors 为 {窗口下标: 错误信息}
+    """
+    predictions = np.full(len(windows), np.nan)
+    errors = {}
+    valid_index = []
+    for i, window in enumerate(windows):
+        try:
+            error = validate_window(window)
+        except (TypeError, ValueError) as e:
+            error = str(e)
+        if error is None:
+            valid_index.append(i)
+        else:
+            errors[i] = error
+
+    if not valid_index:
+        return predictions, errors
+
+    features_array = np.array([windows[i] for i in valid_index], dtype=np.float64)
+    output = np.asarray(predict_fn(features_array))
+    if output.ndim > 1:
+        predictions = np.full((len(windows),) + output.shape[1:], np.nan)
+    predictions[valid_index] = output
+    return predictions, errors
+
+
+def predict_windows(model, scaler_features, scaler_target, windows, device='cpu'):
+    """用 PyTorch 模型与 sklearn 标准化器批量预测多个窗口，返回值同 run_windows"""
+    return run_windows(
+        lambda features_array: predict_array(model, scaler_features, scaler_target, features_array, device),
+        windows,
+    )
+
+
+def format_batch_results(predictions, errors):
+    """将批量预测结果整理为逐条返回的列表"""
+    results = []
+    for i, value in enumerate(predictions):
+        if i in errors:
+            results.append({"index": i, "error": errors[i]})
+        else:
+            results.append({"index": i, "predicted_water_level": round(float(value), 2)})
+    return results
@@ -0,0 +1,170 @@
+"""
+观测数据批量导入：流式解析 CSV / NDJSON 上传并写入站点存储
+
+- 按块接收字节流，只保留未结束的最后一行，内存占用与上传大小无关
+- 每累计 batch_rows 行做一次批量解析、校验与写入：
+  数值列整体转换为 float64，日期用 timeseries_store.parse_timestamps 批量解析，
+  非法行用布尔掩码剔除，不逐行构造对象
+- 拒绝的行：字段缺失、数值或日期无法解析、NaN / Inf、时间戳不晚于已写入的数据
+  （存储只追加，乱序与重复行一律拒绝）
+
+CSV 首行为表头，列名同 dataset 文件（date + data_utils.FEATURE_COLUMNS，顺序不限）；
+NDJSON 每行一个对象，键名同 CSV 列名。
+"""
+import json
+
+import numpy as np
+
+from data_utils import FEATURE_COLUMNS
+from timeseries_store import parse_timestamps
+
+DEFAULT_BATCH_ROWS = 10_000
+MAX_LINE_BYTES = 64 * 1024
+# 返回给调用方的拒绝明细上限
+MAX_REJECT_SAMPLES = 20
+FORMATS = ('csv', 'ndjson')
+
+
+def to_float(values):
+    """字符串或任意值的一维序列转 float64，无法转换的置为 NaN"""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        result = np.empty(len(values))
+        for i, value in enumerate(values):
+            try:
+                result[i] = float(value)
+            except (TypeError, ValueError):
+                result[i] = np.nan
+        return result
+
+
+def parse_csv_batch(lines, columns):
+    """
+    解析一批 CSV 数据行
+
+    Returns:
+        (日期数组, 特征 (n, 5), 字段完整标记)
+    """
+    fields = [line.split(',') for line in lines]
+    width = len(columns)
+    complete = np.array([len(row) == width for row in fields], dtype=bool)
+    table = np.array([row if len(row) == width else [''] * width for row in fields], dtype=str).reshape(-1, width)
+    table = np.char.strip(table)
+    dates = table[:, columns.index('date')]
+    features = np.column_stack([to_float(table[:, columns.index(name)]) for name in FEATURE_COLUMNS])
+    return dates, features, complete
+
+
+def parse_ndjson_batch(lines):
+    """解析一批 NDJSON 行，返回值同 parse_csv_batch"""
+    try:
+        records = json.loads('[' + ','.join(lines) + ']')
+        complete = np.ones(len(records), dtype=bool)
+    except ValueError:
+        records, complete = [], np.ones(len(lines), dtype=bool)
+        for i, line in enumerate(lines):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                records.append({})
+                complete[i] = False
+    complete &= np.array([isinstance(r, dict) for r in records], dtype=bool)
+    records = [r if isinstance(r, dict) else {} for r in records]
+    dates = np.array([str(r.get('date', '')) for r in records], dtype=str)
+    features = np.column_stack([to_float([r.get(name) for r in records]) for name in FEATURE_COLUMNS])
+    return dates, features, complete
+
+
+class IngestSession:
+    """
+    一次上传的导入会话
+
+    feed() 接收任意切分的字节块，finish() 处理剩余数据并返回统计
+    """
+
+    def __init__(self, series, fmt='csv', batch_rows=DEFAULT_BATCH_ROWS):
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的格式: {fmt}，可选 {', '.join(FORMATS)}")
+        self.series = series
+        self.fmt = fmt
+        self.batch_rows = batch_rows
+        self.accepted = 0
+        self.rejected = 0
+        self.rejects = []
+        self._columns = None
+        self._tail = b''
+        self._lines = []
+        self._line_number = 0  # 已读入的行数（含 CSV 表头）
+
+    def feed(self, chunk):
+        data = self._tail + chunk
+        lines = data.split(b'\n')
+        self._tail = lines.pop()
+        if len(self._tail) > MAX_LINE_BYTES:
+            raise ValueError(f"单行超过 {MAX_LINE_BYTES} 字节")
+        for line in lines:
+            self._add_line(line)
+
+    def finish(self):
+        if self._tail:
+            self._add_line(self._tail)
+            self._tail = b''
+        self._flush()
+        return self.summary()
+
+    def _add_line(self, raw):
+        self._line_number += 1
+        line = raw.decode('utf-8-sig' if self._line_number == 1 else 'utf-8', errors='replace').strip()
+        if not line:
+            return
+        if self.fmt == 'csv' and self._columns is None:
+            columns = [c.strip() for c in line.split(',')]
+            missing = [c for c in ['date'] + FEATURE_COLUMNS if c not in columns]
+            if missing:
+                raise ValueError(f"CSV 表头缺少列: {', '.join(missing)}")
+            self._columns = columns
+            return
+        self._lines.append((self._line_number, line))
+        if len(self._lines) >= self.batch_rows:
+            self._flush()
+
+    def _reject(self, line_numbers, reason):
+        self.rejected += len(line_numbers)
+        for number in line_numbers[:MAX_REJECT_SAMPLES - len(self.rejects)]:
+            self.rejects.append({"line": int(number), "reason": reason})
+
+    def _flush(self):
+        if not self._lines:
+            return
+        numbers = np.array([number for number, _ in self._lines], dtype=np.int64)
+        lines = [line for _, line in self._lines]
+        self._lines = []
+
+        if self.fmt == 'csv':
+            dates, features, ok = parse_csv_batch(lines, self._columns)
+        else:
+            dates, features, ok = parse_ndjson_batch(lines)
+        self._reject(numbers[~ok], "字段缺失或格式错误")
+
+        finite = np.isfinite(features).all(axis=1)
+        self._reject(numbers[ok & ~finite], "特征无法解析或为 NaN / Inf")
+        ok &= finite
+
+        timestamps, parsed = parse_timestamps(dates)
+        self._reject(numbers[ok & ~parsed], "日期无法解析")
+        ok &= parsed
+
+        # 只追加：时间戳必须晚于已写入的最后一行与本批之前所有合法行；检查与写入在存储的锁内完成
+        if ok.any():
+            ordered = self.series.append_ordered(timestamps[ok], features[ok])
+            self._reject(numbers[ok][~ordered], "时间戳不晚于已有数据（重复或乱序）")
+            self.accepted += int(ordered.sum())
+
+    def summary(self):
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "rejects": self.rejects,
+            "total_rows": len(self.series),
+        }
@@ -1,9 +1,23 @@
-from fastapi import FastAPI
+import os
+import threading
+import time
+from fastapi import FastAPI, Request
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from typing import Optional
 import torch
 import numpy as np
-import joblib
-from model_definition import Net
+from inference import run_windows, format_batch_results
+from batching import MicroBatcher
+from prediction_cache import PredictionCache, model_file_version
+from model_registry import create_default_registry
+from forecast import forecast_windows
+from multi_station import MULTI_STATION_PATH, load_multi_station
+from online_tuning import OnlineTuner
+from ingest import IngestSession, DEFAULT_BATCH_ROWS
+from timeseries_store import TimeSeriesStore, DEFAULT_STORE_DIR
+from daily_features import DailyFeatureStore, DEFAULT_DAILY_DIR
+from uncertainty import DEFAULT_SAMPLES, DEFAULT_QUANTILES, check_request, format_uncertainty
 
 # 初始化FastAPI应用
 app = FastAPI(title="水位预测API")
@@ -16,27 +30,173 @@ class PredictionRequest(BaseModel):
         [0.0, 0.0, 0.0, 0.0, 0.0],
         [0.0, 0.0, 0.0, 0.0, 0.0]
     ]
+    model: Optional[str] = None  # 模型版本名，不填使用当前版本
+    # 不确定性模式：MC-dropout 采样 samples 次，返回均值与 quantiles 分位数
+    uncertainty: bool = False
+    samples: int = DEFAULT_SAMPLES
+    quantiles: list[float] = list(DEFAULT_QUANTILES)
 
-# 模型配置参数（与训练时保持一致）
-input_size = 5
-hidden_size = 32
-num_layers = 2
-dropout_rate = 0.3
+
+# 批量预测输入：N 个 3×5 的特征窗口
+class BatchPredictionRequest(BaseModel):
+    windows: list[list[list[float]]]
+    model: Optional[str] = None
+    uncertainty: bool = False
+    samples: int = DEFAULT_SAMPLES
+    quantiles: list[float] = list(DEFAULT_QUANTILES)
+
+
+# 多步预测输入：N 个窗口，预测未来 horizon 天
+class ForecastRequest(BaseModel):
+    windows: list[list[list[float]]]
+    horizon: int = 7
+    # 可选：每个窗口未来各天的流量假设 [阳朔11点流量, 阳朔日均流量, 桂林日均流量, 潮田日均流量]
+    # 至少提供 horizon-1 天；不提供时沿用窗口最后一天的流量
+    future_flows: Optional[list[Optional[list[list[float]]]]] = None
+    model: Optional[str] = None
+
+# 流式观测输入：每个站点当天的5个特征值
+class StreamObserveRequest(BaseModel):
+    observations: dict[str, list[float]]
+    tag: Optional[str] = None  # 检查点标签，通常为日期
+
+
+class StreamRollbackRequest(BaseModel):
+    station: str
+    tag: Optional[str] = None
+
+# 在线微调输入：按时间顺序的若干天观测，每天5个特征值
+class OnlineObserveRequest(BaseModel):
+    observations: list[list[float]]
+
+# 原始读数输入（按列组织）：一个测站任意时刻的水位 / 流量，缺失的量填 null
+class ReadingsRequest(BaseModel):
+    gauge: str
+    times: list[str]
+    levels: Optional[list[Optional[float]]] = None
+    flows: Optional[list[Optional[float]]] = None
+
+
+# 按站点与日期预测：窗口由服务端从已存储的观测组装
+class StationDatePredictionRequest(BaseModel):
+    station: str
+    date: str  # 预测目标日期，使用该日期前 3 天的观测
+    model: Optional[str] = None
+
+# 多站点预测输入：各站点一个 3×5 窗口
+class StationsPredictionRequest(BaseModel):
+    windows: dict[str, list[list[float]]]
+
+# 模型管理请求
+class ModelRegisterRequest(BaseModel):
+    name: str
+    artifact_dir: Optional[str] = None  # train.py 产出的版本目录，提供时忽略下面的路径
+    model_path: Optional[str] = None
+    features_path: Optional[str] = None
+    target_path: Optional[str] = None
+    config: Optional[dict] = None  # input_size / hidden_size / num_layers / dropout
+    activate: bool = False
 
 # 初始化设备
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-# 加载模型
-model = Net(input_size=input_size, hidden_size=hidden_size, 
-            num_layers=num_layers, dropout=dropout_rate)
-state_dict = torch.load('./product/best_lstm_model.pth', map_location=device,weights_only=True)
-model.load_state_dict(state_dict)
-model.to(device)
-model.eval()  # 开启评估模式
+# 线程配置：多进程部署时由 serve.py 为每个 worker 指定，避免多个 worker 争抢 CPU
+if os.getenv("TORCH_NUM_THREADS"):
+    torch.set_num_threads(int(os.getenv("TORCH_NUM_THREADS")))
+if os.getenv("TORCH_INTEROP_THREADS"):
+    torch.set_num_interop_threads(int(os.getenv("TORCH_INTEROP_THREADS")))
+
+# 模型注册表：首次使用时加载并预热，支持多版本常驻与原子热切换
+# PREDICT_ENGINE 可选 eager / torchscript / quantized / onnx（可先运行 python engines.py 比较）
+# CPU 上默认以内存映射方式加载权重（.pth 与 .lstm 均适用），多个 worker 进程共享同一份只读权重（MODEL_MMAP=0 关闭）
+registry = create_default_registry(
+    device=device,
+    engine_name=os.getenv("PREDICT_ENGINE", "eager"),
+    mmap=device.type == 'cpu' and os.getenv("MODEL_MMAP", "1") == "1",
+    max_resident=int(os.getenv("MODEL_MAX_RESIDENT", "3")),
+)
+
 
-# 加载数据标准化器
-scaler_features = joblib.load('./product/scaler_features.pkl')
-scaler_target = joblib.load('./product/scaler_target.pkl')
+def active_predict(features_array):
+    """使用当前版本预测；每次调用时取一次当前版本，热切换不影响进行中的请求"""
+    return registry.get().predict(features_array)
+
+
+def resolve_predict(model_name):
+    """按请求中的模型名路由，未指定时使用当前版本"""
+    if model_name is None or model_name == registry.active_name:
+        return active_predict
+    return registry.get(model_name).predict
+
+
+def active_version_id():
+    """当前版本标识 + 权重文件版本，切换版本或替换权重文件后缓存自动失效"""
+    active = registry.get()
+    return f"{active.version_id}:{model_file_version(active.spec['model_path'])}"
+
+# 站点观测存储：/ingest 写入，STORE_DIR 指定目录
+store = TimeSeriesStore(os.getenv("STORE_DIR", DEFAULT_STORE_DIR))
+
+# 原始读数的每日聚合：/readings 增量更新，/predict/station 直接按日期读取窗口
+# 没有原始读数的站点回退到上面站点存储中的按日观测
+daily_store = DailyFeatureStore(os.getenv("DAILY_DIR", DEFAULT_DAILY_DIR), series_store=store)
+
+# 多站点模型（python multi_station.py train 产出）：首次请求 /predict/stations 时加载
+# MULTI_STATION_MODEL 指定工件路径，默认 ./product/multi_station.pt
+multi_station_path = os.getenv("MULTI_STATION_MODEL", MULTI_STATION_PATH)
+multi_station_lock = threading.Lock()
+multi_station_predictor = None
+
+
+def get_multi_station():
+    global multi_station_predictor
+    if multi_station_predictor is None:
+        with multi_station_lock:
+            if multi_station_predictor is None:
+                if not os.path.exists(multi_station_path):
+                    raise FileNotFoundError(f"多站点模型不存在: {multi_station_path}")
+                multi_station_predictor = load_multi_station(
+                    multi_station_path, device, mmap=device.type == 'cpu' and os.getenv("MODEL_MMAP", "1") == "1"
+                )
+    return multi_station_predictor
+
+# 可选的在线微调：ONLINE_TUNE=1 开启，新观测在后台子进程中微调当前模型，留出集改善时发布
+# ONLINE_TUNE_STATION 站点的 /stream/observe 观测也会送入微调缓冲区
+# 微调器只在本进程内切换版本，多 worker 部署时应只在一个实例上开启
+online_tuner = None
+online_tune_station = os.getenv("ONLINE_TUNE_STATION", "阳朔")
+if os.getenv("ONLINE_TUNE", "0") == "1":
+    online_tuner = OnlineTuner(
+        registry,
+        buffer_days=int(os.getenv("ONLINE_TUNE_BUFFER_DAYS", "180")),
+        holdout=int(os.getenv("ONLINE_TUNE_HOLDOUT", "14")),
+        validation=int(os.getenv("ONLINE_TUNE_VALIDATION", "14")),
+        min_new_days=int(os.getenv("ONLINE_TUNE_MIN_NEW_DAYS", "7")),
+        epochs=int(os.getenv("ONLINE_TUNE_EPOCHS", "20")),
+        lr=float(os.getenv("ONLINE_TUNE_LR", "1e-4")),
+    )
+
+# 可选的动态微批：并发的单条 /predict 请求合并为一次批量前向
+# PREDICT_MICRO_BATCH=1 开启；PREDICT_BATCH_SIZE 为每批上限，PREDICT_BATCH_WAIT_MS 为最长等待时间
+micro_batcher = None
+if os.getenv("PREDICT_MICRO_BATCH", "0") == "1":
+    micro_batcher = MicroBatcher(
+        lambda windows: run_windows(active_predict, windows),
+        max_batch_size=int(os.getenv("PREDICT_BATCH_SIZE", "32")),
+        max_wait_ms=float(os.getenv("PREDICT_BATCH_WAIT_MS", "2")),
+    )
+
+# 预测结果缓存：PREDICT_CACHE_SIZE 为最大条目数（0 关闭），PREDICT_CACHE_TTL 为有效期（秒）
+# 缓存键包含当前模型版本，切换版本或模型文件被替换后缓存自动失效；只缓存当前版本的结果
+prediction_cache = None
+if int(os.getenv("PREDICT_CACHE_SIZE", "4096")) > 0:
+    prediction_cache = PredictionCache(
+        maxsize=int(os.getenv("PREDICT_CACHE_SIZE", "4096")),
+        ttl=float(os.getenv("PREDICT_CACHE_TTL", "3600")),
+        decimals=int(os.getenv("PREDICT_CACHE_DECIMALS", "4")),
+        version_fn=active_version_id,
+        version_check_interval=0,
+    )
 
 # 定义预测接口
 @app.post("/predict", summary="预测水位值")
@@ -49,26 +209,291 @@ def predict(request: PredictionRequest):
             if len(day_features) != 5:
                 return {"error": "每天的特征必须包含5个数值"}
         
-        # 数据处理与预测
-        features_array = np.array(request.features).reshape(-1, 5)
-        features_scaled = scaler_features.transform(features_array)
-        input_tensor = torch.tensor(features_scaled, dtype=torch.float32).unsqueeze(0).to(device)
-        
-        with torch.no_grad():
-            prediction_scaled = model(input_tensor)
+        if request.uncertainty:
+            check_request(request.samples, request.quantiles)
+            features_array = np.array(request.features, dtype=np.float64).reshape(1, 3, 5)
+            row = registry.get(request.model).predict_distribution(
+                features_array, request.samples, request.quantiles)[0]
+            return {
+                "predicted_water_level": round(float(row[0]), 2),
+                "uncertainty": format_uncertainty(row, request.samples, request.quantiles),
+                "message": "预测成功"
+            }
+
+        predict_fn = resolve_predict(request.model)
+        use_active = predict_fn is active_predict
+
+        prediction = None
+        if prediction_cache is not None and use_active:
+            prediction, cache_key = prediction_cache.get(request.features)
+
+        if prediction is None:
+            if micro_batcher is not None and use_active:
+                prediction = micro_batcher.predict(request.features)
+            else:
+                # 数据处理与预测（标准化、前向、反标准化由推理引擎完成）
+                features_array = np.array(request.features).reshape(1, 3, 5)
+                prediction = predict_fn(features_array).item()
+            if prediction_cache is not None and use_active:
+                prediction_cache.put(cache_key, prediction)
         
-        # 反标准化并返回结果
-        prediction = scaler_target.inverse_transform(
-            prediction_scaled.cpu().numpy().reshape(-1, 1)
+        return {
+            "predicted_water_level": round(prediction, 2),
+            "message": "预测成功"
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+# 定义批量预测接口
+@app.post("/predict/batch", summary="批量预测水位值")
+def predict_batch(request: BatchPredictionRequest):
+    try:
+        # 所有窗口一次标准化、一次前向；单个窗口出错不影响其他窗口
+        if request.uncertainty:
+            check_request(request.samples, request.quantiles)
+            version = registry.get(request.model)
+            rows, errors = run_windows(
+                lambda features_array: version.predict_distribution(
+                    features_array, request.samples, request.quantiles),
+                request.windows,
+            )
+            results = format_batch_results(rows[:, 0] if rows.ndim > 1 else rows, errors)
+            for result in results:
+                if "error" not in result:
+                    result["uncertainty"] = format_uncertainty(
+                        rows[result["index"]], request.samples, request.quantiles)
+            return {
+                "results": results,
+                "success_count": len(request.windows) - len(errors),
+                "error_count": len(errors),
+                "message": "批量预测完成"
+            }
+
+        predict_fn = resolve_predict(request.model)
+        if prediction_cache is not None and predict_fn is active_predict:
+            predictions, errors = prediction_cache.run(
+                lambda windows: run_windows(predict_fn, windows), request.windows
+            )
+        else:
+            predictions, errors = run_windows(predict_fn, request.windows)
+        return {
+            "results": format_batch_results(predictions, errors),
+            "success_count": len(request.windows) - len(errors),
+            "error_count": len(errors),
+            "message": "批量预测完成"
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+# 多站点预测接口：所有站点的窗口合并为一次前向
+@app.post("/predict/stations", summary="多站点水位预测")
+def predict_stations(request: StationsPredictionRequest):
+    try:
+        predictions, errors = get_multi_station().predict_stations(request.windows)
+        return {
+            "predictions": {station: round(value, 2) for station, value in predictions.items()},
+            "errors": errors,
+            "success_count": len(predictions),
+            "error_count": len(errors),
+            "message": "预测成功"
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+# 按站点与日期预测：服务端从每日聚合或站点存储中组装 3 天窗口
+@app.post("/predict/station", summary="按站点与日期预测水位")
+def predict_station(request: StationDatePredictionRequest):
+    try:
+        window, source = daily_store.assemble_window(request.station, request.date)
+        prediction = resolve_predict(request.model)(window.reshape(1, 3, 5)).item()
+        return {
+            "station": request.station,
+            "date": request.date,
+            "predicted_water_level": round(prediction, 2),
+            "features": np.round(window, 4).tolist(),
+            "source": source,
+            "message": "预测成功"
+        }
+    except KeyError as e:
+        return {"error": str(e.args[0])}
+    except Exception as e:
+        return {"error": str(e)}
+
+# 多步预测接口：服务端自回归前推，所有窗口每一步合并为一次前向
+@app.post("/forecast", summary="多步水位预测")
+def forecast(request: ForecastRequest):
+    try:
+        trajectories, errors = forecast_windows(
+            resolve_predict(request.model), request.windows, request.horizon, request.future_flows
         )
-        
+        results = []
+        for i, trajectory in enumerate(trajectories):
+            if i in errors:
+                results.append({"index": i, "error": errors[i]})
+            else:
+                results.append({
+                    "index": i,
+                    "forecast": [
+                        {"day": day + 1, "predicted_water_level": round(float(value), 2)}
+                        for day, value in enumerate(trajectory)
+                    ]
+                })
+        return {
+            "horizon": request.horizon,
+            "results": results,
+            "success_count": len(request.windows) - len(errors),
+            "error_count": len(errors),
+            "message": "预测成功"
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.get("/predict/cache/stats", summary="预测缓存统计")
+def predict_cache_stats():
+    if prediction_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **prediction_cache.stats()}
+
+# 流式推理接口：提交各站点当天观测，返回已累计满3天的站点的下一天预测
+@app.post("/stream/observe", summary="流式提交观测并预测")
+def stream_observe(request: StreamObserveRequest):
+    try:
+        predictions = registry.streaming.observe(request.observations, tag=request.tag)
+        if online_tuner is not None and online_tune_station in request.observations:
+            online_tuner.observe(request.observations[online_tune_station])
         return {
-            "predicted_water_level": round(prediction.item(), 2),
+            "predictions": {
+                station: None if value is None else round(value, 2)
+                for station, value in predictions.items()
+            },
             "message": "预测成功"
         }
     except Exception as e:
         return {"error": str(e)}
 
+
+@app.post("/stream/rollback", summary="回滚站点流式状态")
+def stream_rollback(request: StreamRollbackRequest):
+    try:
+        registry.streaming.rollback(request.station, request.tag)
+        return {"message": f"已回滚 {request.station} 到检查点 {request.tag}"}
+    except KeyError as e:
+        return {"error": str(e.args[0])}
+
+# ==================== 数据导入 ====================
+
+# 流式导入观测：请求体为 CSV（首行表头）或 NDJSON，可分块上传，任意大小
+# 每 INGEST_BATCH_ROWS 行批量校验并写入一次，解析与写入在线程池中执行，不阻塞事件循环
+@app.post("/ingest/{station}", summary="批量导入站点观测")
+async def ingest(station: str, request: Request, format: str = "csv"):
+    try:
+        session = IngestSession(store.series(station), format,
+                                int(os.getenv("INGEST_BATCH_ROWS", str(DEFAULT_BATCH_ROWS))))
+        async for chunk in request.stream():
+            if chunk:
+                await run_in_threadpool(session.feed, chunk)
+        summary = await run_in_threadpool(session.finish)
+        return {"station": station, **summary, "message": "导入完成"}
+    except Exception as e:
+        return {"error": str(e)}
+
+# 原始读数：按所在日期增量更新流量累加与最接近 11:00 的水位 / 流量
+@app.post("/readings", summary="提交测站原始读数")
+def add_readings(request: ReadingsRequest):
+    try:
+        accepted, rejected = daily_store.add_readings(request.gauge, request.times,
+                                                      request.levels, request.flows)
+        return {"gauge": request.gauge, "accepted": accepted, "rejected": rejected, "message": "已更新每日聚合"}
+    except Exception as e:
+        return {"error": str(e)}
+
+# ==================== 在线微调 ====================
+
+@app.post("/online/observe", summary="提交观测用于在线微调")
+def online_observe(request: OnlineObserveRequest):
+    if online_tuner is None:
+        return {"error": "在线微调未开启（ONLINE_TUNE=1）"}
+    try:
+        online_tuner.observe(request.observations)
+        return {"message": "已加入微调缓冲区", **online_tuner.status()}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/online/status", summary="在线微调状态")
+def online_status():
+    if online_tuner is None:
+        return {"enabled": False}
+    return {"enabled": True, **online_tuner.status()}
+
+# ==================== 模型管理 ====================
+
+@app.get("/models", summary="模型版本列表")
+def list_models():
+    return {"active": registry.active_name, "versions": registry.versions()}
+
+
+@app.post("/models/register", summary="登记模型版本")
+def register_model(request: ModelRegisterRequest):
+    try:
+        if request.artifact_dir:
+            registry.register_artifact(request.name, request.artifact_dir)
+        elif request.model_path:
+            registry.register(request.name, request.model_path, request.features_path,
+                              request.target_path, request.config)
+        else:
+            return {"error": "需要提供 artifact_dir 或 model_path"}
+        if request.activate:
+            registry.activate(request.name)
+        else:
+            # 登记后立即加载并预热，确保文件可用
+            registry.get(request.name)
+        return {"message": f"已登记模型 {request.name}", "active": registry.active_name}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.post("/models/{name}/activate", summary="切换当前模型版本")
+def activate_model(name: str):
+    try:
+        version = registry.activate(name)
+        return {"message": f"已切换到 {name}", "version": version.describe()}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.post("/models/{name}/reload", summary="从磁盘重新加载模型版本")
+def reload_model(name: str):
+    try:
+        version = registry.reload(name)
+        return {"message": f"已重新加载 {name}", "version": version.describe()}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def watch_model_file(interval):
+    """定期检查当前版本的权重文件，文件被替换后自动热重载"""
+    while True:
+        time.sleep(interval)
+        try:
+            if registry.reload_if_changed():
+                print(f"[模型] 检测到权重文件更新，已热重载 {registry.get().version_id}")
+        except Exception as e:
+            print(f"[模型] 热重载失败: {e}")
+
+
+@app.on_event("startup")
+def warm_up_model():
+    """启动时加载并预热当前模型，完成后才开始接收请求"""
+    version = registry.get()
+    print(f"[启动] 模型 {version.version_id} 已加载并预热")
+    # MODEL_RELOAD_INTERVAL 大于 0 时按该间隔（秒）监视权重文件
+    interval = float(os.getenv("MODEL_RELOAD_INTERVAL", "0"))
+    if interval > 0:
+        threading.Thread(target=watch_model_file, args=(interval,), daemon=True).start()
+    if online_tuner is not None:
+        online_tuner.start()
+
 if __name__ == "__main__":
     import uvicorn
     # Start the FastAPI server
@@ -26,3 +26,82 @@ class Net(nn.Module):
         # 取最后一个时间步的输出
         out = self.linear(lstm_out[:, -1, :])
         return out
+
+    def step(self, x, state=None):
+        """
+        单步前向：x 形状为 (batch, input_size)，state 为 (h, c)
+        返回 (输出, 新的 (h, c))，用于流式推理时逐日推进隐藏状态
+        """
+        if state is None:
+            h0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(x.device)
+            c0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(x.device)
+            state = (h0, c0)
+
+        lstm_out, state = self.lstm(x.unsqueeze(1), state)
+        out = self.linear(lstm_out[:, -1, :])
+        return out, state
+
+
+class ScaledNet(nn.Module):
+    """
+    将特征标准化与目标反标准化折叠进模型
+    输入原始特征 (batch, 3, 5)，直接输出水位（米）(batch, 1)
+    """
+
+    def __init__(self, net, feature_mean, feature_scale, target_mean, target_scale):
+        super(ScaledNet, self).__init__()
+        self.net = net
+        self.register_buffer('feature_mean', torch.as_tensor(feature_mean, dtype=torch.float32))
+        self.register_buffer('feature_scale', torch.as_tensor(feature_scale, dtype=torch.float32))
+        self.register_buffer('target_mean', torch.as_tensor(target_mean, dtype=torch.float32))
+        self.register_buffer('target_scale', torch.as_tensor(target_scale, dtype=torch.float32))
+
+    def forward(self, x):
+        x = (x - self.feature_mean) / self.feature_scale
+        return self.net(x) * self.target_scale + self.target_mean
+
+
+class MultiStationNet(nn.Module):
+    """
+    多站点 LSTM：站点编号经嵌入后拼接到每一天的特征上
+    输入已按站点标准化的特征 (batch, 3, 5) 与站点编号 (batch,)，输出标准化后的水位 (batch, 1)
+    """
+
+    def __init__(self, num_stations, input_size=5, hidden_size=32, num_layers=2, output_size=1,
+                 dropout=0.2, embedding_dim=8):
+        super(MultiStationNet, self).__init__()
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+
+        self.embedding = nn.Embedding(num_stations, embedding_dim)
+        self.lstm = nn.LSTM(input_size + embedding_dim, hidden_size, num_layers,
+                            batch_first=True, dropout=dropout)
+        self.linear = nn.Linear(hidden_size, output_size)
+
+    def forward(self, x, station_ids):
+        station = self.embedding(station_ids).unsqueeze(1).expand(-1, x.size(1), -1)
+        h0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(x.device)
+        c0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(x.device)
+        lstm_out, _ = self.lstm(torch.cat([x, station], dim=2), (h0, c0))
+        return self.linear(lstm_out[:, -1, :])
+
+
+class ScaledMultiStationNet(nn.Module):
+    """
+    按站点折叠标准化参数：feature_mean / feature_scale 形状 (站点数, 5)，
+    target_mean / target_scale 形状 (站点数,)
+    输入原始特征 (batch, 3, 5) 与站点编号 (batch,)，直接输出水位（米）(batch, 1)
+    """
+
+    def __init__(self, net, feature_mean, feature_scale, target_mean, target_scale):
+        super(ScaledMultiStationNet, self).__init__()
+        self.net = net
+        self.register_buffer('feature_mean', torch.as_tensor(feature_mean, dtype=torch.float32))
+        self.register_buffer('feature_scale', torch.as_tensor(feature_scale, dtype=torch.float32))
+        self.register_buffer('target_mean', torch.as_tensor(target_mean, dtype=torch.float32))
+        self.register_buffer('target_scale', torch.as_tensor(target_scale, dtype=torch.float32))
+
+    def forward(self, x, station_ids):
+        x = (x - self.feature_mean[station_ids].unsqueeze(1)) / self.feature_scale[station_ids].unsqueeze(1)
+        out = self.net(x, station_ids)
+        return out * self.target_scale[station_ids].unsqueeze(1) + self.target_mean[station_ids].unsqueeze(1)
@@ -0,0 +1,313 @@
+"""
+模型注册表
+
+- 懒加载：注册时只记录路径与配置，首次使用时才加载权重和标准化器
+- 预热：加载后先跑几次前向，再对外提供服务
+- 热切换：新版本加载、预热完成后才原子地替换当前版本，进行中的请求继续使用旧版本
+- 多版本常驻：最多保留 max_resident 个已加载版本，可按名称路由或对比
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from model_definition import Net
+from engines import create_engine
+from prediction_cache import model_file_version
+from inference import WINDOW_DAYS, NUM_FEATURES
+from artifact import ARTIFACT_SUFFIX, ARTIFACT_PATH, load_model_artifact, stale_sources
+
+PRODUCT_DIR = './product'
+
+# 模型配置参数（与训练时保持一致）
+DEFAULT_MODEL_CONFIG = {
+    "input_size": 5,
+    "hidden_size": 32,
+    "num_layers": 2,
+    "dropout": 0.3,
+}
+
+DEFAULT_VERSION = "default"
+
+
+def load_model(model_path, config=None, device='cpu', mmap=False):
+    """
+    按配置构建 Net 并加载权重
+
+    mmap=True 时以内存映射方式加载，assign=True 让模型参数直接引用映射的文件页，
+    多个进程共享同一份只读权重
+    """
+    config = {**DEFAULT_MODEL_CONFIG, **(config or {})}
+    model = Net(input_size=config["input_size"], hidden_size=config["hidden_size"],
+                num_layers=config["num_layers"], dropout=config["dropout"])
+    state_dict = torch.load(model_path, map_location=device, weights_only=True, mmap=mmap)
+    model.load_state_dict(state_dict, assign=mmap)
+    model.to(device)
+    model.eval()
+    return model
+
+
+def artifact_or_legacy(directory):
+    """
+    目录中应加载的模型文件：有 model.lstm 且与同目录的三文件一致时用 model.lstm，否则用 best_lstm_model.pth
+
+    两者都存在但不一致（如重新训练后只替换了 .pth）时打印警告并使用 .pth，避免静默加载旧权重；
+    重新运行 python artifact.py 可使二者一致
+    """
+    artifact_path = os.path.join(directory, os.path.basename(ARTIFACT_PATH))
+    legacy_path = os.path.join(directory, 'best_lstm_model.pth')
+    if not os.path.exists(artifact_path):
+        return legacy_path
+    stale = stale_sources(artifact_path)
+    if stale and os.path.exists(legacy_path):
+        print(f"[模型] 警告: {artifact_path} 与 {', '.join(stale)} 不一致，改用 {legacy_path}；"
+              f"请重新生成单文件工件（python artifact.py）")
+        return legacy_path
+    return artifact_path
+
+
+class ModelVersion:
+    """一个已加载的模型版本：权重、标准化器与推理引擎"""
+
+    def __init__(self, name, spec, device, engine_name, mmap):
+        self.name = name
+        self.spec = spec
+        self.file_version = model_file_version(spec["model_path"])
+        if spec["model_path"].endswith(ARTIFACT_SUFFIX):
+            # 单文件工件：配置与标准化参数都在文件内，不经过 pickle / sklearn
+            self.model, self.scaler_features, self.scaler_target, config, _ = load_model_artifact(
+                spec["model_path"], device, mmap=mmap)
+            self.config = {**DEFAULT_MODEL_CONFIG, **config}
+        else:
+            import joblib
+            self.config = {**DEFAULT_MODEL_CONFIG, **spec.get("config", {})}
+            self.model = load_model(spec["model_path"], self.config, device, mmap)
+            self.scaler_features = joblib.load(spec["features_path"])
+            self.scaler_target = joblib.load(spec["target_path"])
+        self.engine = create_engine(engine_name, self.model, self.scaler_features,
+                                    self.scaler_target, device)
+        self.device = device
+        self.loaded_at = time.time()
+        self._sampler = None
+
+    @property
+    def version_id(self):
+        return f"{self.name}@{self.file_version}"
+
+    def predict(self, features_array):
+        return self.engine.predict(features_array)
+
+    def warm_up(self, batch_sizes=(1, 32), repeat=3):
+        """用标准化器均值构造窗口跑几次前向，完成内存分配与算子初始化"""
+        window = np.tile(self.scaler_features.mean_, (WINDOW_DAYS, 1)).reshape(1, WINDOW_DAYS, NUM_FEATURES)
+        for batch_size in batch_sizes:
+            for _ in range(repeat):
+                self.predict(np.repeat(window, batch_size, axis=0))
+
+    def predict_distribution(self, features_array, samples, quantiles):
+        """MC-dropout 采样，返回 (N, 2 + Q)：均值、标准差与各分位数（米）"""
+        from uncertainty import mc_dropout_model, predict_distribution
+        if self._sampler is None:
+            self._sampler = mc_dropout_model(self.model, self.config)
+        return predict_distribution(self._sampler, self.scaler_features, self.scaler_target,
+                                    features_array, samples, quantiles, self.device)
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "version_id": self.version_id,
+            "model_path": self.spec["model_path"],
+            "config": self.config,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ModelRegistry:
+    def __init__(self, device='cpu', engine_name='eager', max_resident=3, mmap=False,
+                 product_dir=PRODUCT_DIR):
+        self.device = device
+        self.engine_name = engine_name
+        self.max_resident = max_resident
+        self.mmap = mmap
+        self.product_dir = product_dir
+        self._specs = {}
+        self._loaded = OrderedDict()
+        self._active = None
+        self._active_name = None
+        self._streaming = None
+        self._lock = threading.RLock()
+
+    def register(self, name, model_path, features_path=None, target_path=None, config=None):
+        """
+        登记一个模型版本（不加载），路径必须位于 product 目录内
+
+        model_path 为 .lstm 单文件工件时不需要标准化器路径与配置
+        """
+        if model_path.endswith(ARTIFACT_SUFFIX):
+            features_path = target_path = None
+            paths = (model_path,)
+        else:
+            features_path = features_path or os.path.join(self.product_dir, 'scaler_features.pkl')
+            target_path = target_path or os.path.join(self.product_dir, 'scaler_target.pkl')
+            paths = (model_path, features_path, target_path)
+        root = os.path.realpath(self.product_dir)
+        for path in paths:
+            if os.path.commonpath([root, os.path.realpath(path)]) != root:
+                raise ValueError(f"模型文件必须位于 {self.product_dir} 目录内: {path}")
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"文件不存在: {path}")
+        with self._lock:
+            self._specs[name] = {
+                "model_path": model_path,
+                "features_path": features_path,
+                "target_path": target_path,
+                "config": dict(config or {}),
+            }
+            if self._active_name is None:
+                self._active_name = name
+        return name
+
+    def register_artifact(self, name, directory):
+        """
+        登记 train.py 产出的版本目录：优先使用其中的 model.lstm，
+        没有（或与三文件不一致）时使用权重、两个标准化器与 config.json
+        """
+        model_path = artifact_or_legacy(directory)
+        if model_path.endswith(ARTIFACT_SUFFIX):
+            return self.register(name, model_path)
+        with open(os.path.join(directory, 'config.json'), encoding='utf-8') as f:
+            metadata = json.load(f)
+        return self.register(
+            name,
+            model_path,
+            os.path.join(directory, 'scaler_features.pkl'),
+            os.path.join(directory, 'scaler_target.pkl'),
+            metadata.get("model"),
+        )
+
+    def _load(self, name):
+        if name not in self._specs:
+            raise KeyError(f"未注册的模型版本: {name}")
+        version = ModelVersion(name, self._specs[name], self.device, self.engine_name, self.mmap)
+        version.warm_up()
+        return version
+
+    def _evict(self):
+        while len(self._loaded) > self.max_resident:
+            for name in self._loaded:
+                if name != self._active_name:
+                    del self._loaded[name]
+                    break
+            else:
+                break
+
+    def get(self, name=None):
+        """获取模型版本，name 为空时返回当前版本；未加载的版本在此时加载并预热"""
+        if name is None:
+            active = self._active
+            if active is not None:
+                return active
+            name = self._active_name
+            if name is None:
+                raise KeyError("注册表中没有模型")
+        version = self._loaded.get(name)
+        if version is not None:
+            return version
+        # 加载与预热在锁外进行，避免阻塞流式推理与其他版本的请求；
+        # 并发加载同一版本时以先登记者为准
+        version = self._load(name)
+        with self._lock:
+            loaded = self._loaded.get(name)
+            if loaded is not None:
+                return loaded
+            self._loaded[name] = version
+            if name == self._active_name:
+                self._active = version
+            self._evict()
+            return version
+
+    @property
+    def streaming(self):
+        """
+        流式推理器：注册表级别，跨版本保留各站点状态与检查点
+
+        切换或重载当前版本时用新模型重算站点状态（见 StreamingPredictor.rebind）
+        """
+        with self._lock:
+            if self._streaming is None:
+                from streaming import StreamingPredictor
+                active = self.get()
+                self._streaming = StreamingPredictor(active.model, active.scaler_features,
+                                                     active.scaler_target, self.device)
+            return self._streaming
+
+    def _set_active(self, version):
+        self._active = version
+        if self._streaming is not None and self._streaming.model is not version.model:
+            self._streaming.rebind(version.model, version.scaler_features, version.scaler_target)
+
+    def activate(self, name):
+        """加载并预热后原子地切换当前版本（加载在锁外，只在切换时持锁）"""
+        version = self.get(name)
+        with self._lock:
+            # 加载期间可能被淘汰或重载，以登记中的对象为准
+            version = self._loaded.setdefault(name, version)
+            self._active_name = name
+            self._set_active(version)
+            self._loaded.move_to_end(name)
+            self._evict()
+            return version
+
+    def reload(self, name=None):
+        """从磁盘重新加载版本（如权重文件已被替换），预热完成后替换旧对象"""
+        name = name or self._active_name
+        version = self._load(name)
+        with self._lock:
+            self._loaded[name] = version
+            if name == self._active_name:
+                self._set_active(version)
+            self._evict()
+            return version
+
+    def reload_if_changed(self):
+        """
+        当前版本的权重文件发生变化时热重载，返回是否重载
+
+        替换权重文件时应写入新文件后用 os.replace 原子替换，
+        已内存映射的旧版本仍指向原文件，不受影响
+        """
+        active = self._active
+        if active is None or model_file_version(active.spec["model_path"]) == active.file_version:
+            return False
+        self.reload(active.name)
+        return True
+
+    @property
+    def active_name(self):
+        return self._active_name
+
+    def versions(self):
+        with self._lock:
+            return [
+                {
+                    "name": name,
+                    "model_path": spec["model_path"],
+                    "active": name == self._active_name,
+                    "loaded": name in self._loaded,
+                    "version_id": self._loaded[name].version_id if name in self._loaded else None,
+                }
+                for name, spec in self._specs.items()
+            ]
+
+
+def create_default_registry(device='cpu', engine_name='eager', mmap=False, max_resident=3):
+    """注册 product 目录中的默认模型"""
+    registry = ModelRegistry(device=device, engine_name=engine_name, mmap=mmap,
+                             max_resident=max_resident)
+    # 优先使用单文件工件（python artifact.py 生成），不存在或与三文件不一致时使用旧的三文件格式
+    registry.register(DEFAULT_VERSION, artifact_or_legacy(PRODUCT_DIR))
+    return registry
@@ -0,0 +1,319 @@
+"""
+多站点模型：一个模型、一次前向为全部站点预测下一天水位
+
+- 站点编号经嵌入向量拼接到输入特征上，各站点共享 LSTM 权重
+- 每个站点单独标准化（只在该站点训练段上拟合），标准化参数按站点折叠进模型
+- 一个工件文件（权重 + 站点列表 + 配置）替代 N 个单站点模型及其标准化器
+
+用法：
+    python multi_station.py train --csv 阳朔=./dataset/yangshuo_4_7_11_water_level.csv
+    python multi_station.py train --store ./data/stations            # 使用站点存储中的全部站点
+    python multi_station.py benchmark --stations 33                  # 与 N 次单站点调用对比
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+from torch import nn
+
+from data_utils import DATASET_PATH, load_observations, make_windows
+from inference import predict_array, validate_window, WINDOW_DAYS, NUM_FEATURES
+from model_definition import MultiStationNet, ScaledMultiStationNet
+from model_registry import DEFAULT_MODEL_CONFIG, PRODUCT_DIR
+
+MULTI_STATION_PATH = os.path.join(PRODUCT_DIR, 'multi_station.pt')
+DEFAULT_MULTI_CONFIG = {**DEFAULT_MODEL_CONFIG, "embedding_dim": 8}
+
+
+def build_model(stations, config, feature_mean=None, feature_scale=None, target_mean=None, target_scale=None):
+    """按配置构建 ScaledMultiStationNet；未给出标准化参数时使用恒等变换"""
+    num_stations = len(stations)
+    net = MultiStationNet(num_stations, input_size=config["input_size"], hidden_size=config["hidden_size"],
+                          num_layers=config["num_layers"], dropout=config["dropout"],
+                          embedding_dim=config["embedding_dim"])
+    return ScaledMultiStationNet(
+        net,
+        np.zeros((num_stations, NUM_FEATURES)) if feature_mean is None else feature_mean,
+        np.ones((num_stations, NUM_FEATURES)) if feature_scale is None else feature_scale,
+        np.zeros(num_stations) if target_mean is None else target_mean,
+        np.ones(num_stations) if target_scale is None else target_scale,
+    )
+
+
+class MultiStationPredictor:
+    """多站点模型的推理封装：站点名映射为编号，所有站点的窗口合并为一次前向"""
+
+    def __init__(self, model, stations, config, device='cpu'):
+        self.model = model.to(device).eval()
+        self.stations = list(stations)
+        self.config = config
+        self.device = device
+        self._index = {name: i for i, name in enumerate(self.stations)}
+
+    def station_ids(self, stations):
+        unknown = [name for name in stations if name not in self._index]
+        if unknown:
+            raise KeyError(f"多站点模型中没有站点: {', '.join(unknown)}")
+        return np.array([self._index[name] for name in stations], dtype=np.int64)
+
+    def predict(self, features_array, station_ids):
+        """原始特征 (N, 3, 5) 与站点编号 (N,) -> 水位 (N,)"""
+        x = torch.as_tensor(np.asarray(features_array), dtype=torch.float32).to(self.device)
+        ids = torch.as_tensor(np.asarray(station_ids), dtype=torch.long).to(self.device)
+        with torch.no_grad():
+            return self.model(x, ids).cpu().numpy().reshape(-1)
+
+    def predict_stations(self, windows):
+        """
+        为多个站点各预测一个窗口
+
+        Args:
+            windows: {站点名: 3×5 窗口}
+
+        Returns:
+            (predictions, errors)：{站点名: 水位}，{站点名: 错误信息}
+        """
+        errors = {}
+        valid = []
+        for name, window in windows.items():
+            error = validate_window(window) or (None if name in self._index else "多站点模型中没有该站点")
+            if error:
+                errors[name] = error
+            else:
+                valid.append(name)
+        predictions = {}
+        if valid:
+            features_array = np.array([windows[name] for name in valid], dtype=np.float64)
+            values = self.predict(features_array, self.station_ids(valid))
+            predictions = dict(zip(valid, values.tolist()))
+        return predictions, errors
+
+
+def save_multi_station(predictor, path=MULTI_STATION_PATH, metadata=None):
+    """权重（含按站点的标准化参数）、站点列表与配置写入同一个文件，可用 weights_only 加载"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    torch.save({
+        "state_dict": predictor.model.state_dict(),
+        "stations": predictor.stations,
+        "config": predictor.config,
+        "metadata": metadata or {},
+    }, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_multi_station(path=MULTI_STATION_PATH, device='cpu', mmap=False):
+    artifact = torch.load(path, map_location=device, weights_only=True, mmap=mmap)
+    config = {**DEFAULT_MULTI_CONFIG, **artifact["config"]}
+    model = build_model(artifact["stations"], config)
+    model.load_state_dict(artifact["state_dict"], assign=mmap)
+    return MultiStationPredictor(model, artifact["stations"], config, device)
+
+
+def prepare_stations(station_features, val_ratio):
+    """
+    为每个站点构造窗口并按站点标准化
+
+    Returns:
+        (train, val, scaling)：train / val 为 (x, y, station_ids) 数组，
+        scaling 为 (feature_mean, feature_scale, target_mean, target_scale)
+    """
+    parts = {"train": [], "val": []}
+    feature_mean, feature_scale, target_mean, target_scale = [], [], [], []
+    for station_id, (name, features) in enumerate(station_features.items()):
+        windows, targets = make_windows(np.asarray(features, dtype=np.float64))
+        split = int(len(windows) * (1 - val_ratio))
+        if split <= 0 or split >= len(windows):
+            raise ValueError(f"站点 {name} 数据量不足以划分训练集和验证集")
+        # 与 train.prepare_data 一致：只在训练段上拟合标准化参数
+        train_rows = features[:split + WINDOW_DAYS]
+        f_mean, f_scale = train_rows.mean(axis=0), train_rows.std(axis=0)
+        f_scale[f_scale == 0] = 1.0
+        t_mean, t_scale = targets[:split].mean(), targets[:split].std() or 1.0
+        feature_mean.append(f_mean)
+        feature_scale.append(f_scale)
+        target_mean.append(t_mean)
+        target_scale.append(t_scale)
+
+        x = ((windows - f_mean) / f_scale).astype(np.float32)
+        y = ((targets - t_mean) / t_scale).astype(np.float32).reshape(-1, 1)
+        ids = np.full(len(windows), station_id, dtype=np.int64)
+        parts["train"].append((x[:split], y[:split], ids[:split]))
+        parts["val"].append((x[split:], y[split:], ids[split:]))
+
+    train, val = (tuple(np.concatenate(column) for column in zip(*parts[key])) for key in ("train", "val"))
+    return train, val, (np.array(feature_mean), np.array(feature_scale),
+                        np.array(target_mean), np.array(target_scale))
+
+
+def train_multi_station(station_features, config=None, epochs=300, patience=30, batch_size=32,
+                        lr=1e-3, val_ratio=0.2, seed=42):
+    """
+    在多个站点的观测上训练一个共享模型
+
+    Args:
+        station_features: {站点名: 观测特征 (T, 5)}
+
+    Returns:
+        (MultiStationPredictor, 验证集上各站点的 MAE（米）)
+    """
+    torch.manual_seed(seed)
+    config = {**DEFAULT_MULTI_CONFIG, **(config or {})}
+    stations = list(station_features)
+    (x_train, y_train, id_train), (x_val, y_val, id_val), scaling = prepare_stations(station_features, val_ratio)
+    model = build_model(stations, config, *scaling)
+    net = model.net
+    optimizer = torch.optim.Adam(net.parameters(), lr=lr)
+    criterion = nn.MSELoss()
+
+    x_train, y_train, id_train = map(torch.from_numpy, (x_train, y_train, id_train))
+    x_val, y_val, id_val = map(torch.from_numpy, (x_val, y_val, id_val))
+    generator = torch.Generator().manual_seed(seed)
+
+    best_val, best_state, stale_epochs = float('inf'), None, 0
+    for epoch in range(epochs):
+        net.train()
+        order = torch.randperm(len(x_train), generator=generator)
+        for start in range(0, len(order), batch_size):
+            index = order[start:start + batch_size]
+            optimizer.zero_grad()
+            loss = criterion(net(x_train[index], id_train[index]), y_train[index])
+            loss.backward()
+            optimizer.step()
+
+        net.eval()
+        with torch.no_grad():
+            val_loss = criterion(net(x_val, id_val), y_val).item()
+        if val_loss < best_val:
+            best_val, stale_epochs = val_loss, 0
+            best_state = {k: v.detach().clone() for k, v in net.state_dict().items()}
+        else:
+            stale_epochs += 1
+            if stale_epochs >= patience:
+                print(f"[多站点] 验证损失 {patience} 个 epoch 未下降，在第 {epoch + 1} 个 epoch 停止")
+                break
+
+    if best_state is None:
+        # 没有完成任何 epoch，或验证损失始终为 NaN / Inf（如某站点数据异常、学习率过大发散）
+        raise RuntimeError("没有可用的模型：未得到有限的验证损失")
+    net.load_state_dict(best_state)
+    model.eval()
+    with torch.no_grad():
+        errors = (net(x_val, id_val) - y_val).numpy().reshape(-1) * scaling[3][id_val.numpy()]
+    ids = id_val.numpy()
+    station_mae = {name: float(np.abs(errors[ids == i]).mean()) for i, name in enumerate(stations)}
+    return MultiStationPredictor(model, stations, config), station_mae
+
+
+def benchmark(num_stations=33, iterations=200, repeat_windows=1):
+    """
+    比较为 N 个站点各预测一次的两种方式：
+    N 个单站点模型各调用一次 predict_array，与多站点模型一次前向
+
+    两种方式的延迟与权重取值无关：单站点模型均使用 product 目录中的模型（各自一份拷贝），
+    存在多站点工件且站点数足够时使用该工件，否则使用同结构的未训练模型
+    """
+    import copy
+    from model_registry import create_default_registry
+
+    version = create_default_registry().get()
+    _, features = load_observations(DATASET_PATH)
+    windows, _ = make_windows(features)
+    batch = np.ascontiguousarray(windows[np.arange(num_stations * repeat_windows) % len(windows)])
+
+    singles = [(copy.deepcopy(version.model), version.scaler_features, version.scaler_target)
+               for _ in range(num_stations)]
+
+    predictor = load_multi_station() if os.path.exists(MULTI_STATION_PATH) else None
+    if predictor is None or len(predictor.stations) < num_stations:
+        stations = [f"station_{i}" for i in range(num_stations)]
+        predictor = MultiStationPredictor(build_model(stations, DEFAULT_MULTI_CONFIG), stations,
+                                          DEFAULT_MULTI_CONFIG)
+    station_ids = np.repeat(np.arange(num_stations), repeat_windows)
+
+    def run_singles():
+        for i, (model, scaler_features, scaler_target) in enumerate(singles):
+            predict_array(model, scaler_features, scaler_target,
+                          batch[i * repeat_windows:(i + 1) * repeat_windows])
+
+    def run_multi():
+        predictor.predict(batch, station_ids)
+
+    results = {}
+    for name, fn in (("separate", run_singles), ("multi_station", run_multi)):
+        for _ in range(10):
+            fn()
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = {"p50_ms": float(np.percentile(samples, 50)),
+                         "p99_ms": float(np.percentile(samples, 99))}
+    results["parameters"] = {
+        "separate": num_stations * sum(p.numel() for p in version.model.parameters()),
+        "multi_station": sum(p.numel() for p in predictor.model.parameters()),
+    }
+    return results
+
+
+def load_station_features(csv_specs, store_root):
+    """汇总训练数据：--csv 名称=路径，以及站点存储中的全部站点"""
+    station_features = {}
+    for spec in csv_specs:
+        name, _, path = spec.partition('=')
+        if not path:
+            raise ValueError(f"--csv 的格式应为 站点名=路径: {spec}")
+        station_features[name] = load_observations(path)[1]
+    if store_root:
+        from timeseries_store import TimeSeriesStore
+        store = TimeSeriesStore(store_root)
+        for name in store.stations():
+            station_features[name] = np.array(store.series(name).features)
+    return station_features
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多站点水位预测模型")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = commands.add_parser('train', help='训练多站点模型')
+    train_parser.add_argument('--csv', action='append', default=[], help='站点名=观测 CSV 路径，可重复')
+    train_parser.add_argument('--store', default=None, help='使用站点存储目录中的全部站点')
+    train_parser.add_argument('--output', default=MULTI_STATION_PATH)
+    train_parser.add_argument('--epochs', type=int, default=300)
+    train_parser.add_argument('--patience', type=int, default=30)
+    train_parser.add_argument('--batch-size', type=int, default=32)
+    train_parser.add_argument('--lr', type=float, default=1e-3)
+    train_parser.add_argument('--embedding-dim', type=int, default=DEFAULT_MULTI_CONFIG["embedding_dim"])
+    train_parser.add_argument('--val-ratio', type=float, default=0.2)
+    train_parser.add_argument('--seed', type=int, default=42)
+
+    bench_parser = commands.add_parser('benchmark', help='与 N 个单站点模型对比延迟')
+    bench_parser.add_argument('--stations', type=int, default=33, help='站点数')
+    bench_parser.add_argument('--windows', type=int, default=1, help='每个站点的窗口数')
+    bench_parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        station_features = load_station_features(args.csv or [f"阳朔={DATASET_PATH}"], args.store)
+        predictor, station_mae = train_multi_station(
+            station_features, {"embedding_dim": args.embedding_dim}, args.epochs, args.patience,
+            args.batch_size, args.lr, args.val_ratio, args.seed,
+        )
+        save_multi_station(predictor, args.output, {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "val_mae": station_mae,
+        })
+        for name, mae in station_mae.items():
+            print(f"  {name:<12} 验证 MAE {mae:.4f}m")
+        print(f"[多站点] {len(predictor.stations)} 个站点，工件已写入 {args.output}")
+    else:
+        results = benchmark(args.stations, args.iterations, args.windows)
+        for name in ("separate", "multi_station"):
+            print(f"{name:<14} p50 {results[name]['p50_ms']:.3f}ms  p99 {results[name]['p99_ms']:.3f}ms  "
+                  f"参数量 {results['parameters'][name]}")
+        print(f"加速比 {results['separate']['p50_ms'] / results['multi_station']['p50_ms']:.1f}x "
+              f"（{args.stations} 个站点 × {args.windows} 个窗口）")
@@ -0,0 +1,235 @@
+"""
+在线微调：新的日观测到达后，在后台用最近的滑动窗口微调当前模型
+
+- 观测进入固定长度的缓冲区，只保留最近 buffer_days 天
+- 微调在独立的子进程中进行（降低优先级、单线程），服务进程只负责等待结果，
+  不与请求争抢 GIL 和计算线程
+- 缓冲区最后 holdout 个窗口作为留出集，其前 validation 个窗口作为验证集，均不参与微调；
+  按验证集 MAE 选出最佳轮次，再在留出集上只评估一次：留出集 MAE 低于当前版本
+  （至少改善 min_improvement 比例）才发布，留出集不参与选择，发布判断不偏乐观
+- 发布：写入 product/versions/online-<时间戳>/model.lstm，通过注册表登记并原子切换，
+  预测缓存按版本标识自动失效；标准化器沿用当前版本
+
+用法（main.py 中通过环境变量开启）：
+    ONLINE_TUNE=1 ONLINE_TUNE_STATION=阳朔 python main.py
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from inference import WINDOW_DAYS, NUM_FEATURES
+from data_utils import make_windows
+
+
+def _init_tuning_process(threads):
+    # 子进程降低调度优先级并限制线程数，避免影响服务进程
+    if hasattr(os, 'nice'):
+        os.nice(10)
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+
+def fine_tune_job(model_path, config, x, y, holdout, validation, epochs, lr, batch_size, target_scale, seed):
+    """
+    子进程中执行：加载当前权重，在缓冲区窗口上微调并评估留出集
+
+    x / y 为已标准化的窗口与目标，最后 holdout 个样本为留出集，其前 validation 个样本为验证集
+    Returns:
+        (当前版本留出集 MAE（米）, 微调后留出集 MAE（米）, 微调后的 state_dict)；
+        没有任何轮次在验证集上优于当前版本时后两项为 (当前版本留出集 MAE, None)
+    """
+    import torch
+    from torch import nn
+    from model_registry import load_model
+    from artifact import ARTIFACT_SUFFIX, load_model_artifact
+
+    torch.manual_seed(seed)
+    if model_path.endswith(ARTIFACT_SUFFIX):
+        model = load_model_artifact(model_path)[0]
+    else:
+        model = load_model(model_path, config)
+    x, y = torch.from_numpy(x), torch.from_numpy(y)
+    split = len(x) - holdout - validation
+    x_train, y_train = x[:split], y[:split]
+    x_val, y_val = x[split:-holdout], y[split:-holdout]
+    x_hold, y_hold = x[-holdout:], y[-holdout:]
+
+    def mae(inputs, targets):
+        model.eval()
+        with torch.no_grad():
+            return float((model(inputs) - targets).abs().mean()) * target_scale
+
+    baseline = mae(x_hold, y_hold)
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    criterion = nn.MSELoss()
+    generator = torch.Generator().manual_seed(seed)
+    # 轮次只按验证集选择，留出集在最后评估一次
+    best_val, best_state = mae(x_val, y_val), None
+    for _ in range(epochs):
+        model.train()
+        order = torch.randperm(len(x_train), generator=generator)
+        for start in range(0, len(order), batch_size):
+            index = order[start:start + batch_size]
+            optimizer.zero_grad()
+            criterion(model(x_train[index]), y_train[index]).backward()
+            optimizer.step()
+        val_mae = mae(x_val, y_val)
+        if val_mae < best_val:
+            best_val = val_mae
+            best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+    if best_state is None:
+        return baseline, baseline, None
+    model.load_state_dict(best_state)
+    return baseline, mae(x_hold, y_hold), best_state
+
+
+class OnlineTuner:
+    """
+    后台在线微调器
+
+    observe() 只把观测追加到缓冲区并唤醒后台线程，立即返回；
+    后台线程在累计 min_new_days 天新观测后提交一次微调任务
+    """
+
+    def __init__(self, registry, buffer_days=180, holdout=14, validation=14, min_new_days=7, epochs=20, lr=1e-4,
+                 batch_size=16, min_improvement=0.01, threads=1, seed=42):
+        # fine_tune_job 按 x[split:-holdout] / x[-holdout:] 切分，两段都必须非空
+        if holdout < 1 or validation < 1:
+            raise ValueError(f"holdout 与 validation 至少为 1，当前为 {holdout} / {validation}")
+        self.registry = registry
+        self.holdout = holdout
+        self.validation = validation
+        self.min_new_days = min_new_days
+        self.epochs = epochs
+        self.lr = lr
+        self.batch_size = batch_size
+        self.min_improvement = min_improvement
+        self.threads = threads
+        self.seed = seed
+        self._buffer = deque(maxlen=buffer_days)
+        self._new_days = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._executor = None
+        self._thread = None
+        self.history = deque(maxlen=50)
+        self.running = False
+
+    def start(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_tuning_process, initargs=(self.threads,),
+        )
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def observe(self, observations):
+        """追加一天或多天观测（每行 5 个特征，按时间顺序），不阻塞"""
+        rows = np.asarray(observations, dtype=np.float64).reshape(-1, NUM_FEATURES)
+        if not np.all(np.isfinite(rows)):
+            raise ValueError("观测中包含 NaN 或无穷大")
+        with self._lock:
+            self._buffer.extend(rows)
+            self._new_days += len(rows)
+            ready = self._new_days >= self.min_new_days
+        if ready:
+            self._wake.set()
+
+    def _min_windows(self):
+        return self.holdout + self.validation + self.batch_size
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait()
+            self._wake.clear()
+            if self._stopped:
+                break
+            with self._lock:
+                if self._new_days < self.min_new_days or len(self._buffer) - WINDOW_DAYS < self._min_windows():
+                    continue
+                rows = np.array(self._buffer)
+                self._new_days = 0
+            try:
+                self.running = True
+                self.history.append(self.tune(rows))
+            except Exception as e:
+                self.history.append({"time": time.time(), "error": str(e)})
+                print(f"[在线微调] 失败: {e}")
+            finally:
+                self.running = False
+
+    def tune(self, rows):
+        """对给定的观测序列执行一次微调，改善时发布为新版本；返回本次结果"""
+        active = self.registry.get()
+        scaler_features, scaler_target = active.scaler_features, active.scaler_target
+        windows, targets = make_windows(rows)
+        x = scaler_features.transform(windows.reshape(-1, NUM_FEATURES)).reshape(windows.shape).astype(np.float32)
+        y = scaler_target.transform(targets.reshape(-1, 1)).astype(np.float32)
+
+        started = time.time()
+        baseline, tuned, state = self._executor.submit(
+            fine_tune_job, active.spec["model_path"], active.config, x, y, self.holdout, self.validation,
+            self.epochs, self.lr, self.batch_size, float(scaler_target.scale_[0]), self.seed,
+        ).result()
+        result = {
+            "time": started,
+            "seconds": time.time() - started,
+            "base_version": active.version_id,
+            "windows": len(windows),
+            "holdout_mae": baseline,
+            "tuned_mae": tuned,
+            "published": None,
+        }
+        if state is not None and tuned < baseline * (1 - self.min_improvement):
+            result["published"] = self._publish(active, state, scaler_features, scaler_target, result)
+            print(f"[在线微调] 留出集 MAE {baseline:.4f}m -> {tuned:.4f}m，已发布 {result['published']}")
+        else:
+            print(f"[在线微调] 留出集 MAE {baseline:.4f}m -> {tuned:.4f}m，未改善，不发布")
+        return result
+
+    def _publish(self, active, state, scaler_features, scaler_target, result):
+        from artifact import save_model_artifact
+        from model_registry import PRODUCT_DIR
+
+        name = f"online-{time.strftime('%Y%m%d-%H%M%S')}"
+        output_dir = os.path.join(PRODUCT_DIR, 'versions', name)
+        os.makedirs(output_dir, exist_ok=True)
+        # 只写单文件工件，发布路径不需要 pickle / sklearn
+        save_model_artifact(os.path.join(output_dir, 'model.lstm'), state, scaler_features, scaler_target,
+                            active.config, {
+                                "version": name,
+                                "fine_tuned_from": active.version_id,
+                                "holdout_mae": result["tuned_mae"],
+                                "base_holdout_mae": result["holdout_mae"],
+                                "windows": result["windows"],
+                                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                            })
+        # 加载与预热在本线程完成，之后才原子切换，服务中的请求继续使用旧版本
+        self.registry.register_artifact(name, output_dir)
+        self.registry.activate(name)
+        return name
+
+    def status(self):
+        with self._lock:
+            buffered, new_days = len(self._buffer), self._new_days
+        return {
+            "running": self.running,
+            "buffered_days": buffered,
+            "new_days": new_days,
+            "min_new_days": self.min_new_days,
+            "history": list(self.history),
+        }
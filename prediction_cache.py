@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def model_file_version(path):
+    """以模型文件的修改时间和大小作为版本号，文件被替换后版本随之改变"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+class PredictionCache:
+    """
+    预测结果 LRU 缓存
+
+    键为 (模型版本, 四舍五入后的特征窗口)，值为预测水位；条目超过 ttl 秒后失效。
+    每隔 version_check_interval 秒检查一次模型版本，版本变化时清空缓存。
+    get() 同时返回查询时的键，put() 用该键写入：查询与写入之间模型版本变化时丢弃这次写入，
+    旧模型的预测不会以新版本的键进入缓存。
+    """
+
+    def __init__(self, maxsize=4096, ttl=3600.0, decimals=4, version_fn=None,
+                 version_check_interval=1.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.decimals = decimals
+        self.version_fn = version_fn
+        self.version_check_interval = version_check_interval
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # 首次查询时再取模型版本，避免创建缓存时就触发模型加载
+        self._version = None
+        self._version_checked_at = float('-inf')
+
+    def _refresh_version(self):
+        if self.version_fn is None:
+            return
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        version = self.version_fn()
+        if version != self._version:
+            if self._version is not None:
+                self.invalidations += 1
+            self._version = version
+            self._data.clear()
+
+    def make_key(self, window):
+        """规范化的缓存键：模型版本 + 按 decimals 四舍五入后的窗口字节"""
+        canonical = np.round(np.asarray(window, dtype=np.float64), self.decimals) + 0.0
+        return self._version, canonical.shape, canonical.tobytes()
+
+    def get(self, window):
+        """返回 (缓存的预测或 None, 键)，未命中时把键交给 put()"""
+        with self._lock:
+            self._refresh_version()
+            key = self.make_key(window)
+            entry = self._data.get(key)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None, key
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0], key
+
+    def put(self, key, value):
+        """按 get() 返回的键写入；键的模型版本已不是当前版本时丢弃，返回是否写入"""
+        with self._lock:
+            self._refresh_version()
+            if key[0] != self._version:
+                return False
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def run(self, run_fn, windows):
+        """
+        带缓存的批量预测：命中的窗口直接返回，未命中的窗口合并为一批交给 run_fn
+
+        run_fn 接收窗口列表，返回 (predictions, errors)，与 inference.run_windows 一致
+        """
+        predictions = np.full(len(windows), np.nan)
+        errors = {}
+        missing = []
+        keys = {}
+        for i, window in enumerate(windows):
+            try:
+                value, keys[i] = self.get(window)
+            except (TypeError, ValueError):
+                # 形状不规则的窗口交给 run_fn 报告具体错误
+                value = None
+            if value is None:
+                missing.append(i)
+            else:
+                predictions[i] = value
+
+        if missing:
+            missing_predictions, missing_errors = run_fn([windows[i] for i in missing])
+            for j, i in enumerate(missing):
+                if j in missing_errors:
+                    errors[i] = missing_errors[j]
+                else:
+                    predictions[i] = missing_predictions[j]
+                    if i in keys:
+                        self.put(keys[i], float(missing_predictions[j]))
+        return predictions, errors
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidations": self.invalidations,
+                "model_version": self._version,
+            }
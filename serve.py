@@ -0,0 +1,45 @@
+"""
+多进程部署入口
+
+每个 worker 进程以内存映射方式加载同一份权重文件（共享只读页），
+并按 CPU 核数为每个 worker 分配固定的 intra-op / inter-op 线程数。
+
+用法：
+    python serve.py                        # worker 数默认等于 CPU 核数，每个 worker 1 个线程
+    python serve.py --workers 4 --threads 2
+"""
+import argparse
+import os
+
+import uvicorn
+
+
+def worker_environment(workers, threads=None, interop_threads=1):
+    """计算每个 worker 的线程配置，返回需要写入的环境变量"""
+    cpu_count = os.cpu_count() or 1
+    threads = threads or max(1, cpu_count // workers)
+    return {
+        "TORCH_NUM_THREADS": str(threads),
+        "TORCH_INTEROP_THREADS": str(interop_threads),
+        # 底层 OpenMP / MKL 线程池同样限制，防止超额订阅
+        "OMP_NUM_THREADS": str(threads),
+        "MKL_NUM_THREADS": str(threads),
+        "MODEL_MMAP": "1",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多进程启动水位预测服务")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker 进程数')
+    parser.add_argument('--threads', type=int, default=None, help='每个 worker 的计算线程数，默认 CPU 核数 / worker 数')
+    parser.add_argument('--interop-threads', type=int, default=1, help='每个 worker 的 inter-op 线程数')
+    args = parser.parse_args()
+
+    # worker 进程继承这些环境变量，在导入 main 时生效
+    env = worker_environment(args.workers, args.threads, args.interop_threads)
+    os.environ.update(env)
+    print(f"[启动] {args.workers} 个 worker，每个 worker {env['TORCH_NUM_THREADS']} 个计算线程")
+
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
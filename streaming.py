@@ -0,0 +1,204 @@
+import threading
+from collections import deque
+
+import numpy as np
+import torch
+
+from inference import WINDOW_DAYS, NUM_FEATURES
+
+
+class StreamingPredictor:
+    """
+    流式推理：按站点保存 LSTM 的 (h, c) 状态，新观测到达时只推进一步
+
+    模型按 3 天窗口、零初始状态训练。为保证结果与整窗预测一致，
+    每个站点维护 3 条错开一天起步的状态通道：每次观测所有通道同时前进一步，
+    恰好读满 3 天的通道输出预测并清零重新开始。
+    这样每个时刻所有站点只需一次批量的单步 LSTM，而不是重算整个窗口。
+
+    每次观测后自动为站点保存检查点（最多 max_checkpoints 个），可回滚到之前的检查点。
+
+    (h, c) 只是缓存：站点的完整状态是最近 lanes - 1 天的原始观测与各通道已读入的天数，
+    检查点也只保存这两项。模型切换（rebind）或回滚时用当前模型从这些观测重算 (h, c)，
+    因此站点状态与回滚历史在版本切换后依然有效。
+    """
+
+    def __init__(self, model, scaler_features, scaler_target, device='cpu', max_checkpoints=30):
+        self.model = model
+        self.scaler_features = scaler_features
+        self.scaler_target = scaler_target
+        self.device = device
+        self.max_checkpoints = max_checkpoints
+        self.lanes = WINDOW_DAYS
+
+        # 所有站点的状态放在同一组张量中，第 i 个站点占用 [i*lanes, (i+1)*lanes) 行
+        num_layers, hidden_size = model.num_layers, model.hidden_size
+        self._h = torch.zeros(num_layers, 0, hidden_size, device=device)
+        self._c = torch.zeros(num_layers, 0, hidden_size, device=device)
+        # 各通道已读入的天数，负数表示该通道尚未起步
+        self._age = np.zeros((0, self.lanes), dtype=np.int64)
+        # 各站点最近 lanes - 1 天的原始观测（从旧到新），用于重算状态
+        self._recent = np.zeros((0, self.lanes - 1, NUM_FEATURES))
+        self._index = {}
+        self._checkpoints = {}
+        self._lock = threading.Lock()
+
+    @property
+    def stations(self):
+        return list(self._index)
+
+    def _rows(self, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        return (positions[:, None] * self.lanes + np.arange(self.lanes)).reshape(-1)
+
+    def _ensure_stations(self, stations):
+        new = [s for s in stations if s not in self._index]
+        if not new:
+            return
+        for station in new:
+            self._index[station] = len(self._index)
+            self._checkpoints[station] = deque(maxlen=self.max_checkpoints)
+        num_layers, _, hidden_size = self._h.shape
+        zeros = torch.zeros(num_layers, len(new) * self.lanes, hidden_size, device=self.device)
+        self._h = torch.cat([self._h, zeros], dim=1)
+        self._c = torch.cat([self._c, zeros.clone()], dim=1)
+        # 通道 k 在第 k 次观测时起步
+        ages = np.tile(-np.arange(self.lanes), (len(new), 1))
+        self._age = np.concatenate([self._age, ages], axis=0)
+        self._recent = np.concatenate([self._recent, np.zeros((len(new), self.lanes - 1, NUM_FEATURES))], axis=0)
+
+    def observe(self, observations, tag=None):
+        """
+        推进一个时间步
+
+        Args:
+            observations: {站点: 当天的 5 个特征值}
+            tag: 检查点标签（如日期），用于之后回滚
+
+        Returns:
+            {站点: 下一天水位预测}，站点累计不足 3 天观测时为 None
+        """
+        with self._lock:
+            return self._observe(observations, tag)
+
+    def _observe(self, observations, tag):
+        stations = list(observations)
+        if not stations:
+            return {}
+        features_array = np.array([observations[s] for s in stations], dtype=np.float64)
+        if features_array.shape != (len(stations), NUM_FEATURES):
+            raise ValueError("每个站点的观测必须包含5个数值")
+        self._ensure_stations(stations)
+
+        positions = np.array([self._index[s] for s in stations])
+        rows = self._rows(positions)
+        rows_tensor = torch.as_tensor(rows, device=self.device)
+
+        features_scaled = self.scaler_features.transform(features_array)
+        x = torch.tensor(features_scaled, dtype=torch.float32, device=self.device)
+        x = x.repeat_interleave(self.lanes, dim=0)
+
+        state = (self._h[:, rows_tensor], self._c[:, rows_tensor])
+        with torch.no_grad():
+            out, (h, c) = self.model.step(x, state)
+
+        age = self._age[positions] + 1
+        flat_age = age.reshape(-1)
+        ready = flat_age == self.lanes
+        # 未起步的通道与刚输出预测的通道都回到零状态
+        reset = torch.as_tensor((flat_age <= 0) | ready, device=self.device)
+        h[:, reset] = 0
+        c[:, reset] = 0
+        self._h[:, rows_tensor] = h
+        self._c[:, rows_tensor] = c
+        age[age == self.lanes] = 0
+        self._age[positions] = age
+        recent = np.concatenate([self._recent[positions][:, 1:], features_array[:, None]], axis=1)
+        self._recent[positions] = recent
+
+        results = dict.fromkeys(stations)
+        if ready.any():
+            prediction_scaled = out[torch.as_tensor(ready, device=self.device)]
+            prediction = self.scaler_target.inverse_transform(
+                prediction_scaled.cpu().numpy().reshape(-1, 1)
+            ).reshape(-1)
+            # 每个站点最多只有一个通道读满
+            ready_stations = np.flatnonzero(ready.reshape(-1, self.lanes).any(axis=1))
+            for i, value in zip(ready_stations, prediction):
+                results[stations[i]] = float(value)
+
+        # 检查点只保存与模型无关的状态：最近观测与通道天数
+        for i, station in enumerate(stations):
+            self._checkpoints[station].append((tag, recent[i], age[i].copy()))
+        return results
+
+    def _rebuild(self, positions):
+        """用当前模型从最近观测重算站点各通道的 (h, c)"""
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(positions):
+            return
+        rows = torch.as_tensor(self._rows(positions), device=self.device)
+        history = self.lanes - 1
+        # 读入 a 天的通道对应最近 a 条观测，从第 history - a 条开始
+        start = history - np.maximum(self._age[positions].reshape(-1), 0)
+        recent = self._recent[positions]
+        scaled = self.scaler_features.transform(recent.reshape(-1, NUM_FEATURES)).reshape(recent.shape)
+        x = torch.tensor(scaled, dtype=torch.float32, device=self.device).repeat_interleave(self.lanes, dim=0)
+
+        shape = (self.model.num_layers, len(rows), self.model.hidden_size)
+        h = torch.zeros(shape, device=self.device)
+        c = torch.zeros(shape, device=self.device)
+        with torch.no_grad():
+            for k in range(history):
+                _, (h_next, c_next) = self.model.step(x[:, k], (h, c))
+                started = torch.as_tensor(start <= k, device=self.device)[None, :, None]
+                h = torch.where(started, h_next, h)
+                c = torch.where(started, c_next, c)
+        self._h[:, rows] = h
+        self._c[:, rows] = c
+
+    def rebind(self, model, scaler_features, scaler_target):
+        """切换到新的模型版本，所有站点的状态用新模型重算，检查点保留"""
+        with self._lock:
+            self.model = model
+            self.scaler_features = scaler_features
+            self.scaler_target = scaler_target
+            shape = (model.num_layers, len(self._index) * self.lanes, model.hidden_size)
+            self._h = torch.zeros(shape, device=self.device)
+            self._c = torch.zeros(shape, device=self.device)
+            self._rebuild(np.arange(len(self._index)))
+
+    def checkpoints(self, station):
+        """站点当前可回滚的检查点标签（从旧到新）"""
+        return [tag for tag, *_ in self._checkpoints.get(station, ())]
+
+    def rollback(self, station, tag):
+        """将站点状态回滚到标签为 tag 的检查点（该次观测之后的状态），并丢弃其后的检查点"""
+        with self._lock:
+            history = self._checkpoints.get(station)
+            if not history:
+                raise KeyError(f"站点 {station} 没有检查点")
+            tags = [t for t, *_ in history]
+            if tag not in tags:
+                raise KeyError(f"站点 {station} 不存在检查点 {tag}")
+            keep = len(tags) - tags[::-1].index(tag)
+            while len(history) > keep:
+                history.pop()
+            _, recent, age = history[-1]
+            position = self._index[station]
+            self._recent[position] = recent
+            self._age[position] = age
+            self._rebuild([position])
+
+    def reset(self, station):
+        """清空站点状态，从头开始累积观测"""
+        with self._lock:
+            position = self._index.get(station)
+            if position is None:
+                return
+            rows = torch.as_tensor(self._rows([position]), device=self.device)
+            self._h[:, rows] = 0
+            self._c[:, rows] = 0
+            self._age[position] = -np.arange(self.lanes)
+            self._recent[position] = 0
+            self._checkpoints[station].clear()
@@ -0,0 +1,284 @@
+"""
+超参数搜索：在进程池中并行训练并回测多组模型配置，输出排行榜
+
+- 搜索空间为 hidden_size / num_layers / dropout / lr / batch_size，支持网格枚举或随机抽样
+- 窗口数据在主进程中只构造、标准化一次，保存为 .npy，各工作进程以只读内存映射共享
+- 每个工作进程绑定到各自的 CPU 核心（sched_setaffinity），PyTorch 线程数与核心数一致
+- 时间上靠后的窗口依次划为验证段与测试段：提前停止与最佳 epoch 只看验证段，
+  选定后在从未参与选择的测试段回测，以米为单位统计 MAE / RMSE / 最大误差并据此排名，
+  同时测量 batch=1 与 batch=256 的推理延迟，准确率与延迟并列写入排行榜
+- 单层 LSTM 不使用层间 dropout，网格中 num_layers=1 的各 dropout 取值合并为一组（dropout=0）
+
+用法：
+    python sweep.py                                   # 默认网格，输出到 ./sweep_results/
+    python sweep.py --mode random --trials 20 --workers 4
+    python sweep.py --hidden-size 32 64 --num-layers 1 2 --dropout 0.2 0.3 --epochs 100
+"""
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import torch
+from torch import nn
+
+from data_utils import DATASET_PATH
+from model_definition import Net
+from model_registry import DEFAULT_MODEL_CONFIG
+from train import prepare_data, set_seed, train_epoch
+
+DEFAULT_OUTPUT_DIR = './sweep_results'
+DEFAULT_SPACE = {
+    "hidden_size": [16, 32, 64],
+    "num_layers": [1, 2],
+    "dropout": [0.2, 0.3],
+    "lr": [1e-3],
+    "batch_size": [16],
+}
+LATENCY_BATCH_SIZES = (1, 256)
+
+# 工作进程内的共享数据，由 _init_worker 设置
+_data = {}
+
+
+def grid_configs(space):
+    """枚举搜索空间的全部组合；单层配置的 dropout 不起作用，统一为 0 并去重"""
+    keys = list(space)
+    configs, seen = [], set()
+    for values in itertools.product(*(space[k] for k in keys)):
+        config = dict(zip(keys, values))
+        if config.get("num_layers") == 1:
+            config["dropout"] = 0.0
+        key = tuple(config.values())
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+
+def random_configs(space, trials, seed):
+    """从搜索空间中不放回地随机抽取 trials 组配置"""
+    configs = grid_configs(space)
+    return random.Random(seed).sample(configs, min(trials, len(configs)))
+
+
+def core_groups(workers):
+    """把当前进程可用的 CPU 核心均分给各工作进程"""
+    if hasattr(os, 'sched_getaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    workers = max(1, min(workers, len(cores)))
+    return [cores[i::workers] for i in range(workers)]
+
+
+def _init_worker(data_dir, core_queue):
+    cores = core_queue.get()
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    torch.set_num_interop_threads(1)
+    for name in ('x_train', 'y_train', 'x_val', 'y_val', 'x_test', 'y_test'):
+        _data[name] = np.load(os.path.join(data_dir, f'{name}.npy'), mmap_mode='r')
+    with open(os.path.join(data_dir, 'target_scaler.json'), encoding='utf-8') as f:
+        _data.update(json.load(f))
+    _data["cores"] = cores
+
+
+def _batches(x, y, batch_size, generator):
+    """按随机顺序从内存映射数组中取 batch（花式索引会拷贝出该 batch，映射本身保持只读）"""
+    order = torch.randperm(len(x), generator=generator).numpy()
+    for start in range(0, len(order), batch_size):
+        index = np.sort(order[start:start + batch_size])
+        yield torch.from_numpy(x[index]), torch.from_numpy(y[index])
+
+
+def _latency_ms(model, x_val, batch_size, repeat=50):
+    """给定 batch 大小下前向的 p50 延迟（毫秒）"""
+    index = np.arange(batch_size) % len(x_val)
+    batch = torch.from_numpy(x_val[index])
+    samples = []
+    with torch.no_grad():
+        for _ in range(5):
+            model(batch)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model(batch)
+            samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def run_trial(trial_id, params, epochs, patience, seed):
+    """在工作进程中训练一组配置：按验证段选择 epoch，在测试段回测，返回排行榜中的一行"""
+    set_seed(seed)
+    x_train, y_train = _data["x_train"], _data["y_train"]
+    x_val = torch.from_numpy(np.ascontiguousarray(_data["x_val"]))
+    y_val = torch.from_numpy(np.ascontiguousarray(_data["y_val"]))
+
+    model = Net(input_size=DEFAULT_MODEL_CONFIG["input_size"], hidden_size=params["hidden_size"],
+                num_layers=params["num_layers"], dropout=params["dropout"])
+    optimizer = torch.optim.Adam(model.parameters(), lr=params["lr"])
+    criterion = nn.MSELoss()
+    generator = torch.Generator().manual_seed(seed)
+
+    start = time.perf_counter()
+    best_val, best_state, best_epoch, stale_epochs, epoch = float('inf'), None, 0, 0, 0
+    for epoch in range(1, epochs + 1):
+        train_epoch(model, _batches(x_train, y_train, params["batch_size"], generator), optimizer, criterion)
+        model.eval()
+        with torch.no_grad():
+            val_loss = criterion(model(x_val), y_val).item()
+        if val_loss < best_val:
+            best_val, best_epoch, stale_epochs = val_loss, epoch, 0
+            best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+        else:
+            stale_epochs += 1
+            if stale_epochs >= patience:
+                break
+    train_seconds = time.perf_counter() - start
+
+    if best_state is None:
+        raise RuntimeError(f"配置 {format_params(params)} 没有得到有限的验证损失")
+    model.load_state_dict(best_state)
+    model.eval()
+    x_test = torch.from_numpy(np.ascontiguousarray(_data["x_test"]))
+    with torch.no_grad():
+        predictions = model(x_test).numpy().reshape(-1)
+    # 还原为米：误差只需乘以目标标准化的 scale
+    errors = (predictions - _data["y_test"].reshape(-1)) * _data["target_scale"]
+
+    row = {
+        "trial": trial_id,
+        **params,
+        "test_mae": float(np.abs(errors).mean()),
+        "test_rmse": float(np.sqrt((errors ** 2).mean())),
+        "test_peak_error": float(np.abs(errors).max()),
+        "val_loss": best_val,
+        "best_epoch": best_epoch,
+        "epochs_run": epoch,
+        "train_seconds": train_seconds,
+        "parameters": sum(p.numel() for p in model.parameters()),
+        "cores": ",".join(map(str, _data["cores"])),
+    }
+    for batch_size in LATENCY_BATCH_SIZES:
+        row[f"latency_b{batch_size}_ms"] = _latency_ms(model, _data["x_val"], batch_size)
+    return row
+
+
+def prepare_shared_data(csv_path, val_ratio, test_ratio, data_dir):
+    """
+    构造一次标准化窗口并写成 .npy，供工作进程以只读内存映射打开
+
+    按时间顺序划分：训练段 | 验证段（val_ratio）| 测试段（test_ratio）；标准化器只用训练段拟合
+    """
+    train_set, holdout_set, _, scaler_target = prepare_data(csv_path, val_ratio + test_ratio)
+    x_holdout, y_holdout = holdout_set.tensors
+    total = len(train_set) + len(holdout_set)
+    test_count = round(total * test_ratio)
+    val_count = len(holdout_set) - test_count
+    if test_count < 1 or val_count < 1:
+        raise ValueError("数据量不足以划分验证段和测试段")
+    splits = {
+        'train': train_set.tensors,
+        'val': (x_holdout[:val_count], y_holdout[:val_count]),
+        'test': (x_holdout[val_count:], y_holdout[val_count:]),
+    }
+    for prefix, (x, y) in splits.items():
+        np.save(os.path.join(data_dir, f'x_{prefix}.npy'), x.numpy())
+        np.save(os.path.join(data_dir, f'y_{prefix}.npy'), y.numpy())
+    with open(os.path.join(data_dir, 'target_scaler.json'), 'w', encoding='utf-8') as f:
+        json.dump({"target_scale": float(scaler_target.scale_[0])}, f)
+    return len(train_set), val_count, test_count
+
+
+def sweep(configs, csv_path=DATASET_PATH, val_ratio=0.1, test_ratio=0.1, workers=None, epochs=200,
+          patience=20, seed=42):
+    """
+    并行运行全部配置
+
+    Returns:
+        按测试段 MAE 升序排列的结果列表
+    """
+    groups = core_groups(workers or os.cpu_count() or 1)
+    context = multiprocessing.get_context('spawn')
+    core_queue = context.Queue()
+    for cores in groups:
+        core_queue.put(cores)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='sweep_') as data_dir:
+        train_count, val_count, test_count = prepare_shared_data(csv_path, val_ratio, test_ratio, data_dir)
+        print(f"[搜索] {len(configs)} 组配置，{len(groups)} 个工作进程，"
+              f"训练窗口 {train_count}，验证窗口 {val_count}，测试窗口 {test_count}")
+        with ProcessPoolExecutor(max_workers=len(groups), mp_context=context,
+                                 initializer=_init_worker, initargs=(data_dir, core_queue)) as pool:
+            futures = {pool.submit(run_trial, i, params, epochs, patience, seed): params
+                       for i, params in enumerate(configs)}
+            for future in as_completed(futures):
+                row = future.result()
+                results.append(row)
+                print(f"[搜索] {len(results)}/{len(configs)}  {format_params(row)}  "
+                      f"测试 MAE {row['test_mae']:.4f}m  {row['train_seconds']:.1f}s")
+    return sorted(results, key=lambda r: r["test_mae"])
+
+
+def format_params(row):
+    return (f"hidden={row['hidden_size']} layers={row['num_layers']} dropout={row['dropout']} "
+            f"lr={row['lr']} batch={row['batch_size']}")
+
+
+def write_leaderboard(results, output_dir, metadata):
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'leaderboard.json'), 'w', encoding='utf-8') as f:
+        json.dump({**metadata, "results": results}, f, ensure_ascii=False, indent=2)
+    if results:
+        with open(os.path.join(output_dir, 'leaderboard.csv'), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="并行超参数搜索")
+    parser.add_argument('--csv', default=DATASET_PATH)
+    parser.add_argument('--mode', default='grid', choices=['grid', 'random'])
+    parser.add_argument('--trials', type=int, default=10, help='random 模式下抽取的配置数')
+    parser.add_argument('--hidden-size', type=int, nargs='+', default=DEFAULT_SPACE["hidden_size"])
+    parser.add_argument('--num-layers', type=int, nargs='+', default=DEFAULT_SPACE["num_layers"])
+    parser.add_argument('--dropout', type=float, nargs='+', default=DEFAULT_SPACE["dropout"])
+    parser.add_argument('--lr', type=float, nargs='+', default=DEFAULT_SPACE["lr"])
+    parser.add_argument('--batch-size', type=int, nargs='+', default=DEFAULT_SPACE["batch_size"])
+    parser.add_argument('--epochs', type=int, default=200)
+    parser.add_argument('--patience', type=int, default=20, help='提前停止的等待 epoch 数')
+    parser.add_argument('--val-ratio', type=float, default=0.1, help='验证段比例（提前停止与选择 epoch）')
+    parser.add_argument('--test-ratio', type=float, default=0.1, help='测试段比例（回测与排名）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='工作进程数（不超过可用核心数）')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help='排行榜输出目录')
+    args = parser.parse_args()
+
+    space = {"hidden_size": args.hidden_size, "num_layers": args.num_layers, "dropout": args.dropout,
+             "lr": args.lr, "batch_size": args.batch_size}
+    configs = grid_configs(space) if args.mode == 'grid' else random_configs(space, args.trials, args.seed)
+
+    start = time.perf_counter()
+    results = sweep(configs, args.csv, args.val_ratio, args.test_ratio, args.workers, args.epochs,
+                    args.patience, args.seed)
+    write_leaderboard(results, args.output, {
+        "space": space, "mode": args.mode, "val_ratio": args.val_ratio, "test_ratio": args.test_ratio, "epochs": args.epochs, "patience": args.patience,
+        "seed": args.seed, "seconds": time.perf_counter() - start,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+
+    print(f"\n{'排名':<4}{'配置':<52}{'测试MAE(米)':>10}{'测试RMSE(米)':>10}{'b1(ms)':>9}{'b256(ms)':>10}{'参数量':>9}")
+    for rank, r in enumerate(results, 1):
+        print(f"{rank:<4}{format_params(r):<52}{r['test_mae']:>10.4f}{r['test_rmse']:>10.4f}"
+              f"{r['latency_b1_ms']:>9.3f}{r['latency_b256_ms']:>10.3f}{r['parameters']:>9}")
+    print(f"排行榜已写入 {args.output}")
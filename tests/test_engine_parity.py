@@ -0,0 +1,107 @@
+"""
+推理引擎一致性测试：在数据集的全部滑动窗口上比较各引擎与 eager 引擎的输出
+
+- torchscript / onnx 只改变执行方式，最大偏差不超过 export_model.py --check 的容差 1e-3 米
+- quantized 为 int8 动态量化，最大偏差不超过 engines.py 的默认容差 0.05 米
+- 未安装 onnxruntime 时跳过 onnx
+
+用法（在仓库根目录）：
+    python -m pytest -q tests
+    python -m unittest discover tests
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+EXPORT_TOLERANCE = 1e-3  # export_model.py --tolerance 的默认值（米）
+QUANTIZED_TOLERANCE = 0.05  # engines.py --tolerance 的默认值（米）
+TOLERANCES = {
+    'eager': 0.0,
+    'torchscript': EXPORT_TOLERANCE,
+    'onnx': EXPORT_TOLERANCE,
+    'quantized': QUANTIZED_TOLERANCE,
+}
+
+
+class EngineParityTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # 各模块的默认路径（./product、./dataset）相对仓库根目录
+        cls._cwd = os.getcwd()
+        os.chdir(ROOT)
+        from data_utils import load_observations, make_windows
+        from export_model import build_scaled_model
+        from engines import EagerEngine
+
+        _, cls.model, cls.scaler_features, cls.scaler_target = build_scaled_model()
+        _, features = load_observations()
+        windows, _ = make_windows(features)
+        cls.windows = np.ascontiguousarray(windows)
+        cls.reference = EagerEngine(cls.model, cls.scaler_features, cls.scaler_target).predict(cls.windows)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls._cwd)
+
+    def _max_error(self, predictions):
+        self.assertEqual(predictions.shape, self.reference.shape)
+        self.assertTrue(np.all(np.isfinite(predictions)))
+        return float(np.max(np.abs(predictions - self.reference)))
+
+    def test_engines_match_eager(self):
+        from engines import ENGINES, create_engine
+
+        self.assertEqual(set(ENGINES), set(TOLERANCES))
+        for name, tolerance in TOLERANCES.items():
+            with self.subTest(engine=name):
+                if name == 'onnx' and importlib.util.find_spec('onnxruntime') is None:
+                    self.skipTest("未安装 onnxruntime")
+                engine = create_engine(name, self.model, self.scaler_features, self.scaler_target)
+                self.assertLessEqual(self._max_error(engine.predict(self.windows)), tolerance)
+
+    def test_engines_single_window(self):
+        # 服务端单条请求走 batch=1，导出时的动态 batch 维度也要正确
+        from engines import create_engine
+
+        for name in ('torchscript', 'quantized'):
+            with self.subTest(engine=name):
+                engine = create_engine(name, self.model, self.scaler_features, self.scaler_target)
+                prediction = engine.predict(self.windows[:1])
+                self.assertEqual(prediction.shape, (1,))
+                self.assertLessEqual(abs(float(prediction[0]) - float(self.reference[0])), TOLERANCES[name])
+
+    def test_check_engines_reports_within_tolerance(self):
+        from engines import check_engines
+
+        names = ['eager', 'torchscript', 'quantized']
+        results = check_engines(names, self.model, self.scaler_features, self.scaler_target,
+                                tolerance=QUANTIZED_TOLERANCE, repeat=1)
+        self.assertEqual([r["engine"] for r in results], names)
+        for r in results:
+            self.assertNotIn("error", r)
+            self.assertTrue(r["within_tolerance"], r)
+
+    def test_exported_model_passes_check(self):
+        import torch
+        from export_model import check_parity, export
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'lstm_scaled.pt')
+            model, scaler_features, scaler_target = export(path)
+            self.assertTrue(check_parity(path, model, scaler_features, scaler_target, EXPORT_TOLERANCE))
+            scripted = torch.jit.load(path)
+            with torch.no_grad():
+                actual = scripted(torch.tensor(self.windows, dtype=torch.float32)).numpy().reshape(-1)
+        self.assertLessEqual(self._max_error(actual), EXPORT_TOLERANCE)
+
+
+if __name__ == '__main__':
+    unittest.main()
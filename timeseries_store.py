@@ -0,0 +1,361 @@
+"""
+按站点存储观测数据的只追加内存映射存储
+
+每个站点一个目录：
+    timestamp.i8   int64 时间戳列（Unix 秒，严格递增，作为索引）
+    features.f8    float64 特征矩阵 (n, 5)，列顺序同 data_utils.FEATURE_COLUMNS
+    meta.json      已写入行数与容量
+
+- 文件按容量预分配，追加时成倍扩容，批量追加只做一次拷贝
+- 时间范围查询在时间戳列上二分查找，O(log n)
+- 查询结果是内存映射上的切片，不拷贝数据；窗口用跨步视图构造，可直接送入预测与回测
+- 多进程（多 worker）共享同一目录：追加在站点目录的 append.lock 上加跨进程排他锁，
+  锁内重新读取 meta.json 再写入；读取时发现 meta.json 被其他进程更新则刷新行数与映射
+"""
+import json
+import os
+import threading
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from data_utils import FEATURE_COLUMNS, TARGET_INDEX, iter_observation_chunks
+from inference import WINDOW_DAYS, NUM_FEATURES
+
+DEFAULT_STORE_DIR = './data/stations'
+INITIAL_CAPACITY = 1024
+DATE_SEPARATORS = ('/', '-', ' ', 'T', ':')
+_SEPARATOR_TABLE = str.maketrans({separator: ',' for separator in DATE_SEPARATORS})
+
+
+def parse_timestamp(date):
+    """
+    将 '2024/4/1 11:00'、'2024-04-01 11:00:30' 或 ISO 格式（'2024-04-01T11:00'）的日期
+    转换为 Unix 秒（按 UTC 解释），秒可省略，时刻可省略
+    """
+    timestamps, valid = parse_timestamps([date])
+    if not valid[0]:
+        raise ValueError(f"无法解析的日期: {date}")
+    return int(timestamps[0])
+
+
+def parse_timestamps(dates):
+    """
+    批量解析日期（格式同 parse_timestamp），返回 (Unix 秒数组, 合法标记数组)
+
+    缺省的时刻 / 秒补 0，整批拼接后统一分隔符（'/'、'-'、' '、'T'、':'），每行恰好拆出
+    年/月/日/时/分/秒 六个整数，再用 datetime64 向量化计算；
+    字段数不对或含非数字的行只标记为不合法，不影响同批其他行
+    """
+    dates = np.asarray(dates, dtype=str).reshape(-1)
+    count = len(dates)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), np.ones(0, dtype=bool)
+    text = np.char.strip(dates)
+    has_clock = (np.char.find(text, ' ') >= 0) | (np.char.find(text, 'T') >= 0)
+    colons = np.char.count(text, ':')
+    suffix = np.where(colons == 0, ':0:0', np.where(colons == 1, ':0', ''))
+    text = np.char.add(text, np.where(has_clock, suffix, ' 0:0:0'))
+    fields = sum(np.char.count(text, separator) for separator in DATE_SEPARATORS) + 1
+    if not (fields == 6).all():
+        # 占位行的月份为 0，解析后判为不合法
+        text = np.where(fields == 6, text, '0,0,0,0,0,0')
+    joined = ','.join(text.tolist()).translate(_SEPARATOR_TABLE)
+    parts = None
+    try:
+        with warnings.catch_warnings():
+            # 旧版 numpy 遇到无法解析的字段只给出警告并返回截断的数组，按长度判断
+            warnings.simplefilter('ignore', DeprecationWarning)
+            parts = np.fromstring(joined, dtype=np.int64, sep=',')
+    except ValueError:
+        pass
+    if parts is None or len(parts) != count * 6:
+        # 批内有非数字字段：只把这些字段记为 -1（该行不合法），其余行照常向量化解析
+        parts = np.array([token if token.isdigit() and len(token) <= 9 else '-1'
+                          for token in joined.split(',')], dtype=np.int64)
+    parts = parts.reshape(count, 6)
+
+    year, month, day, hour, minute, second = parts.T
+    valid = ((parts >= 0).all(axis=1) & (month >= 1) & (month <= 12) & (day >= 1)
+             & (hour < 24) & (minute < 60) & (second < 60) & (year >= 1970) & (year < 10000))
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype('timedelta64[M]')
+    month_start = (np.datetime64('1970-01', 'M') + months).astype('datetime64[D]')
+    month_days = ((month_start.astype('datetime64[M]') + 1).astype('datetime64[D]') - month_start).astype(np.int64)
+    valid &= day <= month_days
+    days = (month_start - np.datetime64('1970-01-01', 'D')).astype(np.int64) + day - 1
+    timestamps = np.where(valid, days * 86400 + hour * 3600 + minute * 60 + second, 0)
+    return timestamps, valid
+
+
+@contextmanager
+def interprocess_lock(path):
+    """基于锁文件的跨进程排他锁（POSIX 用 flock，Windows 用 msvcrt.locking）；同一进程内不可重入"""
+    with open(path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class StationSeries:
+    """单个站点的时间序列"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._meta_path = os.path.join(directory, 'meta.json')
+        self._lock_path = os.path.join(directory, 'append.lock')
+        self._meta_stamp = None
+        self._count, self._capacity = 0, 0
+        self._timestamps = self._features = None
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self, locked=False):
+        """
+        meta.json 变化（其他进程追加）时重新读取行数，容量增大时重新映射
+
+        调用方持有 self._lock；locked=True 表示已持有跨进程锁（锁不可重入，不能再次获取）
+        """
+        try:
+            stat = os.stat(self._meta_path)
+            stamp = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._meta_stamp and self._timestamps is not None:
+            return
+        count, capacity = 0, 0
+        if stamp is not None:
+            with open(self._meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            count, capacity = meta["count"], meta["capacity"]
+        if self._timestamps is None or capacity > self._capacity:
+            # 文件扩容必须与其他进程的追加互斥，避免把别人刚扩大的文件截短
+            capacity = max(capacity, self._capacity, INITIAL_CAPACITY)
+            if locked:
+                self._open(capacity)
+            else:
+                with interprocess_lock(self._lock_path):
+                    self._open(capacity)
+        self._count = count
+        self._meta_stamp = stamp
+
+    def _open(self, capacity):
+        """按容量（行数）打开或扩容内存映射文件；调用方持有跨进程锁"""
+        ts_path = os.path.join(self.directory, 'timestamp.i8')
+        ft_path = os.path.join(self.directory, 'features.f8')
+        for path, row_bytes in ((ts_path, 8), (ft_path, 8 * NUM_FEATURES)):
+            with open(path, 'ab') as f:
+                if f.tell() < capacity * row_bytes:
+                    f.truncate(capacity * row_bytes)
+        self._timestamps = np.memmap(ts_path, dtype=np.int64, mode='r+', shape=(capacity,))
+        self._features = np.memmap(ft_path, dtype=np.float64, mode='r+', shape=(capacity, NUM_FEATURES))
+        self._capacity = capacity
+
+    def _write_meta(self):
+        tmp_path = self._meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"count": self._count, "capacity": self._capacity,
+                       "columns": ["timestamp"] + FEATURE_COLUMNS}, f)
+        os.replace(tmp_path, self._meta_path)
+        stat = os.stat(self._meta_path)
+        self._meta_stamp = (stat.st_ino, stat.st_mtime_ns)
+
+    def _snapshot(self):
+        """刷新后返回 (行数, 时间戳映射, 特征映射)"""
+        with self._lock:
+            self._refresh()
+            return self._count, self._timestamps, self._features
+
+    def __len__(self):
+        return self._snapshot()[0]
+
+    @property
+    def timestamps(self):
+        count, timestamps, _ = self._snapshot()
+        return timestamps[:count]
+
+    @property
+    def features(self):
+        count, _, features = self._snapshot()
+        return features[:count]
+
+    @staticmethod
+    def _rows(timestamps, features):
+        timestamps = np.asarray(timestamps, dtype=np.int64).reshape(-1)
+        features = np.asarray(features, dtype=np.float64).reshape(-1, NUM_FEATURES)
+        if len(timestamps) != len(features):
+            raise ValueError("时间戳与特征行数不一致")
+        return timestamps, features
+
+    def append(self, timestamps, features):
+        """
+        批量追加观测
+
+        timestamps 必须严格递增且晚于已有数据；先写数据再更新行数，中途失败不会暴露半写入的行。
+        整个检查与写入在跨进程锁内完成，多个 worker 同时追加同一站点不会互相覆盖
+        """
+        timestamps, features = self._rows(timestamps, features)
+        if len(timestamps) == 0:
+            return 0
+        if np.any(np.diff(timestamps) <= 0):
+            raise ValueError("时间戳必须严格递增")
+        with self._lock, interprocess_lock(self._lock_path):
+            self._refresh(locked=True)
+            if self._count and timestamps[0] <= self._timestamps[self._count - 1]:
+                raise ValueError("只能追加晚于已有数据的观测")
+            self._write(timestamps, features)
+        return len(timestamps)
+
+    def append_ordered(self, timestamps, features):
+        """
+        只追加晚于已有数据、且晚于本批之前各行的观测，其余行（重复或乱序）跳过
+
+        与 append 一样在锁内读取末行并写入，并发追加时不会按过期的末行判断
+
+        Returns:
+            被追加的行的掩码
+        """
+        timestamps, features = self._rows(timestamps, features)
+        with self._lock, interprocess_lock(self._lock_path):
+            self._refresh(locked=True)
+            last = self._timestamps[self._count - 1] if self._count else np.iinfo(np.int64).min
+            previous_max = np.maximum.accumulate(np.concatenate([[last], timestamps]))[:-1]
+            ordered = timestamps > previous_max
+            if ordered.any():
+                self._write(timestamps[ordered], features[ordered])
+        return ordered
+
+    def _write(self, timestamps, features):
+        """写入已校验的行；调用方持有两把锁"""
+        end = self._count + len(timestamps)
+        if end > self._capacity:
+            self._timestamps.flush()
+            self._features.flush()
+            self._open(max(end, self._capacity * 2))
+        self._timestamps[self._count:end] = timestamps
+        self._features[self._count:end] = features
+        self._timestamps.flush()
+        self._features.flush()
+        self._count = end
+        self._write_meta()
+
+    def locate(self, start=None, end=None):
+        """二分查找 [start, end) 时间范围对应的行号区间"""
+        timestamps = self.timestamps
+        lo = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+        hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side='left'))
+        return lo, hi
+
+    def range(self, start=None, end=None):
+        """返回 [start, end) 内的 (时间戳, 特征) 零拷贝切片"""
+        lo, hi = self.locate(start, end)
+        return self.timestamps[lo:hi], self.features[lo:hi]
+
+    def windows(self, start=None, end=None, window=WINDOW_DAYS):
+        """
+        构造目标日期落在 [start, end) 内的全部滑动窗口（跨步视图，不拷贝）
+
+        Returns:
+            (windows (N, window, 5), targets (N,), target_timestamps (N,))
+        """
+        lo, hi = self.locate(start, end)
+        lo = max(lo, window)
+        if hi <= lo:
+            return (np.empty((0, window, NUM_FEATURES)), np.empty(0), np.empty(0, dtype=np.int64))
+        features = self.features[lo - window:hi]
+        views = sliding_window_view(features, (window, NUM_FEATURES))[:-1, 0]
+        return views, features[window:, TARGET_INDEX], self.timestamps[lo:hi]
+
+    def latest_window(self, end=None, window=WINDOW_DAYS):
+        """时间早于 end 的最后 window 天观测，返回 (时间戳, 特征) 切片；数据不足时返回 None"""
+        _, hi = self.locate(None, end)
+        if hi < window:
+            return None
+        return self.timestamps[hi - window:hi], self.features[hi - window:hi]
+
+    def iter_chunks(self, chunk_rows=100_000, start=None, end=None):
+        """按块产出 (时间戳, 特征) 零拷贝切片，用于流式回测"""
+        lo, hi = self.locate(start, end)
+        for begin in range(lo, hi, chunk_rows):
+            stop = min(begin + chunk_rows, hi)
+            yield self.timestamps[begin:stop], self.features[begin:stop]
+
+
+class TimeSeriesStore:
+    """按站点组织的观测存储"""
+
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = root
+        self._series = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def _check_name(station):
+        if not station or station in ('.', '..') or any(c in station for c in '/\\\0'):
+            raise ValueError(f"非法的站点名称: {station!r}")
+
+    def stations(self):
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, 'meta.json'))
+        )
+
+    def has_station(self, station):
+        """站点是否已有数据（不创建目录，也不列目录）"""
+        if station in self._series:
+            return True
+        self._check_name(station)
+        return os.path.exists(os.path.join(self.root, station, 'meta.json'))
+
+    def series(self, station):
+        """获取站点序列，不存在时创建"""
+        self._check_name(station)
+        with self._lock:
+            series = self._series.get(station)
+            if series is None:
+                series = StationSeries(os.path.join(self.root, station))
+                self._series[station] = series
+            return series
+
+    def append(self, station, timestamps, features):
+        return self.series(station).append(timestamps, features)
+
+    def import_csv(self, station, path, chunk_rows=100_000):
+        """从 dataset 格式的 CSV 批量导入，返回导入行数"""
+        total = 0
+        for dates, features in iter_observation_chunks(path, chunk_rows):
+            timestamps, valid = parse_timestamps(dates)
+            if not valid.all():
+                raise ValueError(f"无法解析的日期: {np.asarray(dates)[~valid][0]}")
+            total += self.append(station, timestamps, features)
+        return total
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="将观测 CSV 导入站点存储")
+    parser.add_argument('station', help='站点名称')
+    parser.add_argument('csv', help='dataset 格式的 CSV 文件')
+    parser.add_argument('--root', default=DEFAULT_STORE_DIR)
+    args = parser.parse_args()
+
+    store = TimeSeriesStore(args.root)
+    count = store.import_csv(args.station, args.csv)
+    print(f"已导入 {count} 行，站点 {args.station} 共 {len(store.series(args.station))} 行")
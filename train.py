@@ -0,0 +1,206 @@
+"""
+CPU 训练入口：从 CSV 训练 LSTM，产出 product 目录中的模型工件
+
+- 一次性构造并标准化全部滑动窗口，保存为张量，由多进程 DataLoader 读取
+- 按时间顺序划分训练 / 验证集，验证损失不再下降时提前停止
+- 每个 epoch 保存检查点，可用 --resume 从中断处继续
+- 权重、两个标准化器与配置一起写入带版本号的目录
+- 每个 epoch 记录耗时与每秒样本数
+
+用法：
+    python train.py                                  # 输出到 ./product/versions/<时间戳>/
+    python train.py --version v2 --epochs 300 --workers 2
+    python train.py --version v2 --resume            # 从 v2 的检查点继续训练
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+import joblib
+import numpy as np
+import torch
+from sklearn.preprocessing import StandardScaler
+from torch import nn
+from torch.utils.data import DataLoader, TensorDataset
+
+from model_definition import Net
+from data_utils import DATASET_PATH, load_observations, make_windows
+from model_registry import DEFAULT_MODEL_CONFIG, PRODUCT_DIR
+from inference import NUM_FEATURES
+from artifact import file_sha256, save_model_artifact, source_digests
+
+VERSIONS_DIR = os.path.join(PRODUCT_DIR, 'versions')
+
+
+def set_seed(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def prepare_data(csv_path, val_ratio):
+    """
+    构造标准化后的窗口张量
+
+    标准化器只在训练段上拟合，避免验证集信息泄漏。
+    Returns:
+        (train_dataset, val_dataset, scaler_features, scaler_target)
+    """
+    _, features = load_observations(csv_path)
+    windows, targets = make_windows(features)
+    split = int(len(windows) * (1 - val_ratio))
+    if split <= 0 or split >= len(windows):
+        raise ValueError("数据量不足以划分训练集和验证集")
+
+    # 训练窗口覆盖的原始行为 [0, split + 窗口长度)
+    train_rows = features[:split + windows.shape[1]]
+    scaler_features = StandardScaler().fit(train_rows)
+    scaler_target = StandardScaler().fit(targets[:split].reshape(-1, 1))
+
+    windows_scaled = scaler_features.transform(windows.reshape(-1, NUM_FEATURES)).reshape(windows.shape)
+    targets_scaled = scaler_target.transform(targets.reshape(-1, 1))
+
+    x = torch.tensor(windows_scaled, dtype=torch.float32)
+    y = torch.tensor(targets_scaled, dtype=torch.float32)
+    return (TensorDataset(x[:split], y[:split]), TensorDataset(x[split:], y[split:]),
+            scaler_features, scaler_target)
+
+
+def evaluate(model, dataset, criterion):
+    model.eval()
+    x, y = dataset.tensors
+    with torch.no_grad():
+        return criterion(model(x), y).item()
+
+
+def train_epoch(model, batches, optimizer, criterion):
+    """训练一个 epoch，batches 产出 (x, y)；返回 (平均损失, 样本数, 耗时秒)"""
+    model.train()
+    epoch_start = time.perf_counter()
+    total_loss, samples = 0.0, 0
+    for x, y in batches:
+        optimizer.zero_grad()
+        loss = criterion(model(x), y)
+        loss.backward()
+        optimizer.step()
+        total_loss += loss.item() * len(x)
+        samples += len(x)
+    return total_loss / max(samples, 1), samples, time.perf_counter() - epoch_start
+
+
+def train(args):
+    set_seed(args.seed)
+    torch.set_num_threads(args.threads)
+    output_dir = os.path.join(VERSIONS_DIR, args.version)
+    checkpoint_path = os.path.join(output_dir, 'checkpoint.pt')
+    if args.resume and not os.path.exists(checkpoint_path):
+        raise FileNotFoundError(f"没有可继续的检查点: {checkpoint_path}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    train_set, val_set, scaler_features, scaler_target = prepare_data(args.csv, args.val_ratio)
+    # 打乱顺序的随机数生成器状态随检查点保存，继续训练时各 epoch 的批次顺序与不中断时一致
+    generator = torch.Generator().manual_seed(args.seed)
+    loader = DataLoader(
+        train_set, batch_size=args.batch_size, shuffle=True,
+        num_workers=args.workers, persistent_workers=args.workers > 0,
+        generator=generator,
+    )
+
+    config = {**DEFAULT_MODEL_CONFIG, "hidden_size": args.hidden_size,
+              "num_layers": args.num_layers, "dropout": args.dropout}
+    model = Net(input_size=config["input_size"], hidden_size=config["hidden_size"],
+                num_layers=config["num_layers"], dropout=config["dropout"])
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
+    criterion = nn.MSELoss()
+
+    start_epoch, best_val, best_state, stale_epochs = 0, float('inf'), None, 0
+    if args.resume:
+        checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        start_epoch = checkpoint["epoch"] + 1
+        best_val, best_state = checkpoint["best_val"], checkpoint["best_state"]
+        stale_epochs = checkpoint["stale_epochs"]
+        torch.set_rng_state(checkpoint["rng_state"])
+        generator.set_state(checkpoint["loader_rng_state"])
+        print(f"[训练] 从第 {start_epoch} 个 epoch 继续，当前最佳验证损失 {best_val:.5f}")
+
+    for epoch in range(start_epoch, args.epochs):
+        train_loss, samples, elapsed = train_epoch(model, loader, optimizer, criterion)
+        val_loss = evaluate(model, val_set, criterion)
+
+        if val_loss < best_val:
+            best_val, stale_epochs = val_loss, 0
+            best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+        else:
+            stale_epochs += 1
+
+        print(f"[训练] epoch {epoch + 1:>4}  train {train_loss:.5f}  val {val_loss:.5f}  "
+              f"{elapsed * 1000:.1f}ms  {samples / elapsed:.0f} 样本/秒")
+
+        torch.save({
+            "model": model.state_dict(),
+            "optimizer": optimizer.state_dict(),
+            "epoch": epoch,
+            "best_val": best_val,
+            "best_state": best_state,
+            "stale_epochs": stale_epochs,
+            "rng_state": torch.get_rng_state(),
+            "loader_rng_state": generator.get_state(),
+        }, checkpoint_path)
+
+        if stale_epochs >= args.patience:
+            print(f"[训练] 验证损失 {args.patience} 个 epoch 未下降，提前停止")
+            break
+
+    if best_state is None:
+        # 没有完成任何 epoch（如 --epochs 不大于已完成的 epoch 数），或验证损失始终为 NaN
+        raise RuntimeError(f"没有可保存的模型：已完成 {start_epoch} 个 epoch，未得到有限的验证损失")
+
+    save_artifact(output_dir, best_state, scaler_features, scaler_target, config, {
+        "version": args.version,
+        "best_val_loss": best_val,
+        "dataset": os.path.basename(args.csv),
+        "dataset_sha256": file_sha256(args.csv),
+        "train_samples": len(train_set),
+        "val_samples": len(val_set),
+        "seed": args.seed,
+        "torch": torch.__version__,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+    os.remove(checkpoint_path)
+    return output_dir
+
+
+def save_artifact(output_dir, state_dict, scaler_features, scaler_target, config, metadata):
+    """写入与 product 目录相同布局的工件，并附带 config.json 与单文件工件 model.lstm"""
+    torch.save(state_dict, os.path.join(output_dir, 'best_lstm_model.pth'))
+    joblib.dump(scaler_features, os.path.join(output_dir, 'scaler_features.pkl'))
+    joblib.dump(scaler_target, os.path.join(output_dir, 'scaler_target.pkl'))
+    # 最后写 model.lstm，记录三文件的 sha256，注册表据此判断两种格式是否一致
+    save_model_artifact(os.path.join(output_dir, 'model.lstm'), state_dict, scaler_features, scaler_target,
+                        config, {**metadata, "sources": source_digests(output_dir)})
+    with open(os.path.join(output_dir, 'config.json'), 'w', encoding='utf-8') as f:
+        json.dump({"model": config, **metadata}, f, ensure_ascii=False, indent=2)
+    print(f"[训练] 工件已写入 {output_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="在 CPU 上训练水位预测 LSTM")
+    parser.add_argument('--csv', default=DATASET_PATH)
+    parser.add_argument('--version', default=time.strftime("%Y%m%d-%H%M%S"), help='工件版本号')
+    parser.add_argument('--epochs', type=int, default=300)
+    parser.add_argument('--patience', type=int, default=30, help='提前停止的等待 epoch 数')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--hidden-size', type=int, default=DEFAULT_MODEL_CONFIG["hidden_size"])
+    parser.add_argument('--num-layers', type=int, default=DEFAULT_MODEL_CONFIG["num_layers"])
+    parser.add_argument('--dropout', type=float, default=DEFAULT_MODEL_CONFIG["dropout"])
+    parser.add_argument('--val-ratio', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=0, help='DataLoader 进程数')
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1, help='PyTorch 计算线程数')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--resume', action='store_true', help='从该版本的检查点继续训练')
+    train(parser.parse_args())
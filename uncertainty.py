@@ -0,0 +1,85 @@
+"""
+MC-dropout 不确定性估计
+
+推理时保持 LSTM 层间 dropout 开启，对同一窗口做 S 次随机前向，得到预测分布。
+S 次采样不循环执行：每个窗口沿 batch 维复制 S 份，一次前向完成，
+dropout 掩码在每一行上独立采样。
+
+- 采样用的模型与服务模型共享同一份权重（assign=True 不拷贝），只有 LSTM 处于训练模式，
+  服务模型保持 eval，并发请求互不影响
+- 返回均值、标准差与指定分位数（米）
+"""
+import numpy as np
+import torch
+
+from model_definition import Net
+from inference import WINDOW_DAYS, NUM_FEATURES
+
+DEFAULT_SAMPLES = 50
+MAX_SAMPLES = 1000
+DEFAULT_QUANTILES = (0.05, 0.5, 0.95)
+# 单次前向的最大行数（窗口数 × 采样数），超过时按窗口分块，每块仍是一次前向
+MAX_ROWS = 65536
+
+
+def mc_dropout_model(model, config):
+    """构造与 model 共享权重、LSTM 层间 dropout 开启的采样模型"""
+    if config["num_layers"] < 2 or config["dropout"] <= 0:
+        raise ValueError("模型没有 LSTM 层间 dropout（需要 num_layers >= 2 且 dropout > 0），无法估计不确定性")
+    sampler = Net(input_size=config["input_size"], hidden_size=config["hidden_size"],
+                  num_layers=config["num_layers"], dropout=config["dropout"])
+    sampler.load_state_dict(model.state_dict(), assign=True)
+    sampler.eval()
+    sampler.lstm.train()
+    return sampler.to(next(model.parameters()).device)
+
+
+def check_request(samples, quantiles):
+    """校验采样数与分位数，不合法时抛出 ValueError"""
+    if not 2 <= samples <= MAX_SAMPLES:
+        raise ValueError(f"采样数必须在 2 到 {MAX_SAMPLES} 之间")
+    if not all(0 <= q <= 1 for q in quantiles):
+        raise ValueError("分位数必须在 0 到 1 之间")
+
+
+def predict_distribution(sampler, scaler_features, scaler_target, features_array,
+                         samples=DEFAULT_SAMPLES, quantiles=DEFAULT_QUANTILES, device='cpu'):
+    """
+    对原始特征 (N, 3, 5) 做 MC-dropout 采样
+
+    Returns:
+        (N, 2 + Q) 数组：各列依次为均值、标准差与各分位数（米）
+    """
+    check_request(samples, quantiles)
+    features_scaled = scaler_features.transform(
+        features_array.reshape(-1, NUM_FEATURES)
+    ).reshape(-1, WINDOW_DAYS, NUM_FEATURES)
+    x = torch.tensor(features_scaled, dtype=torch.float32).to(device)
+
+    chunk = max(1, MAX_ROWS // samples)
+    draws = []
+    with torch.no_grad():
+        for start in range(0, len(x), chunk):
+            part = x[start:start + chunk]
+            # (n, 3, 5) -> (S * n, 3, 5)：第 s 份副本占 [s*n, (s+1)*n) 行
+            out = sampler(part.repeat(samples, 1, 1))
+            draws.append(out.reshape(samples, len(part)))
+    draws = torch.cat(draws, dim=1).cpu().numpy()
+
+    # 目标标准化是线性变换，对采样值逐个反标准化后再统计
+    draws = draws * scaler_target.scale_[0] + scaler_target.mean_[0]
+    return np.column_stack([
+        draws.mean(axis=0),
+        draws.std(axis=0),
+        np.quantile(draws, quantiles, axis=0).T.reshape(len(features_array), -1),
+    ])
+
+
+def format_uncertainty(row, samples, quantiles):
+    """把 predict_distribution 的一行整理为接口返回的字典"""
+    return {
+        "mean": round(float(row[0]), 3),
+        "std": round(float(row[1]), 3),
+        "quantiles": {str(q): round(float(v), 3) for q, v in zip(quantiles, row[2:])},
+        "samples": samples,
+    }